@@ -1,11 +1,15 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 import jwt
 import datetime
 import os
 from functools import wraps
+from password_hasher import PasswordHasher, HasherBusy
+from profile_cache import ProfileCache
+from signing_keys import SigningKeys, ASYMMETRIC_ALGORITHMS
+from otp_store import create_otp_store, RateLimited, VERIFIED, EXPIRED, NOT_FOUND, LOCKED
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 app = Flask(__name__)
 CORS(app)
@@ -15,9 +19,60 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'postgresql://
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['JWT_EXPIRATION_HOURS'] = int(os.getenv('JWT_EXPIRATION_HOURS', 24))
+# EdDSA or ES256 sign with JWT_PRIVATE_KEY_FILE (generated if missing) and
+# publish the public keys at /.well-known/jwks.json; HS256 signs with SECRET_KEY
+app.config['JWT_ALGORITHM'] = os.getenv('JWT_ALGORITHM', 'EdDSA')
+app.config['JWT_PRIVATE_KEY_FILE'] = os.getenv('JWT_PRIVATE_KEY_FILE', os.path.join(app.instance_path, 'jwt_signing_key.pem'))
+# Comma-separated PEM public keys of retired signing keys, still published
+app.config['JWT_PUBLIC_KEY_FILES'] = [p.strip() for p in os.getenv('JWT_PUBLIC_KEY_FILES', '').split(',') if p.strip()]
+# Keep accepting HS256 tokens signed with SECRET_KEY (until they expire
+# after switching to EdDSA/ES256)
+app.config['JWT_ACCEPT_HS256'] = os.getenv('JWT_ACCEPT_HS256', 'True').lower() == 'true'
+# bcrypt cost; stored hashes with another cost are upgraded on login
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+# Hashing processes per gunicorn worker (0 hashes inline in the request)
+app.config['BCRYPT_WORKERS'] = int(os.getenv('BCRYPT_WORKERS', 1))
+# Hashes queued or running per gunicorn worker before requests get a 503
+app.config['BCRYPT_MAX_PENDING'] = int(os.getenv('BCRYPT_MAX_PENDING', 4))
+app.config['BCRYPT_TIMEOUT'] = float(os.getenv('BCRYPT_TIMEOUT', 10))
+# verify-token and /me: 'stateless' answers from the token claims and the
+# profile cache, 'database' reads the users table on every call
+app.config['VERIFY_TOKEN_MODE'] = os.getenv('VERIFY_TOKEN_MODE', 'stateless')
+app.config['USER_PROFILE_CACHE_TTL'] = int(os.getenv('USER_PROFILE_CACHE_TTL', 60))
+app.config['USER_PROFILE_CACHE_MAX_SIZE'] = int(os.getenv('USER_PROFILE_CACHE_MAX_SIZE', 10000))
+app.config['VERIFY_BATCH_MAX_TOKENS'] = int(os.getenv('VERIFY_BATCH_MAX_TOKENS', 100))
+# OTP store: 'database' is shared by all gunicorn workers, 'memory' is
+# per process and only suits a single worker
+app.config['OTP_BACKEND'] = os.getenv('OTP_BACKEND', 'database')
+app.config['OTP_TTL'] = int(os.getenv('OTP_TTL', 300))
+app.config['OTP_MAX_ENTRIES'] = int(os.getenv('OTP_MAX_ENTRIES', 100000))
+# OTP requests allowed per phone per window, and wrong guesses per code
+app.config['OTP_RATE_LIMIT'] = int(os.getenv('OTP_RATE_LIMIT', 5))
+app.config['OTP_RATE_WINDOW'] = int(os.getenv('OTP_RATE_WINDOW', 900))
+app.config['OTP_MAX_ATTEMPTS'] = int(os.getenv('OTP_MAX_ATTEMPTS', 5))
+app.config['OTP_SWEEP_INTERVAL'] = int(os.getenv('OTP_SWEEP_INTERVAL', 30))
 
 db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
+password_hasher = PasswordHasher(
+    rounds=app.config['BCRYPT_LOG_ROUNDS'],
+    workers=app.config['BCRYPT_WORKERS'],
+    max_pending=app.config['BCRYPT_MAX_PENDING'],
+    timeout=app.config['BCRYPT_TIMEOUT']
+)
+profile_cache = ProfileCache(
+    ttl=app.config['USER_PROFILE_CACHE_TTL'],
+    max_size=app.config['USER_PROFILE_CACHE_MAX_SIZE']
+)
+otp_store = create_otp_store(app.config, db)
+signing_keys = None
+if app.config['JWT_ALGORITHM'] in ASYMMETRIC_ALGORITHMS:
+    signing_keys = SigningKeys(
+        app.config['JWT_ALGORITHM'],
+        app.config['JWT_PRIVATE_KEY_FILE'],
+        app.config['JWT_PUBLIC_KEY_FILES']
+    )
+elif app.config['JWT_ALGORITHM'] != 'HS256':
+    raise ValueError(f"Unsupported JWT_ALGORITHM {app.config['JWT_ALGORITHM']!r}")
 
 # User Model
 class User(db.Model):
@@ -39,8 +94,39 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-# OTP Storage (Mock - in production use Redis with TTL)
-otp_storage = {}
+# Profile cache invalidation hook: call after changing a user outside the
+# ORM; ORM updates and deletes of a User call it automatically
+def invalidate_user_profile(user_id):
+    """Drop a user's cached profile in this process"""
+    profile_cache.invalidate(user_id)
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _invalidate_changed_user(mapper, connection, user):
+    invalidate_user_profile(user.id)
+
+def get_user_profiles(user_ids):
+    """
+    Profile dicts by user id for the users that exist. In stateless mode
+    cached profiles are used and the rest are read in one query and cached.
+    """
+    use_cache = app.config['VERIFY_TOKEN_MODE'] == 'stateless'
+    profiles = {}
+    missing = []
+    for user_id in set(user_ids):
+        profile = profile_cache.get(user_id) if use_cache else None
+        if profile is None:
+            missing.append(user_id)
+        else:
+            profiles[user_id] = profile
+    
+    if missing:
+        for user in User.query.filter(User.id.in_(missing)):
+            profile = user.to_dict()
+            profiles[user.id] = profile
+            if use_cache:
+                profile_cache.set(user.id, profile)
+    return profiles
 
 # JWT Token Generation
 def generate_token(user_id, email):
@@ -51,10 +137,51 @@ def generate_token(user_id, email):
         'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=app.config['JWT_EXPIRATION_HOURS']),
         'iat': datetime.datetime.utcnow()
     }
+    if signing_keys is not None:
+        return signing_keys.sign(payload)
     token = jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
     return token
 
-# JWT Token Verification Decorator
+def hasher_busy_response():
+    """503 telling the client to retry once the hashing queue drains"""
+    response = jsonify({'error': 'Service busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def rate_limited_response(error, retry_after):
+    """429 with the seconds until the client may try again"""
+    response = jsonify({'error': error})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+# JWT Token Verification
+def decode_token(token):
+    """Claims of a signed, unexpired token; raises jwt.InvalidTokenError otherwise"""
+    # Remove 'Bearer ' prefix if present
+    if token.startswith('Bearer '):
+        token = token[7:]
+    
+    # The key comes from the kid and the algorithm from the key, never
+    # from the token's own alg header
+    kid = jwt.get_unverified_header(token).get('kid')
+    if kid is not None:
+        entry = signing_keys.verification_key(kid) if signing_keys is not None else None
+        if entry is None:
+            raise jwt.InvalidTokenError('Unknown signing key')
+        key, algorithm = entry
+    elif signing_keys is None or app.config['JWT_ACCEPT_HS256']:
+        key, algorithm = app.config['SECRET_KEY'], 'HS256'
+    else:
+        raise jwt.InvalidTokenError('HS256 tokens are no longer accepted')
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        options={'require': ['user_id', 'email']}
+    )
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -64,11 +191,7 @@ def token_required(f):
             return jsonify({'error': 'Token is missing'}), 401
         
         try:
-            # Remove 'Bearer ' prefix if present
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            data = decode_token(token)
             current_user_id = data['user_id']
             current_user_email = data['email']
         except jwt.ExpiredSignatureError:
@@ -87,6 +210,18 @@ def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'auth-service'}), 200
 
+@app.route('/.well-known/jwks.json', methods=['GET'])
+def jwks():
+    """Public keys that verify this service's tokens, for other services to cache"""
+    response = jsonify(signing_keys.jwks if signing_keys is not None else {'keys': []})
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of this worker"""
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -108,7 +243,7 @@ def register():
             return jsonify({'error': 'User already exists'}), 409
         
         # Hash password
-        password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        password_hash = password_hasher.generate(password)
         
         # Create new user
         new_user = User(
@@ -129,7 +264,10 @@ def register():
             'token': token,
             'user': new_user.to_dict()
         }), 201
-        
+    
+    except HasherBusy:
+        db.session.rollback()
+        return hasher_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -150,9 +288,17 @@ def login():
         # Find user
         user = User.query.filter_by(email=email).first()
         
-        if not user or not bcrypt.check_password_hash(user.password_hash, password):
+        if not user or not password_hasher.check(user.password_hash, password):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # Upgrade the stored hash to the configured cost while we have the password
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = password_hasher.generate(password)
+                db.session.commit()
+            except HasherBusy:
+                pass  # Upgraded on a later login
+        
         # Generate token
         token = generate_token(user.id, user.email)
         
@@ -161,7 +307,9 @@ def login():
             'token': token,
             'user': user.to_dict()
         }), 200
-        
+    
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -179,21 +327,20 @@ def request_otp():
         # Generate mock OTP (in production, use random and send via SMS)
         otp = '123456'
         
-        # Store OTP (in production, use Redis with TTL)
-        otp_storage[phone] = {
-            'otp': otp,
-            'created_at': datetime.datetime.utcnow(),
-            'expires_at': datetime.datetime.utcnow() + datetime.timedelta(minutes=5)
-        }
+        ttl = app.config['OTP_TTL']
+        try:
+            otp_store.put(phone, otp, ttl)
+        except RateLimited as e:
+            return rate_limited_response('Too many OTP requests', e.retry_after)
         
         # In production, send OTP via SMS service
         # For hackathon, return OTP in response (ONLY FOR TESTING)
         return jsonify({
             'message': 'OTP sent successfully',
             'otp': otp,  # Remove this in production!
-            'expires_in': 300  # 5 minutes
+            'expires_in': ttl
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -207,31 +354,24 @@ def verify_otp():
             return jsonify({'error': 'Phone and OTP are required'}), 400
         
         phone = data['phone']
-        otp = data['otp']
+        otp = str(data['otp'])
         
-        # Check if OTP exists
-        if phone not in otp_storage:
+        # A verified, expired or exhausted OTP is removed from the store
+        result = otp_store.verify(phone, otp)
+        if result == NOT_FOUND:
             return jsonify({'error': 'OTP not found or expired'}), 404
-        
-        stored_otp_data = otp_storage[phone]
-        
-        # Check if OTP is expired
-        if datetime.datetime.utcnow() > stored_otp_data['expires_at']:
-            del otp_storage[phone]
+        if result == EXPIRED:
             return jsonify({'error': 'OTP has expired'}), 400
-        
-        # Verify OTP
-        if stored_otp_data['otp'] != otp:
+        if result == LOCKED:
+            return rate_limited_response('Too many invalid attempts, request a new OTP', 1)
+        if result != VERIFIED:
             return jsonify({'error': 'Invalid OTP'}), 400
         
-        # OTP verified, remove from storage
-        del otp_storage[phone]
-        
         return jsonify({
             'message': 'OTP verified successfully',
             'verified': True
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -240,16 +380,16 @@ def verify_otp():
 def verify_token(current_user_id, current_user_email):
     """Verify JWT token and return user info (for other services)"""
     try:
-        user = User.query.get(current_user_id)
+        user = get_user_profiles([current_user_id]).get(current_user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
             'valid': True,
-            'user': user.to_dict()
+            'user': user
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -258,18 +398,57 @@ def verify_token(current_user_id, current_user_email):
 def get_current_user(current_user_id, current_user_email):
     """Get current user info from token"""
     try:
-        user = User.query.get(current_user_id)
+        user = get_user_profiles([current_user_id]).get(current_user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
-            'user': user.to_dict()
+            'user': user
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/auth/verify-tokens', methods=['POST'])
+def verify_tokens():
+    """Verify many JWT tokens in one call (for other services)"""
+    try:
+        data = request.get_json(silent=True)
+        tokens = data.get('tokens') if isinstance(data, dict) else None
+        
+        if not isinstance(tokens, list) or not all(isinstance(t, str) for t in tokens):
+            return jsonify({'error': 'tokens must be a list of strings'}), 400
+        max_tokens = app.config['VERIFY_BATCH_MAX_TOKENS']
+        if len(tokens) > max_tokens:
+            return jsonify({'error': f'At most {max_tokens} tokens per request'}), 400
+        
+        # Decode everything first so profiles are fetched together
+        claims = []
+        for token in tokens:
+            try:
+                claims.append(decode_token(token))
+            except jwt.ExpiredSignatureError:
+                claims.append('Token has expired')
+            except jwt.InvalidTokenError:
+                claims.append('Invalid token')
+        
+        profiles = get_user_profiles([c['user_id'] for c in claims if isinstance(c, dict)])
+        
+        results = []
+        for c in claims:
+            if not isinstance(c, dict):
+                results.append({'valid': False, 'error': c})
+            elif c['user_id'] not in profiles:
+                results.append({'valid': False, 'error': 'User not found'})
+            else:
+                results.append({'valid': True, 'user': profiles[c['user_id']]})
+        
+        return jsonify({'results': results}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Database initialization
 @app.before_first_request
 def create_tables():
@@ -0,0 +1,78 @@
+"""
+Login throughput benchmark
+
+Logs one user in repeatedly from concurrent client threads through the
+Flask test client, with bcrypt inline and with 1..N hashing processes,
+and reports logins/sec overall and per hashing core.
+
+Usage:
+    python bench_login.py [--logins 200] [--concurrency 8] [--rounds 12] [--workers 0,1,2,4]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+import app as auth_app
+from password_hasher import PasswordHasher
+
+def run(logins, concurrency):
+    """Logins/sec for `logins` logins spread over `concurrency` threads"""
+    counts = {'ok': 0, 'busy': 0}
+    lock = threading.Lock()
+    per_thread = max(logins // concurrency, 1)
+
+    def worker():
+        client = auth_app.app.test_client()
+        for _ in range(per_thread):
+            status = client.post('/api/auth/login', json={
+                'email': 'bench@example.com',
+                'password': 'password123'
+            }).status_code
+            with lock:
+                counts['ok' if status == 200 else 'busy'] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return counts['ok'] / elapsed, counts['busy']
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput per hashing core')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', default='0,1,2,4', help='hashing processes to try (0 = inline)')
+    args = parser.parse_args()
+
+    with auth_app.app.app_context():
+        auth_app.db.create_all()
+    auth_app.password_hasher = PasswordHasher(rounds=args.rounds, workers=0)
+    auth_app.app.test_client().post('/api/auth/register', json={
+        'email': 'bench@example.com',
+        'password': 'password123'
+    })
+
+    print(f"bcrypt cost {args.rounds}, {args.concurrency} concurrent clients, {os.cpu_count()} CPUs")
+    print(f"  {'hashing':>10}  {'logins/s':>9}  {'per core':>9}  {'503s':>5}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers, max_pending=args.concurrency)
+        auth_app.password_hasher = hasher
+        try:
+            hasher.check(hasher.generate('warmup'), 'warmup')
+            rate, busy = run(args.logins, args.concurrency)
+        finally:
+            hasher.shutdown()
+        label = f'{workers} procs' if workers else 'inline'
+        print(f"  {label:>10}  {rate:9.1f}  {rate / max(workers, 1):9.1f}  {busy:>5}")
+
+if __name__ == '__main__':
+    main()
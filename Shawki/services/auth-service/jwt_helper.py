@@ -4,6 +4,12 @@ JWT Helper for Other Services
 This file can be copied to other microservices to decode and verify JWT tokens
 without making HTTP calls to the auth service.
 
+Set JWT_JWKS_URL (e.g. http://auth-service:5001/.well-known/jwks.json) to
+verify EdDSA/ES256 tokens with the auth service's public keys. They are
+fetched once at startup and refreshed in a background thread, so checking
+a token never waits on the network. Tokens without a `kid` are checked
+against SECRET_KEY (HS256) unless SECRET_KEY is empty.
+
 Usage in other services:
     from jwt_helper import decode_token, get_user_from_request
     
@@ -14,13 +20,105 @@ Usage in other services:
     user_id, email = get_user_from_request(request)
 """
 
-import jwt
+import json
 import os
+import threading
+import time
+import urllib.request
+import jwt
 from functools import wraps
 from flask import request, jsonify
 
 # IMPORTANT: This SECRET_KEY must match the auth service SECRET_KEY
+# (HS256 tokens only; set it empty to reject them)
 SECRET_KEY = os.getenv('SECRET_KEY', 'hackathon-secret-key-2024')
+JWKS_URL = os.getenv('JWT_JWKS_URL', '')
+JWKS_REFRESH_INTERVAL = float(os.getenv('JWT_JWKS_REFRESH_INTERVAL', 300))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv('JWT_JWKS_MIN_REFRESH_INTERVAL', 30))
+
+def _fetch_json(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+class JWKSClient:
+    """
+    In-memory copy of the auth service's public keys
+    
+    start() fetches the JWKS once, then a daemon thread refetches it every
+    `refresh_interval` seconds. get_key() only reads the in-memory dict; an
+    unknown kid (e.g. a freshly rotated key) wakes the thread for an early
+    refresh, at most once per `min_refresh_interval`.
+    """
+    
+    def __init__(self, url, refresh_interval=300, min_refresh_interval=30, fetch=_fetch_json):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.fetch = fetch
+        self._keys = {}  # kid -> (public key, algorithm)
+        self._last_refresh = 0.0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def refresh(self):
+        """Replace the keys with the current JWKS; returns how many were loaded"""
+        self._last_refresh = time.monotonic()
+        keys = {}
+        for jwk in self.fetch(self.url).get('keys', []):
+            if jwk.get('use', 'sig') != 'sig' or not jwk.get('kid') or not jwk.get('alg'):
+                continue
+            try:
+                keys[jwk['kid']] = (jwt.PyJWK(jwk).key, jwk['alg'])
+            except (jwt.PyJWKError, jwt.InvalidKeyError):
+                continue
+        self._keys = keys
+        return len(keys)
+    
+    def _run(self):
+        failed = not self._keys
+        while True:
+            # Retry a failed fetch sooner than the regular refresh
+            self._wakeup.wait(self.min_refresh_interval if failed else self.refresh_interval)
+            self._wakeup.clear()
+            wait = self._last_refresh + self.min_refresh_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.refresh()
+                failed = False
+            except Exception as e:
+                print(f"JWKS refresh failed: {e}")
+                failed = True
+    
+    def _start_thread(self):
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='jwks-refresh', daemon=True)
+        self._thread.start()
+    
+    def start(self):
+        """Load the keys, then keep them fresh from a background thread"""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"JWKS fetch failed, retrying in the background: {e}")
+        self._start_thread()
+        return self
+    
+    def get_key(self, kid):
+        """(public key, algorithm) for a kid, or None; never blocks on the network"""
+        if self._pid != os.getpid():
+            # A forked worker inherits the keys but not the refresh thread
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start_thread()
+        entry = self._keys.get(kid)
+        if entry is None and time.monotonic() - self._last_refresh >= self.min_refresh_interval:
+            self._wakeup.set()
+        return entry
+
+jwks_client = JWKSClient(JWKS_URL, JWKS_REFRESH_INTERVAL, JWKS_MIN_REFRESH_INTERVAL).start() if JWKS_URL else None
 
 def decode_token(token):
     """
@@ -37,7 +135,20 @@ def decode_token(token):
         if token.startswith('Bearer '):
             token = token[7:]
         
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        # The key comes from the kid and the algorithm from the key, never
+        # from the token's own alg header
+        kid = jwt.get_unverified_header(token).get('kid')
+        if kid is not None:
+            entry = jwks_client.get_key(kid) if jwks_client is not None else None
+            if entry is None:
+                raise jwt.InvalidTokenError(f"Unknown signing key {kid}")
+            key, algorithm = entry
+        elif SECRET_KEY:
+            key, algorithm = SECRET_KEY, 'HS256'
+        else:
+            raise jwt.InvalidTokenError("HS256 tokens are not accepted")
+        
+        payload = jwt.decode(token, key, algorithms=[algorithm])
         return payload.get('user_id'), payload.get('email')
     except jwt.ExpiredSignatureError:
         print("Token has expired")
@@ -0,0 +1,327 @@
+"""
+OTP storage with expiry, a size cap and per-phone rate limiting
+
+Two backends share one interface:
+
+- MemoryOTPStore: per process. Expired entries are swept from a heap
+  ordered by expiry on every call, and past `max_size` the entries
+  closest to expiring are evicted. Only for a single worker.
+- DatabaseOTPStore: rows in the service database, shared by every
+  gunicorn worker. Expired rows are removed with one bulk DELETE at most
+  every `sweep_interval` seconds.
+
+Both allow `rate_limit` OTP requests per phone per `rate_window` seconds
+and `max_attempts` wrong guesses per code.
+"""
+
+import datetime
+import heapq
+import hmac
+import itertools
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from prometheus_client import Counter, Gauge
+
+OTP_STORE_SIZE = Gauge('auth_otp_store_size', 'OTP codes currently stored')
+OTP_EXPIRED = Counter('auth_otp_expired_total', 'OTP codes removed after expiring unverified')
+OTP_EVICTED = Counter('auth_otp_evicted_total', 'OTP codes evicted by the store size cap')
+OTP_RATE_LIMITED = Counter('auth_otp_rate_limited_total', 'OTP requests and verifications refused by rate limits', ['action'])
+
+# verify() results
+VERIFIED = 'verified'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+NOT_FOUND = 'not_found'
+LOCKED = 'locked'  # too many wrong guesses; the code was discarded
+
+class RateLimited(Exception):
+    """Raised when a phone has requested too many OTPs"""
+    
+    def __init__(self, retry_after):
+        super().__init__(f'Too many OTP requests, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+class _ExpiringMap:
+    """
+    Dict whose entries expire, with a min-heap of expiry times so sweeping
+    touches only expired entries. Replaced entries leave stale heap items
+    that are skipped, and compacted once they outnumber live ones.
+    """
+    
+    def __init__(self):
+        self._entries = {}
+        self._heap = []
+        self._seq = itertools.count()
+    
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+    
+    def peek(self, key):
+        """(value, expires_at) even if expired, or None"""
+        entry = self._entries.get(key)
+        return entry and entry[:2]
+    
+    def set(self, key, value, expires_at):
+        seq = next(self._seq)
+        self._entries[key] = (value, expires_at, seq)
+        heapq.heappush(self._heap, (expires_at, seq, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(e[1], e[2], k) for k, e in self._entries.items()]
+            heapq.heapify(self._heap)
+    
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        return entry and entry[0]
+    
+    def _pop_first(self):
+        """Remove the live entry expiring soonest; returns its expiry"""
+        while self._heap:
+            expires_at, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == seq:
+                del self._entries[key]
+                return expires_at
+        return None
+    
+    def sweep(self, now):
+        """Remove expired entries; returns how many"""
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            if self._pop_first() is not None:
+                removed += 1
+        return removed
+    
+    def evict(self, max_size):
+        """Remove the entries closest to expiring until at most max_size remain"""
+        evicted = 0
+        while len(self._entries) > max_size and self._pop_first() is not None:
+            evicted += 1
+        return evicted
+    
+    def __len__(self):
+        return len(self._entries)
+
+class MemoryOTPStore:
+    """In-process OTP store; see the module docstring"""
+    
+    def __init__(self, max_size=100000, rate_limit=5, rate_window=900, max_attempts=5):
+        self.max_size = max_size
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.max_attempts = max_attempts
+        self._codes = _ExpiringMap()     # phone -> [otp, attempts]
+        self._requests = _ExpiringMap()  # phone -> requests in the window ending at expiry
+        self._lock = threading.Lock()
+    
+    def _sweep(self, now):
+        OTP_EXPIRED.inc(self._codes.sweep(now))
+        self._requests.sweep(now)
+    
+    def put(self, phone, otp, ttl):
+        """Store a new code for `phone`, replacing any previous one"""
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            window = self._requests.get(phone, now)
+            if window is None:
+                window = [0, now + self.rate_window]
+                self._requests.set(phone, window, window[1])
+            if window[0] >= self.rate_limit:
+                OTP_RATE_LIMITED.labels(action='request').inc()
+                raise RateLimited(max(1, int(window[1] - now)))
+            window[0] += 1
+            
+            self._codes.set(phone, [otp, 0], now + ttl)
+            OTP_EVICTED.inc(self._codes.evict(self.max_size))
+            self._requests.evict(self.max_size)
+    
+    def verify(self, phone, otp):
+        """Check a code; a correct or exhausted code is removed"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._codes.peek(phone)
+            if entry is not None and entry[1] <= now:
+                # Report it as expired rather than letting the sweep hide it
+                self._codes.pop(phone)
+                OTP_EXPIRED.inc()
+                self._sweep(now)
+                return EXPIRED
+            self._sweep(now)
+            if entry is None:
+                return NOT_FOUND
+            
+            code = entry[0]
+            if hmac.compare_digest(code[0].encode(), otp.encode()):
+                self._codes.pop(phone)
+                return VERIFIED
+            code[1] += 1
+            if code[1] >= self.max_attempts:
+                self._codes.pop(phone)
+                OTP_RATE_LIMITED.labels(action='verify').inc()
+                return LOCKED
+            return INVALID
+    
+    def purge_expired(self):
+        """Remove expired codes and ended rate windows; returns codes removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = self._codes.sweep(now)
+            self._requests.sweep(now)
+        OTP_EXPIRED.inc(expired)
+        return expired
+    
+    def __len__(self):
+        return len(self._codes)
+
+class DatabaseOTPStore:
+    """OTP store in the service database; see the module docstring"""
+    
+    def __init__(self, db, rate_limit=5, rate_window=900, max_attempts=5, sweep_interval=30):
+        self.db = db
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        
+        self.codes = db.Table(
+            'otp_codes',
+            db.Column('phone', db.String(32), primary_key=True),
+            db.Column('otp', db.String(10), nullable=False),
+            db.Column('attempts', db.Integer, nullable=False, default=0),
+            db.Column('expires_at', db.DateTime, nullable=False, index=True)
+        )
+        self.requests = db.Table(
+            'otp_requests',
+            db.Column('phone', db.String(32), primary_key=True),
+            db.Column('count', db.Integer, nullable=False),
+            db.Column('window_ends_at', db.DateTime, nullable=False, index=True)
+        )
+    
+    def _maybe_sweep(self):
+        # One bulk DELETE per sweep_interval per worker, not one per request
+        now = time.monotonic()
+        if now < self._next_sweep or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sweep = now + self.sweep_interval
+            self.purge_expired()
+        finally:
+            self._sweep_lock.release()
+    
+    def put(self, phone, otp, ttl):
+        """Store a new code for `phone`, replacing any previous one"""
+        self._maybe_sweep()
+        try:
+            self._put(phone, otp, ttl)
+        except IntegrityError:
+            # Another worker inserted this phone's window or code first
+            self.db.session.rollback()
+            self._put(phone, otp, ttl)
+    
+    def _put(self, phone, otp, ttl):
+        session = self.db.session
+        now = datetime.datetime.utcnow()
+        
+        # Count the request in the phone's window, opening a new window
+        # when there is none or it has ended
+        counted = session.execute(
+            self.requests.update()
+            .where(self.requests.c.phone == phone, self.requests.c.window_ends_at > now)
+            .values(count=self.requests.c.count + 1)
+        ).rowcount
+        if not counted:
+            session.execute(self.requests.delete().where(self.requests.c.phone == phone))
+            session.execute(self.requests.insert().values(
+                phone=phone, count=1, window_ends_at=now + datetime.timedelta(seconds=self.rate_window)
+            ))
+        count, window_ends_at = session.execute(
+            self.db.select(self.requests.c.count, self.requests.c.window_ends_at)
+            .where(self.requests.c.phone == phone)
+        ).one()
+        if count > self.rate_limit:
+            session.rollback()
+            OTP_RATE_LIMITED.labels(action='request').inc()
+            raise RateLimited(max(1, int((window_ends_at - now).total_seconds())))
+        
+        session.execute(self.codes.delete().where(self.codes.c.phone == phone))
+        session.execute(self.codes.insert().values(
+            phone=phone, otp=otp, attempts=0, expires_at=now + datetime.timedelta(seconds=ttl)
+        ))
+        session.commit()
+    
+    def verify(self, phone, otp):
+        """Check a code; a correct or exhausted code is removed"""
+        self._maybe_sweep()
+        session = self.db.session
+        codes = self.codes
+        row = session.execute(
+            self.db.select(codes.c.otp, codes.c.expires_at).where(codes.c.phone == phone)
+        ).first()
+        if row is None:
+            session.rollback()
+            return NOT_FOUND
+        
+        if row.expires_at <= datetime.datetime.utcnow():
+            session.execute(codes.delete().where(codes.c.phone == phone, codes.c.expires_at == row.expires_at))
+            session.commit()
+            OTP_EXPIRED.inc()
+            return EXPIRED
+        
+        # Each write below re-checks its condition atomically, so concurrent
+        # guesses cannot both use a code or exceed max_attempts; no row lock
+        # is needed (SQLite has no SELECT ... FOR UPDATE)
+        current = (codes.c.phone == phone, codes.c.otp == row.otp, codes.c.attempts < self.max_attempts)
+        if hmac.compare_digest(row.otp.encode(), otp.encode()):
+            used = session.execute(codes.delete().where(*current)).rowcount
+            session.commit()
+            return VERIFIED if used else NOT_FOUND
+        
+        counted = session.execute(
+            codes.update().where(*current).values(attempts=codes.c.attempts + 1)
+        ).rowcount
+        locked = session.execute(
+            codes.delete().where(codes.c.phone == phone, codes.c.attempts >= self.max_attempts)
+        ).rowcount
+        session.commit()
+        if locked:
+            OTP_RATE_LIMITED.labels(action='verify').inc()
+            return LOCKED
+        return INVALID if counted else NOT_FOUND
+    
+    def purge_expired(self):
+        """Bulk-delete expired codes and ended rate windows; returns codes removed"""
+        session = self.db.session
+        now = datetime.datetime.utcnow()
+        expired = session.execute(self.codes.delete().where(self.codes.c.expires_at <= now)).rowcount
+        session.execute(self.requests.delete().where(self.requests.c.window_ends_at <= now))
+        session.commit()
+        OTP_EXPIRED.inc(expired)
+        return expired
+    
+    def __len__(self):
+        count = self.db.session.execute(self.db.select(self.db.func.count()).select_from(self.codes)).scalar()
+        self.db.session.rollback()
+        return count
+
+def create_otp_store(config, db):
+    """OTP store for the configured OTP_BACKEND (memory or database)"""
+    options = {
+        'rate_limit': config['OTP_RATE_LIMIT'],
+        'rate_window': config['OTP_RATE_WINDOW'],
+        'max_attempts': config['OTP_MAX_ATTEMPTS']
+    }
+    if config['OTP_BACKEND'] == 'memory':
+        store = MemoryOTPStore(max_size=config['OTP_MAX_ENTRIES'], **options)
+    elif config['OTP_BACKEND'] == 'database':
+        store = DatabaseOTPStore(db, sweep_interval=config['OTP_SWEEP_INTERVAL'], **options)
+    else:
+        raise ValueError(f"Unknown OTP_BACKEND {config['OTP_BACKEND']!r}")
+    # Read at scrape time; for the database backend this is a COUNT(*)
+    OTP_STORE_SIZE.set_function(lambda: len(store))
+    return store
@@ -0,0 +1,97 @@
+"""
+Bcrypt hashing off the request path
+
+bcrypt costs hundreds of ms of CPU per hash. PasswordHasher runs it in a
+small process pool so a login burst cannot pin the web workers, and
+admits at most `max_pending` hashes per web worker: past that it raises
+HasherBusy at once, which the routes turn into a 503.
+
+Hashes are the same as Flask-Bcrypt's, so existing users keep working.
+"""
+
+import multiprocessing
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import flask_bcrypt
+
+_COST = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash took too long"""
+
+def _generate(password, rounds):
+    return flask_bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+
+def _check(password_hash, password):
+    return flask_bcrypt.check_password_hash(password_hash, password)
+
+def hash_cost(password_hash):
+    """Cost factor (log rounds) of a bcrypt hash, or None if it isn't one"""
+    match = _COST.match(password_hash or '')
+    return int(match.group(1)) if match else None
+
+class PasswordHasher:
+    """
+    Hash and check passwords in `workers` processes (0 runs bcrypt inline,
+    e.g. for tests). Callers wait up to `timeout` seconds for a result.
+    """
+    
+    def __init__(self, rounds=12, workers=1, max_pending=None, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending if max_pending is not None else workers * 4
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(self.max_pending, 1))
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def _pool(self):
+        # Created on first use, after gunicorn has forked this worker;
+        # spawn so the pool never inherits the worker's threads or locks
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+    
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password hashes in progress')
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot frees when the hash finishes, even if the caller gave up
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HasherBusy('Password hashing timed out')
+    
+    def generate(self, password, rounds=None):
+        """bcrypt hash of `password` at `rounds` (default: the configured cost)"""
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(_generate, password, rounds or self.rounds)
+    
+    def check(self, password_hash, password):
+        """Whether `password` matches `password_hash`"""
+        return self._run(_check, password_hash, password)
+    
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with a different cost than configured"""
+        cost = hash_cost(password_hash)
+        return cost is not None and cost != self.rounds
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
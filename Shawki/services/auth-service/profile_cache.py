@@ -0,0 +1,56 @@
+"""
+In-memory user profile cache
+
+Lets verify-token and /me answer from the token's signed claims plus a
+cached profile instead of reading the users table on every call. Entries
+live for `ttl` seconds; invalidate() drops one at once (app.py calls it
+when a User row changes). The cache is per process, so other gunicorn
+workers see a change once their entry expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class ProfileCache:
+    """Thread-safe LRU of user profile dicts with per-entry expiry"""
+    
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id):
+        """Cached profile, or None if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            profile, expires_at = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return profile
+    
+    def set(self, user_id, profile):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (profile, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
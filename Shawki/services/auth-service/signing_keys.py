@@ -0,0 +1,114 @@
+"""
+JWT signing keys and the JWKS document
+
+With an asymmetric JWT_ALGORITHM (EdDSA or ES256) access tokens are
+signed with a private key and carry its `kid` header. Other services
+verify them with the public keys served at /.well-known/jwks.json, so no
+secret is shared and a new key needs no redeploy of the verifiers. The
+kid is the key's RFC 7638 thumbprint.
+
+The private key is a PEM file. If the file does not exist it is
+generated once; gunicorn workers starting later read the same file, so
+every worker signs with one key. Retired public keys stay published
+until the tokens they signed have expired.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+
+ASYMMETRIC_ALGORITHMS = ('EdDSA', 'ES256')
+
+def _generate_private_key(algorithm):
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    return ec.generate_private_key(ec.SECP256R1())
+
+def _create_private_key_file(path, algorithm):
+    """Write a new key to `path` unless another worker got there first"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    pem = _generate_private_key(algorithm).private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    # mkstemp files are 0600; link() publishes the key atomically
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        os.link(tmp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp_path)
+
+def key_algorithm(key):
+    """JWS algorithm for an Ed25519 or P-256 key (private or public)"""
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return 'EdDSA'
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and isinstance(key.curve, ec.SECP256R1):
+        return 'ES256'
+    raise ValueError(f'Unsupported signing key type {type(key).__name__}; use Ed25519 or P-256')
+
+def public_jwk(public_key):
+    """JWK dict for a public key, with its thumbprint as `kid`"""
+    algorithm = key_algorithm(public_key)
+    if algorithm == 'EdDSA':
+        jwk = OKPAlgorithm.to_jwk(public_key, as_dict=True)
+        members = {name: jwk[name] for name in ('crv', 'kty', 'x')}
+    else:
+        jwk = ECAlgorithm.to_jwk(public_key, as_dict=True)
+        members = {name: jwk[name] for name in ('crv', 'kty', 'x', 'y')}
+    digest = hashlib.sha256(json.dumps(members, sort_keys=True, separators=(',', ':')).encode()).digest()
+    return dict(
+        members,
+        kid=base64.urlsafe_b64encode(digest).rstrip(b'=').decode(),
+        alg=algorithm,
+        use='sig'
+    )
+
+class SigningKeys:
+    """
+    The current private key plus every public key still accepted. Tokens
+    are signed with the current key; verification picks the key by kid.
+    """
+    
+    def __init__(self, algorithm, private_key_file, public_key_files=()):
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f'JWT_ALGORITHM must be one of {", ".join(ASYMMETRIC_ALGORITHMS)} to sign with keys')
+        if not os.path.exists(private_key_file):
+            _create_private_key_file(private_key_file, algorithm)
+        with open(private_key_file, 'rb') as f:
+            self.private_key = serialization.load_pem_private_key(f.read(), password=None)
+        if key_algorithm(self.private_key) != algorithm:
+            raise ValueError(f'{private_key_file} is not a {algorithm} key')
+        self.algorithm = algorithm
+        
+        public_keys = [self.private_key.public_key()]
+        for path in public_key_files:
+            with open(path, 'rb') as f:
+                public_keys.append(serialization.load_pem_public_key(f.read()))
+        
+        self.jwks = {'keys': []}
+        self._keys = {}  # kid -> (public key, algorithm)
+        for public_key in public_keys:
+            jwk = public_jwk(public_key)
+            if jwk['kid'] not in self._keys:
+                self.jwks['keys'].append(jwk)
+                self._keys[jwk['kid']] = (public_key, jwk['alg'])
+        self.kid = self.jwks['keys'][0]['kid']
+    
+    def sign(self, payload):
+        return jwt.encode(payload, self.private_key, algorithm=self.algorithm, headers={'kid': self.kid})
+    
+    def verification_key(self, kid):
+        """(public key, algorithm) for a kid, or None if it isn't published"""
+        return self._keys.get(kid)
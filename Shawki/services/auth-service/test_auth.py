@@ -1,6 +1,14 @@
 import pytest
 import json
+import datetime
+import jwt
+import app as auth_app
 from app import app, db, User
+from password_hasher import PasswordHasher, HasherBusy, hash_cost
+from signing_keys import SigningKeys
+from cryptography.hazmat.primitives import serialization
+import jwt_helper
+from otp_store import MemoryOTPStore, RateLimited, VERIFIED, INVALID, EXPIRED, NOT_FOUND, LOCKED
 
 @pytest.fixture
 def client():
@@ -14,6 +22,8 @@ def client():
         yield client
         with app.app_context():
             db.drop_all()
+        # Ids are reused by the next test's fresh database
+        auth_app.profile_cache.clear()
 
 def test_health_check(client):
     """Test health check endpoint"""
@@ -134,6 +144,101 @@ def test_otp_verify_invalid(client):
     
     assert response.status_code == 400
 
+def test_otp_request_rate_limited(client):
+    """Test OTP requests past the per-phone limit get a 429"""
+    limit = app.config['OTP_RATE_LIMIT']
+    for _ in range(limit):
+        response = client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+        assert response.status_code == 200
+    
+    response = client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    
+    # Other phones are unaffected
+    response = client.post('/api/auth/otp/request', json={'phone': '01812345678'})
+    assert response.status_code == 200
+
+def test_otp_verify_attempts_exhausted(client):
+    """Test an OTP is discarded after too many wrong guesses"""
+    client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+    
+    for _ in range(app.config['OTP_MAX_ATTEMPTS'] - 1):
+        response = client.post('/api/auth/otp/verify', json={'phone': '01712345678', 'otp': '000000'})
+        assert response.status_code == 400
+    response = client.post('/api/auth/otp/verify', json={'phone': '01712345678', 'otp': '000000'})
+    assert response.status_code == 429
+    
+    response = client.post('/api/auth/otp/verify', json={'phone': '01712345678', 'otp': '123456'})
+    assert response.status_code == 404
+
+def test_otp_verify_non_ascii(client):
+    """Test a non-ASCII OTP is rejected as invalid, not a server error"""
+    client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+    response = client.post('/api/auth/otp/verify', json={'phone': '01712345678', 'otp': '१२३४५६'})
+    assert response.status_code == 400
+
+def test_database_otp_verify_rechecks_attempts(client):
+    """Test a code another worker exhausted cannot be used after it was read"""
+    client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+    store = auth_app.otp_store
+    with app.app_context():
+        # Another worker counted the last allowed guess but has not deleted the code yet
+        db.session.execute(store.codes.update().values(attempts=store.max_attempts))
+        db.session.commit()
+        assert store.verify('01712345678', '123456') == NOT_FOUND
+        assert store.verify('01712345678', '000000') == LOCKED
+        assert len(store) == 0
+
+def test_otp_expired(client, monkeypatch):
+    """Test expired OTPs are rejected and bulk-purged"""
+    monkeypatch.setitem(app.config, 'OTP_TTL', 0)
+    client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+    response = client.post('/api/auth/otp/verify', json={'phone': '01712345678', 'otp': '123456'})
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'OTP has expired'
+    
+    client.post('/api/auth/otp/request', json={'phone': '01812345678'})
+    client.post('/api/auth/otp/request', json={'phone': '01912345678'})
+    with app.app_context():
+        assert len(auth_app.otp_store) == 2
+        assert auth_app.otp_store.purge_expired() == 2
+        assert len(auth_app.otp_store) == 0
+
+def test_memory_otp_store():
+    """Test the in-process store's expiry sweep, size cap and limits"""
+    store = MemoryOTPStore(max_size=2, rate_limit=2, rate_window=60, max_attempts=2)
+    store.put('a', '111111', 0)
+    assert store.verify('a', '111111') == EXPIRED
+    
+    store.put('b', '222222', 0)
+    assert store.purge_expired() == 1
+    assert len(store) == 0
+    
+    # Past max_size the code closest to expiring is evicted
+    store.put('c', '333333', 10)
+    store.put('d', '444444', 30)
+    store.put('e', '555555', 20)
+    assert len(store) == 2
+    assert store.verify('c', '333333') == NOT_FOUND
+    assert store.verify('d', '444444') == VERIFIED
+    
+    assert store.verify('e', '٠٠٠٠٠٠') == INVALID
+    assert store.verify('e', '000000') == LOCKED
+    assert store.verify('e', '555555') == NOT_FOUND
+    
+    store.put('f', '666666', 10)
+    store.put('f', '666666', 10)
+    with pytest.raises(RateLimited):
+        store.put('f', '666666', 10)
+
+def test_metrics(client):
+    """Test the Prometheus endpoint reports the OTP store"""
+    client.post('/api/auth/otp/request', json={'phone': '01712345678'})
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert b'auth_otp_store_size 1.0' in response.data
+
 def test_verify_token(client):
     """Test token verification"""
     # Register and get token
@@ -179,5 +284,222 @@ def test_missing_token(client):
     response = client.get('/api/auth/me')
     assert response.status_code == 401
 
+def test_password_hasher_process_pool():
+    """Test hashing and checking in worker processes"""
+    hasher = PasswordHasher(rounds=4, workers=1)
+    try:
+        password_hash = hasher.generate('password123')
+        assert hash_cost(password_hash) == 4
+        assert hasher.check(password_hash, 'password123')
+        assert not hasher.check(password_hash, 'wrong')
+    finally:
+        hasher.shutdown()
+
+def test_password_hasher_rejects_when_saturated():
+    """Test a full hashing queue fails fast instead of waiting"""
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=1)
+    hasher._slots.acquire()
+    try:
+        with pytest.raises(HasherBusy):
+            hasher.generate('password123')
+    finally:
+        hasher._slots.release()
+        hasher.shutdown()
+
+def test_login_returns_503_when_hasher_busy(client, monkeypatch):
+    """Test login is rejected with 503 while hashing is saturated"""
+    client.post('/api/auth/register', 
+        json={
+            'email': 'test@example.com',
+            'password': 'password123'
+        })
+    
+    def busy(*args):
+        raise HasherBusy('Too many password hashes in progress')
+    monkeypatch.setattr(auth_app.password_hasher, 'check', busy)
+    
+    response = client.post('/api/auth/login', 
+        json={
+            'email': 'test@example.com',
+            'password': 'password123'
+        })
+    
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_login_rehashes_on_cost_change(client, monkeypatch):
+    """Test a login upgrades a hash made with an old cost factor"""
+    monkeypatch.setattr(auth_app.password_hasher, 'rounds', 4)
+    client.post('/api/auth/register', 
+        json={
+            'email': 'test@example.com',
+            'password': 'password123'
+        })
+    
+    monkeypatch.setattr(auth_app.password_hasher, 'rounds', 5)
+    response = client.post('/api/auth/login', 
+        json={
+            'email': 'test@example.com',
+            'password': 'password123'
+        })
+    
+    assert response.status_code == 200
+    with app.app_context():
+        user = User.query.filter_by(email='test@example.com').first()
+        assert hash_cost(user.password_hash) == 5
+    
+    # The upgraded hash still logs in
+    response = client.post('/api/auth/login', 
+        json={
+            'email': 'test@example.com',
+            'password': 'password123'
+        })
+    assert response.status_code == 200
+
+def register_token(client, email='test@example.com', name=''):
+    response = client.post('/api/auth/register', 
+        json={
+            'email': email,
+            'password': 'password123',
+            'name': name
+        })
+    return json.loads(response.data)['token']
+
+def test_verify_token_stateless_uses_profile_cache(client):
+    """Test verify-token answers from the cache until the profile is invalidated"""
+    token = register_token(client, name='Cached User')
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/verify-token', headers=headers).status_code == 200
+    
+    # Removed behind the ORM's back: the cached profile still answers
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM users'))
+        db.session.commit()
+    response = client.get('/api/auth/verify-token', headers=headers)
+    assert response.status_code == 200
+    assert json.loads(response.data)['user']['name'] == 'Cached User'
+    
+    auth_app.invalidate_user_profile(json.loads(response.data)['user']['id'])
+    assert client.get('/api/auth/verify-token', headers=headers).status_code == 404
+
+def test_profile_cache_invalidated_on_update(client):
+    """Test ORM updates of a user drop the cached profile"""
+    token = register_token(client, name='Old Name')
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/api/auth/me', headers=headers)
+    
+    with app.app_context():
+        user = User.query.filter_by(email='test@example.com').first()
+        user.name = 'New Name'
+        db.session.commit()
+    
+    response = client.get('/api/auth/me', headers=headers)
+    assert json.loads(response.data)['user']['name'] == 'New Name'
+
+def test_verify_token_database_mode(client, monkeypatch):
+    """Test database mode reads the user on every call"""
+    monkeypatch.setitem(app.config, 'VERIFY_TOKEN_MODE', 'database')
+    token = register_token(client)
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/auth/verify-token', headers=headers).status_code == 200
+    
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM users'))
+        db.session.commit()
+    assert client.get('/api/auth/verify-token', headers=headers).status_code == 404
+
+def test_verify_tokens_batch(client):
+    """Test verifying several tokens in one call"""
+    first = register_token(client, 'first@example.com')
+    second = register_token(client, 'second@example.com')
+    expired = jwt.encode({
+        'user_id': 1,
+        'email': 'first@example.com',
+        'exp': datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+    }, app.config['SECRET_KEY'], algorithm='HS256')
+    
+    response = client.post('/api/auth/verify-tokens',
+        json={'tokens': [first, 'not-a-token', second, expired]})
+    
+    assert response.status_code == 200
+    results = json.loads(response.data)['results']
+    assert [r['valid'] for r in results] == [True, False, True, False]
+    assert results[0]['user']['email'] == 'first@example.com'
+    assert results[2]['user']['email'] == 'second@example.com'
+    assert results[1]['error'] == 'Invalid token'
+    assert results[3]['error'] == 'Token has expired'
+
+def test_verify_tokens_batch_limits(client):
+    """Test the batch endpoint validates its input"""
+    assert client.post('/api/auth/verify-tokens', json={'tokens': 'x'}).status_code == 400
+    too_many = ['x'] * (app.config['VERIFY_BATCH_MAX_TOKENS'] + 1)
+    assert client.post('/api/auth/verify-tokens', json={'tokens': too_many}).status_code == 400
+
+def test_tokens_verify_with_jwks(client):
+    """Test tokens carry a kid that resolves to a key in the JWKS document"""
+    token = register_token(client)
+    header = jwt.get_unverified_header(token)
+    assert header['alg'] == 'EdDSA'
+    
+    response = client.get('/.well-known/jwks.json')
+    assert response.status_code == 200
+    assert 'max-age' in response.headers['Cache-Control']
+    jwk = next(k for k in json.loads(response.data)['keys'] if k['kid'] == header['kid'])
+    assert 'd' not in jwk
+    
+    payload = jwt.decode(token, jwt.PyJWK(jwk).key, algorithms=[jwk['alg']])
+    assert payload['email'] == 'test@example.com'
+
+def test_signing_key_rotation(tmp_path):
+    """Test retired public keys stay published and verify their tokens"""
+    old = SigningKeys('EdDSA', str(tmp_path / 'old.pem'))
+    old_token = old.sign({'user_id': 1, 'email': 'test@example.com'})
+    public_pem = tmp_path / 'old.pub.pem'
+    public_pem.write_bytes(old.private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+    
+    new = SigningKeys('ES256', str(tmp_path / 'new.pem'), [str(public_pem)])
+    assert [k['alg'] for k in new.jwks['keys']] == ['ES256', 'EdDSA']
+    assert jwt.get_unverified_header(new.sign({'user_id': 1}))['kid'] == new.kid
+    
+    key, algorithm = new.verification_key(old.kid)
+    assert jwt.decode(old_token, key, algorithms=[algorithm])['user_id'] == 1
+    # Reloading the same file keeps the same key
+    assert SigningKeys('ES256', str(tmp_path / 'new.pem')).kid == new.kid
+
+def test_hs256_and_unknown_kid_tokens(client, monkeypatch):
+    """Test shared-secret tokens until they are switched off, and unknown kids"""
+    token = register_token(client)
+    claims = jwt.decode(token, options={'verify_signature': False})
+    legacy = jwt.encode(claims, app.config['SECRET_KEY'], algorithm='HS256')
+    forged = jwt.encode(claims, app.config['SECRET_KEY'], algorithm='HS256', headers={'kid': 'other'})
+    
+    assert client.get('/api/auth/verify-token', headers={'Authorization': f'Bearer {legacy}'}).status_code == 200
+    assert client.get('/api/auth/verify-token', headers={'Authorization': f'Bearer {forged}'}).status_code == 401
+    monkeypatch.setitem(app.config, 'JWT_ACCEPT_HS256', False)
+    assert client.get('/api/auth/verify-token', headers={'Authorization': f'Bearer {legacy}'}).status_code == 401
+
+def test_jwt_helper_verifies_with_jwks(client, monkeypatch):
+    """Test the copyable helper verifies locally from its cached JWKS"""
+    fetches = []
+    def fetch(url):
+        fetches.append(url)
+        return json.loads(client.get(url).data)
+    
+    monkeypatch.setattr(jwt_helper, 'jwks_client', jwt_helper.JWKSClient('/.well-known/jwks.json', fetch=fetch).start())
+    assert len(fetches) == 1
+    
+    token = register_token(client)
+    user_id, email = jwt_helper.decode_token(f'Bearer {token}')
+    assert email == 'test@example.com'
+    
+    claims = jwt.decode(token, options={'verify_signature': False})
+    unknown = jwt.encode(claims, app.config['SECRET_KEY'], algorithm='HS256', headers={'kid': 'other'})
+    assert jwt_helper.decode_token(unknown) == (None, None)
+    # Neither lookup waited on a fetch
+    assert len(fetches) == 1
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -14,9 +14,37 @@ def create_app(config_class=None):
         config_class = get_config()
     app.config.from_object(config_class)
     
+    # Pool state/checkout metrics need a QueuePool; in-memory SQLite
+    # keeps its single shared connection
+    if app.config.get('DB_METRICS_ENABLED') and not uses_memory_sqlite(app):
+        from app.services.db_metrics_service import instrumented_engine_options
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = instrumented_engine_options(
+            app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        )
+    
     # Initialize extensions
     db.init_app(app)
     
+    # Statement latency, connection age and the slow-query log
+    if app.config.get('DB_METRICS_ENABLED'):
+        from app.services.db_metrics_service import instrument_engine
+        with app.app_context():
+            instrument_engine(db.engine, 'sync', app.config['DB_SLOW_QUERY_MS'])
+    
+    # Request count/latency for every route, recorded from request hooks
+    from app.services.metrics_service import init_request_metrics, MetricsExporter
+    init_request_metrics(app)
+    app.metrics_exporter = MetricsExporter(ttl=app.config['METRICS_CACHE_TTL'])
+    
+    # Sampled per-request profiles; not hooked at all unless enabled
+    if app.config.get('PROFILING_ENABLED'):
+        from app.services.profiling_service import SamplingProfiler, init_profiling
+        app.profiler = SamplingProfiler(
+            app.config['PROFILING_DIR'],
+            interval=app.config['PROFILING_INTERVAL_MS'] / 1000
+        )
+        init_profiling(app, app.profiler)
+    
     # Register blueprints
     from app.routes.payment_routes import payment_bp
     from app.routes.health_routes import health_bp
@@ -30,9 +58,100 @@ def create_app(config_class=None):
     with app.app_context():
         db.create_all()
     
-    # Initialize RabbitMQ if enabled
-    if app.config.get('RABBITMQ_ENABLED'):
+    # Initialize verified-token cache if enabled
+    if app.config.get('JWT_CACHE_ENABLED'):
+        from app.services.jwt_service import TokenCache
+        app.jwt_cache = TokenCache(
+            max_size=app.config['JWT_CACHE_MAX_SIZE'],
+            max_ttl=app.config['JWT_CACHE_MAX_TTL']
+        )
+    
+    # Auth service public keys for EdDSA/ES256 tokens, kept in memory
+    # and refreshed in the background
+    if app.config.get('JWT_JWKS_URL'):
+        from app.services.jwks_service import JWKSClient
+        app.jwks_client = JWKSClient(
+            app.config['JWT_JWKS_URL'],
+            refresh_interval=app.config['JWT_JWKS_REFRESH_INTERVAL'],
+            min_refresh_interval=app.config['JWT_JWKS_MIN_REFRESH_INTERVAL'],
+            timeout=app.config['JWT_JWKS_TIMEOUT']
+        ).start()
+    
+    # Initialize in-process user identity map if enabled
+    if app.config.get('USER_CACHE_ENABLED'):
+        from app.services.jwt_service import IdentityMap
+        app.user_identities = IdentityMap(max_size=app.config['USER_CACHE_MAX_SIZE'])
+    
+    # Initialize payment read-through cache if enabled
+    if app.config.get('PAYMENT_CACHE_ENABLED'):
+        from app.services.cache_service import create_payment_cache
+        app.payment_cache = create_payment_cache(app.config)
+    
+    # Initialize in-process pub/sub for long-poll and SSE waiters
+    if app.config.get('PAYMENT_EVENTS_ENABLED'):
+        from app.services.pubsub_service import PaymentNotifier
+        app.payment_notifier = PaymentNotifier(
+            max_waiters=app.config['PAYMENT_EVENTS_MAX_WAITERS'],
+            max_thread_waiters=app.config['PAYMENT_EVENTS_MAX_THREAD_WAITERS'],
+            recheck_interval=app.config['PAYMENT_EVENTS_RECHECK_INTERVAL']
+        )
+    
+    # Initialize Idempotency-Key store if enabled
+    if app.config.get('IDEMPOTENCY_ENABLED'):
+        from app.services.idempotency_service import create_idempotency_store
+        app.idempotency_store = create_idempotency_store(app.config)
+    
+    # Initialize RabbitMQ if this process publishes events itself
+    if publishes_events(app.config):
         from app.services.rabbitmq_service import RabbitMQService
         app.rabbitmq = RabbitMQService(app.config)
+        
+        # Relay outbox events from a background thread in this process
+        if app.config.get('OUTBOX_ENABLED') and app.config.get('OUTBOX_RELAY_IN_PROCESS'):
+            app.outbox_relay = create_outbox_relay(app)
+            # In-memory SQLite shares one connection across threads, so
+            # relay inline on wake() there instead of from a thread
+            if not uses_memory_sqlite(app):
+                app.outbox_relay.start()
     
     return app
+
+
+def publishes_events(config):
+    """
+    Whether this process needs a RabbitMQ publisher. With the outbox
+    relayed out of process, web workers only write outbox rows and
+    relay.py owns the broker connection.
+    """
+    if not config.get('RABBITMQ_ENABLED'):
+        return False
+    return not config.get('OUTBOX_ENABLED') or bool(config.get('OUTBOX_RELAY_IN_PROCESS'))
+
+
+def uses_memory_sqlite(app):
+    """Whether the app runs on a single-connection in-memory SQLite database."""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    return uri in ('sqlite://', 'sqlite:///:memory:')
+
+
+def create_outbox_relay(app):
+    """Build an OutboxRelay with its own synchronous broker connection."""
+    from app.services.outbox_service import OutboxRelay
+    from app.services.rabbitmq_service import RabbitMQService
+    
+    # The relay needs confirmed, synchronous publishes and must not share
+    # the AMQP channel owned by the background event publisher, if any
+    publisher = getattr(app, 'rabbitmq', None)
+    rabbitmq = RabbitMQService(
+        app.config,
+        broker=publisher.broker if publisher is not None else None,
+        async_publish=False
+    )
+    return OutboxRelay(
+        app,
+        rabbitmq,
+        batch_size=app.config['OUTBOX_BATCH_SIZE'],
+        poll_interval=app.config['OUTBOX_POLL_INTERVAL'],
+        delete_sent=app.config['OUTBOX_DELETE_SENT'],
+        max_attempts=app.config['OUTBOX_MAX_ATTEMPTS']
+    )
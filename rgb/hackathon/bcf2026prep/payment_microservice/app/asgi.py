@@ -0,0 +1,568 @@
+"""
+ASGI deployment mode.
+
+The hot endpoints (create, get, list, process and the payment event
+stream) are served by async handlers on an async SQLAlchemy engine and
+an asyncio AMQP publisher, so a request waiting on the database, the
+broker or a payment change does not pin a worker thread. Every other route, and any request carrying an
+Idempotency-Key, falls through to the regular Flask app.
+"""
+import time
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, Mount
+from app import create_app, uses_memory_sqlite
+from app.models.user import User
+from app.routes.payment_routes import (
+    TRANSITION_ERROR_CODES,
+    export_headers,
+    parse_booking_ids,
+    parse_export_args,
+    parse_stats_args,
+    stats_allowed,
+    validate_payment_spec
+)
+from app.services.aio_rabbitmq_service import AioRabbitMQService
+from app.services.async_payment_service import AsyncPaymentService
+from app.services.cache_service import PaymentCache
+from app.services.db_metrics_service import InstrumentedQueuePool, InstrumentedAsyncQueuePool, instrument_engine
+from app.services.jwt_service import JWTService
+from app.services.payment_service import PaymentService, TransitionOutcome
+from app.services.pubsub_service import format_sse, SSE_KEEPALIVE
+from app.services.serialization_service import payment_encoder, json_object, export_writer, EXPORT_FORMATS
+from app.services.rabbitmq_service import PaymentEvents
+from app.services.metrics_service import (
+    ACTIVE_REQUESTS,
+    request_metrics,
+    track_payment_created,
+    track_payment_processed
+)
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg'
+}
+
+
+def async_database_uri(uri):
+    """Map a sync SQLAlchemy URI onto the matching async driver."""
+    url = make_url(uri)
+    drivername = ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        raise ValueError(f'No async driver for database URI: {uri}')
+    return url.set(drivername=drivername)
+
+
+def _int_arg(request, name, default):
+    try:
+        return int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _float_arg(request, name, default):
+    try:
+        return float(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def json_response(status_code=200, **members):
+    """Response from pre-encoded JSON members (see serialization_service.json_object)."""
+    return Response(json_object(**members), status_code=status_code, media_type='application/json')
+
+
+def _error(message, status_code, code=None):
+    body = {'error': message}
+    if code:
+        body['code'] = code
+    return JSONResponse(body, status_code=status_code)
+
+
+async def authenticate(request):
+    """
+    Async jwt_required: resolve the UserIdentity for the bearer token.
+    Returns (user, None) or (None, error response).
+    """
+    state = request.app.state
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header[7:] if auth_header.startswith('Bearer ') else None
+    
+    if not token:
+        return None, _error('Authorization token is missing', 401, 'TOKEN_MISSING')
+    
+    payload = JWTService.verify_token(token, state.config, state.jwt_cache, state.jwks_client)
+    if not payload:
+        return None, _error('Invalid or expired token', 401, 'TOKEN_INVALID')
+    
+    claims = JWTService.identity_claims(payload)
+    if claims is None:
+        return None, _error('User not found in token', 401, 'USER_NOT_FOUND')
+    
+    auth_user_id, email, is_verified = claims
+    identities = state.user_identities
+    if identities is not None:
+        identity = identities.get(auth_user_id)
+        if identity is not None and User.claims_match(identity, email, is_verified):
+            return identity, None
+    
+    async with state.sessions() as session:
+        identity = await AsyncPaymentService.get_identity(session, auth_user_id, email, is_verified)
+    if identities is not None:
+        identities.set(identity)
+    return identity, None
+
+
+def async_route(endpoint):
+    """
+    Wrap an async handler with authentication and request metrics.
+    Metrics use the Flask endpoint name so both modes share series.
+    """
+    def decorator(f):
+        async def handler(request):
+            ACTIVE_REQUESTS.inc()
+            start = time.perf_counter_ns()
+            status_code = 500
+            try:
+                user, error = await authenticate(request)
+                response = error if error is not None else await f(request, user)
+                status_code = response.status_code
+                return response
+            finally:
+                request_metrics.observe(request.method, endpoint, status_code, time.perf_counter_ns() - start)
+                ACTIVE_REQUESTS.dec()
+        
+        return handler
+    
+    return decorator
+
+
+async def publish_payment_event(app, event_type, payment):
+    """Async publish_payment_event: wake the outbox relay or queue the event."""
+    state = app.state
+    if state.outbox:
+        relay = getattr(state.flask_app, 'outbox_relay', None)
+        if relay is not None:
+            relay.wake()
+        return
+    
+    if state.rabbitmq is not None:
+        await state.rabbitmq.publish_event(event_type, payment.to_dict())
+
+
+@async_route('payments.create_payment')
+async def create_payment(request, user):
+    """Create a new payment."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    
+    if not data:
+        return _error('Request body is required', 400)
+    
+    spec, error = validate_payment_spec(data)
+    if error:
+        return _error(error, 400)
+    
+    async with request.app.state.sessions() as session:
+        payment = await AsyncPaymentService.create_payment(
+            session,
+            user.id,
+            spec,
+            outbox=request.app.state.outbox
+        )
+    
+    payment_changed(request.app, payment)
+    
+    track_payment_created(
+        amount=spec['amount'],
+        currency=spec['currency'],
+        payment_method=spec['payment_method']
+    )
+    await publish_payment_event(request.app, PaymentEvents.CREATED, payment)
+    
+    return JSONResponse({
+        'message': 'Payment created successfully',
+        'payment': payment.to_dict()
+    }, status_code=201)
+
+
+def payment_changed(app, payment):
+    """Async-side payment_changed: refresh the cache entry and wake waiters."""
+    cache = app.state.payment_cache
+    notifier = app.state.payment_notifier
+    if cache is None and notifier is None:
+        return
+    
+    entry = cache.refresh(payment) if cache is not None else PaymentCache.entry(payment)
+    if notifier is not None:
+        notifier.publish(payment.payment_id, entry)
+
+
+async def load_payment(app, payment_id):
+    """Async PaymentService.get_cached_payment."""
+    cache = app.state.payment_cache
+    payment = cache.get(payment_id) if cache is not None else None
+    if payment is not None:
+        return payment
+    
+    async with app.state.sessions() as session:
+        row = await AsyncPaymentService.get_payment_by_id(session, payment_id)
+    if row is None:
+        return None
+    return cache.fill(row) if cache is not None else PaymentCache.entry(row)
+
+
+def etag_matches(request, etag):
+    """Whether If-None-Match names `etag` (weak comparison)."""
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+
+@async_route('payments.get_payment')
+async def get_payment(request, user):
+    """Get payment by ID, read through the payment cache; supports ?wait= long-polls."""
+    payment_id = request.path_params['payment_id']
+    payment = await load_payment(request.app, payment_id)
+    
+    if not payment:
+        return _error('Payment not found', 404)
+    
+    if payment.user_id != user.id:
+        return _error('Unauthorized', 403)
+    
+    wait = min(_float_arg(request, 'wait', 0), request.app.state.config['PAYMENT_WAIT_MAX'])
+    notifier = request.app.state.payment_notifier
+    if wait > 0 and notifier is not None and etag_matches(request, payment.etag):
+        changed = await notifier.wait_for_change_async(
+            payment_id,
+            payment.etag,
+            wait,
+            load=lambda: load_payment(request.app, payment_id)
+        )
+        # Past the waiter cap, degrade to a plain conditional read
+        if changed:
+            payment = changed
+    
+    headers = {'ETag': f'"{payment.etag}"', 'Cache-Control': 'private, no-cache'}
+    if etag_matches(request, payment.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        f'{{"payment":{payment.body}}}\n',
+        media_type='application/json',
+        headers=headers
+    )
+
+
+async def payment_events(request):
+    """
+    Server-sent events stream of a payment's changes (see the Flask
+    payment_events). Each open stream costs a queue, not a thread.
+    """
+    user, error = await authenticate(request)
+    if error is not None:
+        return error
+    
+    state = request.app.state
+    notifier = state.payment_notifier
+    if notifier is None:
+        return _error('Payment events are disabled', 404)
+    
+    payment_id = request.path_params['payment_id']
+    payment = await load_payment(request.app, payment_id)
+    
+    if not payment:
+        return _error('Payment not found', 404)
+    
+    if payment.user_id != user.id:
+        return _error('Unauthorized', 403)
+    
+    if len(notifier) >= notifier.max_waiters:
+        return _error('Too many waiting requests', 503)
+    
+    last_event_id = request.headers.get('Last-Event-ID')
+    
+    async def stream(entry):
+        deadline = time.monotonic() + state.config['PAYMENT_EVENTS_MAX_DURATION']
+        if entry.etag != last_event_id:
+            yield format_sse(entry)
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed = await notifier.wait_for_change_async(
+                payment_id,
+                entry.etag,
+                min(remaining, state.config['PAYMENT_EVENTS_KEEPALIVE']),
+                load=lambda: load_payment(request.app, payment_id)
+            )
+            if changed is False:
+                return
+            if changed:
+                entry = changed
+                yield format_sse(entry)
+            else:
+                yield SSE_KEEPALIVE
+    
+    return StreamingResponse(
+        stream(payment),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@async_route('payments.get_user_payments')
+async def get_user_payments(request, user):
+    """Get all payments for current user (keyset or legacy pagination)."""
+    if 'cursor' in request.query_params:
+        return await get_user_payments_by_cursor(request, user)
+    
+    page = _int_arg(request, 'page', 1)
+    per_page = min(_int_arg(request, 'per_page', 20), 100)
+    
+    async with request.app.state.sessions() as session:
+        pagination = await AsyncPaymentService.get_payment_rows_by_user(
+            session,
+            user.id,
+            page=page,
+            per_page=per_page
+        )
+    
+    encoder = payment_encoder(request.app.state.config['PAYMENT_JSON_BACKEND'])
+    return json_response(
+        payments=encoder.dumps(pagination.items),
+        pagination=encoder.encode({
+            'has_next': pagination.has_next,
+            'has_prev': pagination.has_prev,
+            'page': pagination.page,
+            'pages': pagination.pages,
+            'per_page': pagination.per_page,
+            'total': pagination.total
+        })
+    )
+
+
+async def get_user_payments_by_cursor(request, user):
+    """Keyset-paginated payments for current user."""
+    limit = min(max(_int_arg(request, 'limit', 20), 1), 100)
+    include_total = request.query_params.get('include_total', 'false').lower() == 'true'
+    
+    try:
+        async with request.app.state.sessions() as session:
+            page = await AsyncPaymentService.get_payments_by_user_cursor(
+                session,
+                user.id,
+                limit=limit,
+                cursor=request.query_params.get('cursor') or None,
+                include_total=include_total
+            )
+    except ValueError:
+        return _error('Invalid cursor', 400)
+    
+    pagination = {
+        'has_next': page.next_cursor is not None,
+        'limit': limit,
+        'next_cursor': page.next_cursor
+    }
+    if include_total:
+        pagination['total'] = page.total
+    
+    encoder = payment_encoder(request.app.state.config['PAYMENT_JSON_BACKEND'])
+    return json_response(
+        payments=encoder.dumps(page.items),
+        pagination=encoder.encode(pagination)
+    )
+
+
+@async_route('payments.get_bookings_payments')
+async def get_bookings_payments(request, user):
+    """Get the current user's payments for several bookings (?ids=a,b,c)."""
+    booking_ids, error = parse_booking_ids(
+        request.query_params.get('ids'),
+        request.app.state.config['PAYMENT_BOOKINGS_MAX_IDS']
+    )
+    if error:
+        return _error(error, 400)
+    
+    async with request.app.state.sessions() as session:
+        bookings = await AsyncPaymentService.get_payments_by_bookings(session, booking_ids, user.id)
+    
+    encoder = payment_encoder(request.app.state.config['PAYMENT_JSON_BACKEND'])
+    return json_response(bookings=encoder.encode({
+        booking_id: encoder.dicts(rows)
+        for booking_id, rows in sorted(bookings.items())
+    }))
+
+
+@async_route('payments.get_stats')
+async def get_stats(request, user):
+    """Payment count and amount per day, currency and status, from the rollups."""
+    config = request.app.state.config
+    if not stats_allowed(user, config['PAYMENT_STATS_USERS']):
+        return _error('Unauthorized', 403)
+    
+    filters, error = parse_stats_args(request.query_params, config['PAYMENT_STATS_MAX_DAYS'])
+    if error:
+        return _error(error, 400)
+    
+    async with request.app.state.sessions() as session:
+        stats = await AsyncPaymentService.get_stats(session, **filters)
+    
+    return JSONResponse({
+        'from': filters['start'].isoformat(),
+        'to': filters['end'].isoformat(),
+        'stats': stats
+    })
+
+
+@async_route('payments.export_payments')
+async def export_payments(request, user):
+    """Stream the current user's (or ?scope=all every) payment as NDJSON or CSV."""
+    options, error = parse_export_args(request.query_params)
+    if error:
+        return _error(error, 400)
+    
+    state = request.app.state
+    user_id = user.id
+    if options['scope'] == 'all':
+        if user.auth_user_id not in state.config['PAYMENT_EXPORT_ALL_USERS']:
+            return _error('Unauthorized', 403)
+        user_id = None
+    
+    stmt = PaymentService.export_query(user_id, options['start'], options['end'])
+    header, encode = export_writer(options['format'], state.config['PAYMENT_JSON_BACKEND'])
+    
+    async def stream():
+        if header:
+            yield header
+        async with state.sessions() as session:
+            async for rows in AsyncPaymentService.stream_rows(
+                session, stmt, state.config['PAYMENT_EXPORT_CHUNK_SIZE']
+            ):
+                yield encode(rows)
+    
+    return StreamingResponse(
+        stream(),
+        media_type=EXPORT_FORMATS[options['format']],
+        headers=export_headers(options['format'])
+    )
+
+
+@async_route('payments.process_payment')
+async def process_payment(request, user):
+    """Process a pending payment."""
+    async with request.app.state.sessions() as session:
+        payment, outcome, error = await AsyncPaymentService.process_payment(
+            session,
+            request.path_params['payment_id'],
+            user_id=user.id,
+            outbox=request.app.state.outbox
+        )
+    
+    if error:
+        if outcome == TransitionOutcome.INVALID_STATE:
+            track_payment_processed(status='failed')
+        return _error(error, TRANSITION_ERROR_CODES[outcome])
+    
+    payment_changed(request.app, payment)
+    track_payment_processed(status='completed')
+    await publish_payment_event(request.app, PaymentEvents.COMPLETED, payment)
+    
+    return JSONResponse({
+        'message': 'Payment processed successfully',
+        'payment': payment.to_dict()
+    })
+
+
+class IdempotencyFallback:
+    """
+    Send requests carrying an Idempotency-Key to the Flask app, which
+    owns the idempotency store; everything else goes to `app`.
+    """
+    
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and any(
+            name == b'idempotency-key' for name, _ in scope['headers']
+        ):
+            return await self.wsgi_app(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+
+def create_asgi_app(config_class=None):
+    """
+    Build the ASGI application around a regular Flask app.
+    The Flask app still owns table creation, the outbox relay and every
+    non-hot route, so the sync deployment is unchanged.
+    """
+    flask_app = create_app(config_class)
+    config = flask_app.config
+    
+    if uses_memory_sqlite(flask_app):
+        raise ValueError('The ASGI app needs a file or server database, not in-memory SQLite')
+    
+    engine_options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if engine_options.get('poolclass') is InstrumentedQueuePool:
+        # The async engine needs the asyncio variant of the pool create_app chose
+        engine_options['poolclass'] = InstrumentedAsyncQueuePool
+    engine = create_async_engine(
+        async_database_uri(config['SQLALCHEMY_DATABASE_URI']),
+        **engine_options
+    )
+    if config.get('DB_METRICS_ENABLED'):
+        instrument_engine(engine.sync_engine, 'async', config['DB_SLOW_QUERY_MS'])
+    # With the outbox on, events leave through the relay, never inline
+    outbox = bool(config.get('RABBITMQ_ENABLED') and config.get('OUTBOX_ENABLED'))
+    rabbitmq = AioRabbitMQService(config) if config.get('RABBITMQ_ENABLED') and not outbox else None
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        if rabbitmq is not None:
+            await rabbitmq.start()
+        yield
+        if rabbitmq is not None:
+            await rabbitmq.close()
+        await engine.dispose()
+    
+    wsgi_app = WSGIMiddleware(flask_app)
+    app = Starlette(
+        routes=[
+            Route('/api/payments', create_payment, methods=['POST']),
+            Route('/api/payments', get_user_payments, methods=['GET']),
+            Route('/api/payments/bookings', get_bookings_payments, methods=['GET']),
+            Route('/api/payments/stats', get_stats, methods=['GET']),
+            Route('/api/payments/export', export_payments, methods=['GET']),
+            Route('/api/payments/{payment_id}/process', process_payment, methods=['POST']),
+            Route('/api/payments/{payment_id}/events', payment_events, methods=['GET']),
+            Route('/api/payments/{payment_id}', get_payment, methods=['GET']),
+            Mount('', wsgi_app)
+        ],
+        lifespan=lifespan
+    )
+    
+    app.state.config = config
+    app.state.flask_app = flask_app
+    app.state.sessions = async_sessionmaker(engine, expire_on_commit=False)
+    app.state.jwt_cache = getattr(flask_app, 'jwt_cache', None)
+    app.state.jwks_client = getattr(flask_app, 'jwks_client', None)
+    app.state.user_identities = getattr(flask_app, 'user_identities', None)
+    app.state.payment_cache = getattr(flask_app, 'payment_cache', None)
+    app.state.payment_notifier = getattr(flask_app, 'payment_notifier', None)
+    app.state.rabbitmq = rabbitmq
+    app.state.outbox = outbox
+    
+    if getattr(flask_app, 'idempotency_store', None) is not None:
+        return IdempotencyFallback(app, wsgi_app)
+    return app
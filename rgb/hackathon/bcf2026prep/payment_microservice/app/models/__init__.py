@@ -1,4 +1,7 @@
-from app.models.user import User
+from app.models.user import User, UserIdentity
 from app.models.payment import Payment
+from app.models.outbox import OutboxEvent, FailedOutboxEvent
+from app.models.idempotency import IdempotencyKey
+from app.models.rollup import PaymentRollup
 
-__all__ = ['User', 'Payment']
+__all__ = ['User', 'UserIdentity', 'Payment', 'OutboxEvent', 'FailedOutboxEvent', 'IdempotencyKey', 'PaymentRollup']
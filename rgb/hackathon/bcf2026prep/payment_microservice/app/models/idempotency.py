@@ -0,0 +1,22 @@
+from datetime import datetime
+from app import db
+
+
+class IdempotencyKey(db.Model):
+    """
+    Idempotency-Key record shared by all workers.
+    A row is claimed (state 'in_progress') before the request runs and
+    holds the stored response once it completes.
+    """
+    __tablename__ = 'idempotency_keys'
+    
+    key = db.Column(db.String(320), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='in_progress')
+    status_code = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key}>'
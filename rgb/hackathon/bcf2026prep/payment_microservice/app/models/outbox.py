@@ -0,0 +1,61 @@
+from datetime import datetime
+import json
+from sqlalchemy import insert
+from app import db
+
+
+class OutboxEvent(db.Model):
+    """
+    Transactional outbox - payment events written in the same
+    transaction as the Payment change and relayed to RabbitMQ later.
+    """
+    __tablename__ = 'outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    published_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type}>'
+    
+    @classmethod
+    def add(cls, event_type, data):
+        """Stage an event in the current session (committed by the caller)."""
+        event = cls.build(event_type, data)
+        db.session.add(event)
+        return event
+    
+    @classmethod
+    def build(cls, event_type, data):
+        """Create an unsaved outbox event for a payload."""
+        return cls(event_type=event_type, payload=json.dumps(data))
+    
+    @classmethod
+    def add_many(cls, event_type, datas):
+        """Insert several events with one multi-row INSERT (committed by the caller)."""
+        now = datetime.utcnow()
+        db.session.execute(insert(cls), [
+            {'event_type': event_type, 'payload': json.dumps(data), 'created_at': now}
+            for data in datas
+        ])
+
+
+class FailedOutboxEvent(db.Model):
+    """
+    Outbox events the relay gave up on (undecodable payload, or rejected
+    OUTBOX_MAX_ATTEMPTS times), parked for inspection so they no longer
+    block the events behind them.
+    """
+    __tablename__ = 'outbox_failed'
+    
+    id = db.Column(db.Integer, primary_key=True)  # id the row had in outbox
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    error = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    failed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FailedOutboxEvent {self.id} {self.event_type}>'
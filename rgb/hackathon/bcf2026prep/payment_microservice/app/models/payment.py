@@ -8,13 +8,20 @@ class Payment(db.Model):
     Payment model - simple and scalable.
     """
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Serves keyset pagination: WHERE user_id = ? ORDER BY created_at, id
+        db.Index('ix_payments_user_created_id', 'user_id', 'created_at', 'id'),
+        # Serves booking lookups: WHERE booking_id IN (...) AND user_id = ?
+        db.Index('ix_payments_booking_user', 'booking_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     payment_id = db.Column(db.String(36), unique=True, nullable=False, index=True, 
                            default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     booking_id = db.Column(db.String(100), nullable=False, index=True)
-    amount = db.Column(db.Float, nullable=False)
+    # Integer minor units of `currency` (cents for USD); see currency_service
+    amount_minor = db.Column(db.BigInteger, nullable=False)
     currency = db.Column(db.String(3), default='USD')
     status = db.Column(db.String(20), default='pending', index=True)
     # Status: pending, processing, completed, failed, refunded
@@ -26,6 +33,13 @@ class Payment(db.Model):
     def __repr__(self):
         return f'<Payment {self.payment_id}>'
     
+    @property
+    def amount(self):
+        """Amount in major units, as a float for JSON and event payloads."""
+        # Imported here: app.services imports this module
+        from app.services.currency_service import from_minor_units
+        return from_minor_units(self.amount_minor, self.currency)
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,70 @@
+from app import db
+from app.models.user import _dialect_insert
+
+
+class PaymentRollup(db.Model):
+    """
+    Pre-computed payment totals per (day, currency, status).
+    A payment counts under the UTC day it was created, in its current
+    status; PaymentService moves it between rows on every transition.
+    """
+    __tablename__ = 'payment_rollups'
+    
+    day = db.Column(db.Date, primary_key=True)
+    # '' for payments stored without a currency
+    currency = db.Column(db.String(3), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    amount_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<PaymentRollup {self.day} {self.currency} {self.status}>'
+    
+    @classmethod
+    def increment_statement(cls, dialect_name, deltas):
+        """
+        INSERT ... ON CONFLICT DO UPDATE adding `deltas`
+        ({(day, currency, status): (count, amount_minor)}) to the counters,
+        or None if the dialect has no ON CONFLICT support.
+        """
+        insert = _dialect_insert(dialect_name)
+        if insert is None:
+            return None
+        
+        table = cls.__table__
+        # Keys in a fixed order so concurrent writers lock rows in the same order
+        stmt = insert(table).values([
+            {'day': day, 'currency': currency, 'status': status, 'count': count, 'amount_minor': amount_minor}
+            for (day, currency, status), (count, amount_minor) in sorted(deltas.items())
+        ])
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.currency, table.c.status],
+            set_={
+                'count': table.c.count + stmt.excluded.count,
+                'amount_minor': table.c.amount_minor + stmt.excluded.amount_minor
+            }
+        )
+    
+    @classmethod
+    def increment(cls, deltas):
+        """Add `deltas` to the counters in the current transaction."""
+        if not deltas:
+            return
+        
+        stmt = cls.increment_statement(db.session.get_bind().dialect.name, deltas)
+        if stmt is not None:
+            db.session.execute(stmt)
+            return
+        
+        # Portable fallback: update, then insert the rows that did not exist
+        table = cls.__table__
+        for (day, currency, status), (count, amount_minor) in sorted(deltas.items()):
+            updated = db.session.execute(
+                table.update()
+                .where(table.c.day == day, table.c.currency == currency, table.c.status == status)
+                .values(count=table.c.count + count, amount_minor=table.c.amount_minor + amount_minor)
+            ).rowcount
+            if not updated:
+                db.session.execute(table.insert().values(
+                    day=day, currency=currency, status=status, count=count, amount_minor=amount_minor
+                ))
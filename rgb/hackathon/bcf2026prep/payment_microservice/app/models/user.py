@@ -1,7 +1,25 @@
+from collections import namedtuple
 from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 from app import db
 
 
+# Lightweight, session-free view of a user row used on the request hot path
+UserIdentity = namedtuple('UserIdentity', ['id', 'auth_user_id', 'email', 'is_verified'])
+
+
+def _dialect_insert(dialect_name):
+    """Return a dialect insert() supporting ON CONFLICT, or None."""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
 class User(db.Model):
     """
     User model - stores user info from JWT token.
@@ -31,23 +49,110 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
+    @staticmethod
+    def claims_match(identity, email=None, is_verified=False):
+        """Check whether stored user info already reflects the JWT claims."""
+        return (not email or identity.email == email) and \
+            identity.is_verified == bool(is_verified)
+    
     @classmethod
     def get_or_create(cls, auth_user_id, email=None, is_verified=False):
         """Get existing user or create new one from JWT data."""
         user = cls.query.filter_by(auth_user_id=auth_user_id).first()
         if not user:
-            user = cls(
-                auth_user_id=auth_user_id,
-                email=email,
-                is_verified=is_verified
-            )
-            db.session.add(user)
-            db.session.commit()
-        else:
-            # Update user info if changed
-            if email and user.email != email:
+            identity = cls.upsert(auth_user_id, email, is_verified)
+            return db.session.get(cls, identity.id)
+        
+        # Update user info only if changed
+        if not cls.claims_match(user, email, is_verified):
+            if email:
                 user.email = email
-            if user.is_verified != is_verified:
-                user.is_verified = is_verified
+            user.is_verified = bool(is_verified)
             db.session.commit()
         return user
+    
+    @classmethod
+    def get_identity(cls, auth_user_id, email=None, is_verified=False):
+        """
+        Resolve a UserIdentity from JWT data.
+        Reads first and only writes when the row is missing or the claims differ.
+        """
+        row = db.session.execute(cls.identity_statement(auth_user_id)).first()
+        
+        if row is not None:
+            identity = UserIdentity(*row)
+            if cls.claims_match(identity, email, is_verified):
+                return identity
+        
+        return cls.upsert(auth_user_id, email, is_verified)
+    
+    @classmethod
+    def upsert(cls, auth_user_id, email=None, is_verified=False):
+        """
+        Insert or update a user in one statement and return its UserIdentity.
+        Uses INSERT ... ON CONFLICT where the dialect supports it so
+        concurrent first logins do not race on the unique auth_user_id.
+        """
+        stmt = cls.upsert_statement(db.session.get_bind().dialect.name, auth_user_id, email, is_verified)
+        if stmt is None:
+            return cls._upsert_fallback(auth_user_id, email, is_verified)
+        
+        row = db.session.execute(stmt).one()
+        db.session.commit()
+        return UserIdentity(*row)
+    
+    @classmethod
+    def identity_statement(cls, auth_user_id):
+        """SELECT of the UserIdentity columns for one auth_user_id."""
+        return select(cls.id, cls.auth_user_id, cls.email, cls.is_verified)\
+            .where(cls.auth_user_id == auth_user_id)
+    
+    @classmethod
+    def upsert_statement(cls, dialect_name, auth_user_id, email=None, is_verified=False):
+        """
+        INSERT ... ON CONFLICT DO UPDATE ... RETURNING the UserIdentity
+        columns, or None if the dialect has no ON CONFLICT support.
+        """
+        insert = _dialect_insert(dialect_name)
+        if insert is None:
+            return None
+        
+        table = cls.__table__
+        now = datetime.utcnow()
+        stmt = insert(table).values(
+            auth_user_id=auth_user_id,
+            email=email,
+            is_verified=bool(is_verified),
+            created_at=now,
+            updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.auth_user_id],
+            set_={
+                'email': func.coalesce(stmt.excluded.email, table.c.email),
+                'is_verified': stmt.excluded.is_verified,
+                'updated_at': now
+            }
+        ).returning(table.c.id, table.c.auth_user_id, table.c.email, table.c.is_verified)
+        return stmt
+    
+    @classmethod
+    def _upsert_fallback(cls, auth_user_id, email=None, is_verified=False):
+        """Portable upsert for dialects without ON CONFLICT support."""
+        user = cls.query.filter_by(auth_user_id=auth_user_id).first()
+        if not user:
+            user = cls(auth_user_id=auth_user_id, email=email, is_verified=bool(is_verified))
+            db.session.add(user)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Lost the race with a concurrent insert - update the winner
+                db.session.rollback()
+                user = cls.query.filter_by(auth_user_id=auth_user_id).one()
+        
+        if not cls.claims_match(user, email, is_verified):
+            if email:
+                user.email = email
+            user.is_verified = bool(is_verified)
+            db.session.commit()
+        return UserIdentity(user.id, user.auth_user_id, user.email, user.is_verified)
@@ -1,5 +1,5 @@
 from flask import Blueprint, jsonify, current_app
-from app import db
+from app import db, publishes_events
 from sqlalchemy import text
 
 health_bp = Blueprint('health', __name__)
@@ -33,10 +33,10 @@ def readiness_check():
         checks['database'] = False
         checks['database_error'] = str(e)
     
-    # Check RabbitMQ if enabled
-    if current_app.config.get('RABBITMQ_ENABLED'):
-        if hasattr(current_app, 'rabbitmq') and current_app.rabbitmq.connection:
-            checks['rabbitmq'] = not current_app.rabbitmq.connection.is_closed
+    # Check RabbitMQ if this process publishes to it
+    if publishes_events(current_app.config):
+        if hasattr(current_app, 'rabbitmq'):
+            checks['rabbitmq'] = current_app.rabbitmq.is_connected()
         else:
             checks['rabbitmq'] = False
     
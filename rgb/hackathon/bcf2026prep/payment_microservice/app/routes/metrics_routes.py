@@ -1,4 +1,4 @@
-from flask import Blueprint, Response
+from flask import Blueprint, Response, current_app
 from app.services.metrics_service import get_metrics
 
 metrics_bp = Blueprint('metrics', __name__)
@@ -8,5 +8,5 @@ metrics_bp = Blueprint('metrics', __name__)
 @metrics_bp.route('/', methods=['GET'])
 def metrics():
     """Prometheus metrics endpoint."""
-    metrics_data, content_type = get_metrics()
+    metrics_data, content_type = get_metrics(getattr(current_app, 'metrics_exporter', None))
     return Response(metrics_data, mimetype=content_type)
@@ -1,9 +1,16 @@
-from flask import Blueprint, request, jsonify, current_app
+import time
+from datetime import date, datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from app.services.jwt_service import jwt_required, verified_user_required
-from app.services.payment_service import PaymentService
+from app.services.payment_service import PaymentService, TransitionOutcome
+from app.services.stats_service import StatsService
 from app.services.rabbitmq_service import PaymentEvents
+from app.services.outbox_service import outbox_enabled
+from app.services.idempotency_service import idempotent
+from app.services.pubsub_service import format_sse, SSE_KEEPALIVE
+from app.services.serialization_service import payment_encoder, json_object, export_writer, EXPORT_FORMATS
+from app.services.currency_service import parse_amount, to_minor_units
 from app.services.metrics_service import (
-    track_request_metrics, 
     track_payment_created, 
     track_payment_processed, 
     track_payment_refunded
@@ -11,51 +18,105 @@ from app.services.metrics_service import (
 
 payment_bp = Blueprint('payments', __name__)
 
+TRANSITION_ERROR_CODES = {
+    TransitionOutcome.NOT_FOUND: 404,
+    TransitionOutcome.FORBIDDEN: 403,
+    TransitionOutcome.INVALID_STATE: 400
+}
 
-@payment_bp.route('', methods=['POST'])
-@jwt_required
-@track_request_metrics
-def create_payment():
-    """Create a new payment."""
-    data = request.get_json()
+
+def publish_payment_event(event_type, payment):
+    """
+    Publish a payment event.
+    With the outbox enabled the event was already committed with the
+    payment, so just wake the relay instead of publishing inline.
+    """
+    if outbox_enabled():
+        if hasattr(current_app, 'outbox_relay'):
+            current_app.outbox_relay.wake()
+        return
     
-    if not data:
-        return jsonify({'error': 'Request body is required'}), 400
+    if hasattr(current_app, 'rabbitmq'):
+        current_app.rabbitmq.publish_event(event_type, payment.to_dict())
+
+
+def publish_payment_events(event_type, payments):
+    """Publish one event per payment as a single batch."""
+    if outbox_enabled():
+        if hasattr(current_app, 'outbox_relay'):
+            current_app.outbox_relay.wake()
+        return
+    
+    if hasattr(current_app, 'rabbitmq'):
+        current_app.rabbitmq.publish_events(
+            [(event_type, payment.to_dict()) for payment in payments]
+        )
+
+
+def validate_payment_spec(data):
+    """
+    Validate a payment creation payload.
+    Returns (spec, None) with create_payment kwargs, or (None, error).
+    """
+    if not isinstance(data, dict):
+        return None, 'Payment must be an object'
     
     # Validate required fields
     required_fields = ['booking_id', 'amount']
     for field in required_fields:
         if field not in data:
-            return jsonify({'error': f'{field} is required'}), 400
+            return None, f'{field} is required'
     
     try:
-        amount = float(data['amount'])
+        amount = parse_amount(data['amount'])
         if amount <= 0:
-            return jsonify({'error': 'Amount must be positive'}), 400
-    except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid amount'}), 400
+            return None, 'Amount must be positive'
+    except ValueError:
+        return None, 'Invalid amount'
+    
+    # Reject sub-minor-unit amounts rather than rounding them
+    currency = data.get('currency', 'USD')
+    try:
+        to_minor_units(amount, currency)
+    except ValueError as e:
+        return None, str(e)
+    
+    return {
+        'booking_id': data['booking_id'],
+        'amount': amount,
+        'currency': currency,
+        'payment_method': data.get('payment_method')
+    }, None
+
+
+@payment_bp.route('', methods=['POST'])
+@jwt_required
+@idempotent
+def create_payment():
+    """Create a new payment."""
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({'error': 'Request body is required'}), 400
+    
+    spec, error = validate_payment_spec(data)
+    if error:
+        return jsonify({'error': error}), 400
     
     payment = PaymentService.create_payment(
         user_id=request.current_user.id,
-        booking_id=data['booking_id'],
-        amount=amount,
-        currency=data.get('currency', 'USD'),
-        payment_method=data.get('payment_method')
+        **spec
     )
     
     # Track metrics
     track_payment_created(
-        amount=amount,
-        currency=data.get('currency', 'USD'),
-        payment_method=data.get('payment_method')
+        amount=spec['amount'],
+        currency=spec['currency'],
+        payment_method=spec['payment_method']
     )
     
     # Publish event if RabbitMQ is enabled
-    if hasattr(current_app, 'rabbitmq'):
-        current_app.rabbitmq.publish_event(
-            PaymentEvents.CREATED,
-            payment.to_dict()
-        )
+    publish_payment_event(PaymentEvents.CREATED, payment)
     
     return jsonify({
         'message': 'Payment created successfully',
@@ -63,12 +124,71 @@ def create_payment():
     }), 201
 
 
+@payment_bp.route('/batch', methods=['POST'])
+@jwt_required
+@idempotent
+def create_payments_batch():
+    """
+    Create many payments in one transaction.
+    Invalid items are reported per index; valid ones are inserted together.
+    """
+    data = request.get_json()
+    
+    if not isinstance(data, dict) or not isinstance(data.get('payments'), list) or not data['payments']:
+        return jsonify({'error': 'payments must be a non-empty list'}), 400
+    
+    max_size = current_app.config['PAYMENT_BATCH_MAX_SIZE']
+    if len(data['payments']) > max_size:
+        return jsonify({'error': f'At most {max_size} payments per batch'}), 400
+    
+    results = [None] * len(data['payments'])
+    specs = []
+    indexes = []
+    for index, item in enumerate(data['payments']):
+        spec, error = validate_payment_spec(item)
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'error': error}
+        else:
+            specs.append(spec)
+            indexes.append(index)
+    
+    if not specs:
+        return jsonify({'error': 'No valid payments', 'results': results}), 400
+    
+    payments = PaymentService.create_payments_bulk(
+        user_id=request.current_user.id,
+        specs=specs
+    )
+    
+    for index, spec, payment in zip(indexes, specs, payments):
+        track_payment_created(
+            amount=spec['amount'],
+            currency=spec['currency'],
+            payment_method=spec['payment_method']
+        )
+        results[index] = {'index': index, 'status': 'created', 'payment': payment.to_dict()}
+    
+    # Publish events if RabbitMQ is enabled
+    publish_payment_events(PaymentEvents.CREATED, payments)
+    
+    status_code = 201 if len(payments) == len(results) else 207
+    return jsonify({
+        'message': f'{len(payments)} of {len(results)} payments created',
+        'results': results
+    }), status_code
+
+
 @payment_bp.route('/<payment_id>', methods=['GET'])
 @jwt_required
-@track_request_metrics
 def get_payment(payment_id):
-    """Get payment by ID."""
-    payment = PaymentService.get_payment_by_id(payment_id)
+    """
+    Get payment by ID.
+    Served from the payment cache with an ETag; a matching
+    If-None-Match gets 304 Not Modified. With `?wait=<seconds>` and a
+    matching If-None-Match, long-polls until the payment changes; when
+    too many requests are already waiting it answers at once instead.
+    """
+    payment = PaymentService.get_cached_payment(payment_id)
     
     if not payment:
         return jsonify({'error': 'Payment not found'}), 404
@@ -77,81 +197,370 @@ def get_payment(payment_id):
     if payment.user_id != request.current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    return jsonify({'payment': payment.to_dict()}), 200
+    wait = min(request.args.get('wait', 0, type=float), current_app.config['PAYMENT_WAIT_MAX'])
+    notifier = getattr(current_app, 'payment_notifier', None)
+    # Past the waiter caps, degrade to a plain conditional read
+    if wait > 0 and notifier is not None and request.if_none_match.contains_weak(payment.etag) \
+            and notifier.acquire_thread():
+        try:
+            changed = notifier.wait_for_change(
+                payment_id,
+                payment.etag,
+                wait,
+                load=lambda: PaymentService.load_cached_payment(payment_id)
+            )
+        finally:
+            notifier.release_thread()
+        if changed:
+            payment = changed
+    
+    response = current_app.response_class(
+        f'{{"payment":{payment.body}}}\n',
+        mimetype='application/json'
+    )
+    response.set_etag(payment.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.make_conditional(request)
+    return response, response.status_code
+
+
+@payment_bp.route('/<payment_id>/events', methods=['GET'])
+@jwt_required
+def payment_events(payment_id):
+    """
+    Server-sent events stream of a payment's changes.
+    Sends the current payment (unless it matches Last-Event-ID), then one
+    event per change until PAYMENT_EVENTS_MAX_DURATION; clients reconnect
+    with Last-Event-ID to resume.
+    """
+    notifier = getattr(current_app, 'payment_notifier', None)
+    if notifier is None:
+        return jsonify({'error': 'Payment events are disabled'}), 404
+    
+    payment = PaymentService.get_cached_payment(payment_id)
+    
+    if not payment:
+        return jsonify({'error': 'Payment not found'}), 404
+    
+    if payment.user_id != request.current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # The stream holds this worker thread until it ends
+    if len(notifier) >= notifier.max_waiters or not notifier.acquire_thread():
+        return jsonify({'error': 'Too many waiting requests'}), 503
+    
+    config = current_app.config
+    last_event_id = request.headers.get('Last-Event-ID')
+    
+    def stream(entry):
+        deadline = time.monotonic() + config['PAYMENT_EVENTS_MAX_DURATION']
+        if entry.etag != last_event_id:
+            yield format_sse(entry)
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changed = notifier.wait_for_change(
+                payment_id,
+                entry.etag,
+                min(remaining, config['PAYMENT_EVENTS_KEEPALIVE']),
+                load=lambda: PaymentService.load_cached_payment(payment_id)
+            )
+            if changed is False:
+                return
+            if changed:
+                entry = changed
+                yield format_sse(entry)
+            else:
+                yield SSE_KEEPALIVE
+    
+    response = Response(
+        stream_with_context(stream(payment)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.call_on_close(notifier.release_thread)
+    return response
 
 
 @payment_bp.route('', methods=['GET'])
 @jwt_required
-@track_request_metrics
 def get_user_payments():
-    """Get all payments for current user."""
+    """
+    Get all payments for current user.
+    Pass `cursor` (empty for the first page) to use keyset pagination;
+    otherwise the legacy page/per_page response is returned.
+    """
+    if 'cursor' in request.args:
+        return get_user_payments_by_cursor()
+    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
     # Limit per_page to prevent abuse
     per_page = min(per_page, 100)
     
-    pagination = PaymentService.get_payments_by_user(
+    pagination = PaymentService.get_payment_rows_by_user(
         user_id=request.current_user.id,
         page=page,
         per_page=per_page
     )
     
-    return jsonify({
-        'payments': [p.to_dict() for p in pagination.items],
-        'pagination': {
+    encoder = payment_encoder(current_app.config['PAYMENT_JSON_BACKEND'])
+    return json_response(
+        payments=encoder.dumps(pagination.items),
+        pagination=encoder.encode({
+            'has_next': pagination.has_next,
+            'has_prev': pagination.has_prev,
             'page': pagination.page,
-            'per_page': pagination.per_page,
-            'total': pagination.total,
             'pages': pagination.pages,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
-        }
+            'per_page': pagination.per_page,
+            'total': pagination.total
+        })
+    )
+
+
+def get_user_payments_by_cursor():
+    """Keyset-paginated payments for current user."""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    include_total = request.args.get('include_total', 'false').lower() == 'true'
+    
+    try:
+        page = PaymentService.get_payments_by_user_cursor(
+            user_id=request.current_user.id,
+            limit=limit,
+            cursor=request.args.get('cursor') or None,
+            include_total=include_total,
+            as_rows=True
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    pagination = {
+        'has_next': page.next_cursor is not None,
+        'limit': limit,
+        'next_cursor': page.next_cursor
+    }
+    if include_total:
+        pagination['total'] = page.total
+    
+    encoder = payment_encoder(current_app.config['PAYMENT_JSON_BACKEND'])
+    return json_response(
+        payments=encoder.dumps(page.items),
+        pagination=encoder.encode(pagination)
+    )
+
+
+def json_response(status_code=200, **members):
+    """Response from pre-encoded JSON members (see serialization_service.json_object)."""
+    response = current_app.response_class(json_object(**members), mimetype='application/json')
+    return response, status_code
+
+
+def parse_booking_ids(ids, max_ids):
+    """
+    Split a comma-separated ids parameter, dropping blanks and duplicates.
+    Returns (booking_ids, None) or (None, error).
+    """
+    booking_ids = list(dict.fromkeys(i.strip() for i in (ids or '').split(',') if i.strip()))
+    if not booking_ids:
+        return None, 'ids is required'
+    
+    if len(booking_ids) > max_ids:
+        return None, f'At most {max_ids} booking ids per request'
+    return booking_ids, None
+
+
+def parse_date_range(args):
+    """
+    Parse optional inclusive ?from=&to= ISO dates.
+    Returns (start, end, None) or (None, None, error).
+    """
+    try:
+        start = date.fromisoformat(args['from']) if args.get('from') else None
+        end = date.fromisoformat(args['to']) if args.get('to') else None
+    except ValueError:
+        return None, None, 'from and to must be YYYY-MM-DD dates'
+    
+    if start and end and start > end:
+        return None, None, 'from must not be after to'
+    return start, end, None
+
+
+def parse_stats_args(args, max_days, default_days=30):
+    """
+    Parse ?from=&to= (default the last `default_days` UTC days) and the
+    optional currency/status filters of the stats endpoint.
+    Returns (filters, None) with StatsService.get_stats kwargs, or (None, error).
+    """
+    start, end, error = parse_date_range(args)
+    if error:
+        return None, error
+    
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=default_days - 1)
+    if start > end:
+        return None, 'from must not be after to'
+    if (end - start).days + 1 > max_days:
+        return None, f'At most {max_days} days per request'
+    
+    return {
+        'start': start,
+        'end': end,
+        'currency': args.get('currency') or None,
+        'status': args.get('status') or None
+    }, None
+
+
+def parse_export_args(args):
+    """
+    Parse ?format=ndjson|csv, ?scope=mine|all and the optional ?from=&to=
+    dates of the export endpoint. Returns (options, None) or (None, error);
+    start/end are created_at bounds for PaymentService.export_query.
+    """
+    export_format = args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return None, f"format must be one of: {', '.join(EXPORT_FORMATS)}"
+    
+    scope = args.get('scope', 'mine')
+    if scope not in ('mine', 'all'):
+        return None, 'scope must be mine or all'
+    
+    start, end, error = parse_date_range(args)
+    if error:
+        return None, error
+    
+    return {
+        'format': export_format,
+        'scope': scope,
+        'start': datetime.combine(start, datetime.min.time()) if start else None,
+        'end': datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    }, None
+
+
+def export_headers(export_format):
+    return {
+        'Content-Disposition': f'attachment; filename="payments.{export_format}"',
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no'
+    }
+
+
+def stats_allowed(user, allowed_users):
+    """Stats are service-wide, so only users listed in PAYMENT_STATS_USERS may read them."""
+    return user.auth_user_id in allowed_users
+
+
+@payment_bp.route('/stats', methods=['GET'])
+@jwt_required
+def get_stats():
+    """Payment count and amount per day, currency and status, from the rollups."""
+    if not stats_allowed(request.current_user, current_app.config['PAYMENT_STATS_USERS']):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    filters, error = parse_stats_args(request.args, current_app.config['PAYMENT_STATS_MAX_DAYS'])
+    if error:
+        return jsonify({'error': error}), 400
+    
+    return jsonify({
+        'from': filters['start'].isoformat(),
+        'to': filters['end'].isoformat(),
+        'stats': StatsService.get_stats(**filters)
     }), 200
 
 
+@payment_bp.route('/export', methods=['GET'])
+@jwt_required
+def export_payments():
+    """
+    Stream the current user's payments, or with ?scope=all every payment,
+    as NDJSON or CSV, oldest first.
+    """
+    options, error = parse_export_args(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    config = current_app.config
+    user_id = request.current_user.id
+    if options['scope'] == 'all':
+        if request.current_user.auth_user_id not in config['PAYMENT_EXPORT_ALL_USERS']:
+            return jsonify({'error': 'Unauthorized'}), 403
+        user_id = None
+    
+    stmt = PaymentService.export_query(user_id, options['start'], options['end'])
+    header, encode = export_writer(options['format'], config['PAYMENT_JSON_BACKEND'])
+    
+    def stream():
+        if header:
+            yield header
+        for rows in PaymentService.stream_rows(stmt, config['PAYMENT_EXPORT_CHUNK_SIZE']):
+            yield encode(rows)
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype=EXPORT_FORMATS[options['format']],
+        headers=export_headers(options['format'])
+    )
+
+
 @payment_bp.route('/booking/<booking_id>', methods=['GET'])
 @jwt_required
 def get_booking_payments(booking_id):
-    """Get all payments for a booking."""
-    payments = PaymentService.get_payments_by_booking(booking_id)
+    """Get the current user's payments for a booking."""
+    rows = PaymentService.get_payments_by_booking(
+        booking_id,
+        user_id=request.current_user.id,
+        as_rows=True
+    )
     
-    # Filter to only show user's own payments
-    user_payments = [p for p in payments if p.user_id == request.current_user.id]
+    encoder = payment_encoder(current_app.config['PAYMENT_JSON_BACKEND'])
+    return json_response(payments=encoder.dumps(rows))
+
+
+@payment_bp.route('/bookings', methods=['GET'])
+@jwt_required
+def get_bookings_payments():
+    """Get the current user's payments for several bookings (?ids=a,b,c)."""
+    booking_ids, error = parse_booking_ids(
+        request.args.get('ids'),
+        current_app.config['PAYMENT_BOOKINGS_MAX_IDS']
+    )
+    if error:
+        return jsonify({'error': error}), 400
     
-    return jsonify({
-        'payments': [p.to_dict() for p in user_payments]
-    }), 200
+    bookings = PaymentService.get_payments_by_bookings(
+        booking_ids,
+        user_id=request.current_user.id,
+        as_rows=True
+    )
+    
+    encoder = payment_encoder(current_app.config['PAYMENT_JSON_BACKEND'])
+    return json_response(bookings=encoder.encode({
+        booking_id: encoder.dicts(rows)
+        for booking_id, rows in sorted(bookings.items())
+    }))
 
 
 @payment_bp.route('/<payment_id>/process', methods=['POST'])
 @jwt_required
-@track_request_metrics
 def process_payment(payment_id):
     """Process a pending payment."""
-    payment = PaymentService.get_payment_by_id(payment_id)
-    
-    if not payment:
-        return jsonify({'error': 'Payment not found'}), 404
-    
-    if payment.user_id != request.current_user.id:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    payment, error = PaymentService.process_payment(payment_id)
+    payment, outcome, error = PaymentService.process_payment(
+        payment_id,
+        user_id=request.current_user.id
+    )
     
     if error:
-        track_payment_processed(status='failed')
-        return jsonify({'error': error}), 400
+        if outcome == TransitionOutcome.INVALID_STATE:
+            track_payment_processed(status='failed')
+        return jsonify({'error': error}), TRANSITION_ERROR_CODES[outcome]
     
     # Track metrics
     track_payment_processed(status='completed')
     
     # Publish event if RabbitMQ is enabled
-    if hasattr(current_app, 'rabbitmq'):
-        current_app.rabbitmq.publish_event(
-            PaymentEvents.COMPLETED,
-            payment.to_dict()
-        )
+    publish_payment_event(PaymentEvents.COMPLETED, payment)
     
     return jsonify({
         'message': 'Payment processed successfully',
@@ -161,31 +570,21 @@ def process_payment(payment_id):
 
 @payment_bp.route('/<payment_id>/refund', methods=['POST'])
 @jwt_required
-@track_request_metrics
 def refund_payment(payment_id):
     """Refund a completed payment."""
-    payment = PaymentService.get_payment_by_id(payment_id)
-    
-    if not payment:
-        return jsonify({'error': 'Payment not found'}), 404
-    
-    if payment.user_id != request.current_user.id:
-        return jsonify({'error': 'Unauthorized'}), 403
-    
-    payment, error = PaymentService.refund_payment(payment_id)
+    payment, outcome, error = PaymentService.refund_payment(
+        payment_id,
+        user_id=request.current_user.id
+    )
     
     if error:
-        return jsonify({'error': error}), 400
+        return jsonify({'error': error}), TRANSITION_ERROR_CODES[outcome]
     
     # Track metrics
     track_payment_refunded()
     
     # Publish event if RabbitMQ is enabled
-    if hasattr(current_app, 'rabbitmq'):
-        current_app.rabbitmq.publish_event(
-            PaymentEvents.REFUNDED,
-            payment.to_dict()
-        )
+    publish_payment_event(PaymentEvents.REFUNDED, payment)
     
     return jsonify({
         'message': 'Payment refunded successfully',
@@ -0,0 +1,167 @@
+import asyncio
+import time
+import logging
+from app.services.rabbitmq_service import InMemoryBroker, PartialPublishError, RabbitMQService
+from app.services.metrics_service import (
+    track_event_queue_depth,
+    track_event_batch,
+    track_events_dropped
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AioRabbitMQService:
+    """
+    asyncio RabbitMQ publisher for the ASGI deployment.
+    Handlers enqueue onto a bounded asyncio.Queue; a drain task publishes
+    batches with publisher confirms, awaiting the confirms of a batch
+    together. Uses the same RABBITMQ_* settings as RabbitMQService.
+    """
+    
+    def __init__(self, config, broker=None):
+        self.config = config
+        self.connection = None
+        self.exchange = None
+        
+        if broker is None and config.get('RABBITMQ_BROKER') == 'memory':
+            broker = InMemoryBroker()
+        self.broker = broker
+        
+        self.batch_size = config.get('RABBITMQ_PUBLISH_BATCH_SIZE', 100)
+        self.overflow = config.get('RABBITMQ_PUBLISH_OVERFLOW', 'block')
+        self.block_timeout = config.get('RABBITMQ_PUBLISH_BLOCK_TIMEOUT', 0.1)
+        self.max_retries = config.get('RABBITMQ_PUBLISH_MAX_RETRIES', 3)
+        self.retry_backoff = 0.5
+        self._queue = asyncio.Queue(maxsize=config.get('RABBITMQ_PUBLISH_QUEUE_SIZE', 10000))
+        self._task = None
+    
+    async def start(self):
+        """Connect and start the drain task."""
+        if self.broker is None:
+            import aio_pika
+            
+            self.connection = await aio_pika.connect_robust(
+                host=self.config['RABBITMQ_HOST'],
+                port=self.config['RABBITMQ_PORT'],
+                login=self.config['RABBITMQ_USER'],
+                password=self.config['RABBITMQ_PASSWORD'],
+                virtualhost=self.config['RABBITMQ_VHOST']
+            )
+            channel = await self.connection.channel(
+                publisher_confirms=self.config.get('RABBITMQ_PUBLISHER_CONFIRMS', True)
+            )
+            self.exchange = await channel.declare_exchange(
+                self.config['RABBITMQ_EXCHANGE'],
+                aio_pika.ExchangeType.TOPIC,
+                durable=True
+            )
+            queue = await channel.declare_queue(self.config['RABBITMQ_QUEUE'], durable=True)
+            await queue.bind(self.exchange, routing_key='payment.*')
+            logger.info("Connected to RabbitMQ (asyncio) successfully")
+        
+        self._task = asyncio.create_task(self._drain())
+    
+    async def close(self, timeout=5.0):
+        """Flush queued events, stop the drain task and close the connection."""
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {self._queue.qsize()} unpublished events on shutdown")
+            self._task.cancel()
+        if self.connection is not None:
+            await self.connection.close()
+    
+    def is_connected(self):
+        if self.broker is not None:
+            return self.broker.is_connected()
+        return bool(self.connection and not self.connection.is_closed)
+    
+    async def publish_event(self, event_type, data):
+        """
+        Queue a payment event for publishing.
+        Returns True if queued, False if dropped by the overflow policy.
+        """
+        if not self.config.get('RABBITMQ_ENABLED'):
+            logger.debug("RabbitMQ disabled, skipping event publish")
+            return False
+        
+        event = (event_type, data)
+        try:
+            if self.overflow == 'block':
+                await asyncio.wait_for(self._queue.put(event), self.block_timeout)
+            elif self.overflow == 'drop_oldest' and self._queue.full():
+                self._queue.get_nowait()
+                self._queue.task_done()
+                track_events_dropped()
+                self._queue.put_nowait(event)
+            else:
+                self._queue.put_nowait(event)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            track_events_dropped()
+            logger.warning("Event queue full, dropping event")
+            return False
+        
+        track_event_queue_depth(self._queue.qsize())
+        return True
+    
+    async def _publish_batch(self, events):
+        messages = [(event_type, RabbitMQService._build_message(event_type, data))
+                    for event_type, data in events]
+        
+        if self.broker is not None:
+            return self.broker.publish_batch(messages)
+        
+        import aio_pika
+        
+        results = await asyncio.gather(*(
+            self.exchange.publish(
+                aio_pika.Message(
+                    body.encode('utf-8'),
+                    content_type='application/json',
+                    delivery_mode=aio_pika.DeliveryMode.PERSISTENT
+                ),
+                routing_key=routing_key
+            )
+            for routing_key, body in messages
+        ), return_exceptions=True)
+        failed = [index for index, result in enumerate(results) if isinstance(result, BaseException)]
+        if len(failed) == len(messages):
+            raise results[0]
+        if failed:
+            raise PartialPublishError(failed, results[failed[0]])
+        return len(messages)
+    
+    async def _drain(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            track_event_queue_depth(self._queue.qsize())
+            
+            try:
+                await self._publish_with_retry(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def _publish_with_retry(self, batch):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                await self._publish_batch(batch)
+                track_event_batch(len(batch), time.perf_counter() - start)
+                return True
+            except PartialPublishError as e:
+                # Retrying the confirmed messages would publish them twice
+                logger.error(f"Failed to publish {len(e.failed)} of {len(batch)} events: {e.cause}")
+                track_event_batch(len(batch) - len(e.failed), time.perf_counter() - start)
+                batch = [batch[i] for i in e.failed]
+            except Exception as e:
+                logger.error(f"Failed to publish batch of {len(batch)} events: {e}")
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+        
+        track_events_dropped(len(batch), result='failed')
+        return False
@@ -0,0 +1,139 @@
+from sqlalchemy import select
+from app.models.payment import Payment
+from app.models.user import User, UserIdentity
+from app.models.outbox import OutboxEvent
+from app.models.rollup import PaymentRollup
+from app.services.payment_service import (
+    PaymentService,
+    RowPage,
+    TransitionOutcome,
+    TransitionResult
+)
+from app.services.rabbitmq_service import PaymentEvents
+from app.services.stats_service import StatsService, created_deltas, transition_deltas
+
+
+class AsyncPaymentService:
+    """
+    Async counterparts of the hot PaymentService operations.
+    Methods take an AsyncSession and reuse PaymentService's statements,
+    so both deployment modes issue the same SQL.
+    """
+    
+    @staticmethod
+    async def get_identity(session, auth_user_id, email=None, is_verified=False):
+        """Async User.get_identity: read first, upsert only if claims differ."""
+        row = (await session.execute(User.identity_statement(auth_user_id))).first()
+        if row is not None:
+            identity = UserIdentity(*row)
+            if User.claims_match(identity, email, is_verified):
+                return identity
+        
+        # Every dialect in asgi.ASYNC_DRIVERS supports ON CONFLICT
+        stmt = User.upsert_statement(session.bind.dialect.name, auth_user_id, email, is_verified)
+        row = (await session.execute(stmt)).one()
+        await session.commit()
+        return UserIdentity(*row)
+    
+    @staticmethod
+    async def create_payment(session, user_id, spec, outbox=False):
+        """Create a new payment, staging its outbox event in the same transaction."""
+        payment = Payment(**PaymentService.new_payment_values(user_id, spec))
+        session.add(payment)
+        await session.flush()
+        
+        if outbox:
+            session.add(OutboxEvent.build(PaymentEvents.CREATED, payment.to_dict()))
+        await AsyncPaymentService.increment_rollups(session, created_deltas([payment]))
+        await session.commit()
+        return payment
+    
+    @staticmethod
+    async def increment_rollups(session, deltas):
+        """Async PaymentRollup.increment."""
+        if not deltas:
+            return
+        # Every dialect in asgi.ASYNC_DRIVERS supports ON CONFLICT
+        stmt = PaymentRollup.increment_statement(session.bind.dialect.name, deltas)
+        await session.execute(stmt)
+    
+    @staticmethod
+    async def get_payment_by_id(session, payment_id):
+        """Get payment by payment_id."""
+        return (await session.scalars(
+            select(Payment).where(Payment.payment_id == payment_id)
+        )).first()
+    
+    @staticmethod
+    async def get_payment_rows_by_user(session, user_id, page=1, per_page=20):
+        """Async PaymentService.get_payment_rows_by_user."""
+        page = max(page, 1)
+        per_page = per_page if per_page >= 1 else 20
+        rows = (await session.execute(PaymentService.offset_query(user_id, page, per_page))).all()
+        total = await session.scalar(PaymentService.count_query(user_id))
+        return RowPage(rows, page, per_page, total)
+    
+    @staticmethod
+    async def get_payments_by_user_cursor(session, user_id, limit=20, cursor=None, include_total=False):
+        """Keyset page of a user's payments as rows (see PaymentService.get_payments_by_user_cursor)."""
+        rows = (await session.execute(PaymentService.cursor_query(user_id, limit, cursor, as_rows=True))).all()
+        total = None
+        if include_total:
+            total = await session.scalar(PaymentService.count_query(user_id))
+        return PaymentService.cursor_page(rows, limit, total)
+    
+    @staticmethod
+    async def get_payments_by_bookings(session, booking_ids, user_id):
+        """Async PaymentService.get_payments_by_bookings, as rows."""
+        rows = (await session.execute(PaymentService.bookings_query(booking_ids, user_id, as_rows=True))).all()
+        return PaymentService.group_by_booking(booking_ids, rows)
+    
+    @staticmethod
+    async def stream_rows(session, stmt, chunk_size=1000):
+        """Async PaymentService.stream_rows over AsyncSession.stream()."""
+        result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+    
+    @staticmethod
+    async def get_stats(session, start, end, currency=None, status=None):
+        """Async StatsService.get_stats."""
+        rows = (await session.execute(StatsService.stats_query(start, end, currency, status))).all()
+        return StatsService.stats_dicts(rows)
+    
+    @staticmethod
+    async def transition(session, payment_id, to_status, from_status=None, user_id=None,
+                         event_type=None, invalid_state_error='Payment already {status}',
+                         outbox=False, **values):
+        """Async PaymentService.transition: one UPDATE ... RETURNING per state change."""
+        if from_status is None:
+            from_status = await session.scalar(
+                select(Payment.status).where(Payment.payment_id == payment_id).with_for_update()
+            )
+        
+        stmt = PaymentService.transition_statement(payment_id, to_status, from_status, user_id, **values)
+        payment = (await session.execute(stmt.returning(Payment))).scalar_one_or_none()
+        
+        if payment is None:
+            await session.rollback()
+            row = (await session.execute(
+                select(Payment.status, Payment.user_id).where(Payment.payment_id == payment_id)
+            )).first()
+            return PaymentService.transition_failure(row, user_id, invalid_state_error)
+        
+        if outbox and event_type:
+            session.add(OutboxEvent.build(event_type, payment.to_dict()))
+        await AsyncPaymentService.increment_rollups(session, transition_deltas(payment, from_status))
+        await session.commit()
+        return TransitionResult(payment, TransitionOutcome.OK, None)
+    
+    @staticmethod
+    async def process_payment(session, payment_id, user_id=None, outbox=False):
+        """Mock payment processing: pending -> completed in one statement."""
+        return await AsyncPaymentService.transition(
+            session,
+            payment_id,
+            user_id=user_id,
+            outbox=outbox,
+            **PaymentService.process_transition()
+        )
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from app.services.metrics_service import track_payment_cache
+
+CachedPayment = namedtuple('CachedPayment', ['etag', 'user_id', 'body'])
+
+
+class TTLCache:
+    """
+    Thread-safe, bounded LRU cache with per-entry expiry.
+    Entries past their TTL are dropped lazily on access.
+    """
+    
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Return the cached value or default if missing/expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl=None):
+        """
+        Store a value for ttl seconds (defaults to the cache TTL).
+        Returns the number of entries evicted to stay within max_size.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+    
+    def add(self, key, value, ttl=None):
+        """Store a value only if the key is absent or expired. Returns True if stored."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._entries[key] = (value, now + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class InMemoryStore:
+    """
+    Local fake of a shared key-value store.
+    Implements the subset of the redis-py client used by SharedCache.
+    """
+    
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def get(self, name):
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[name]
+                return None
+            return value
+    
+    def set(self, name, value, ex=None, nx=False):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._values.get(name)
+            if nx and entry is not None and (entry[1] is None or entry[1] > now):
+                return None
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            self._values[name] = (value, now + ex if ex else None)
+            return True
+    
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._values.pop(name, None) is not None for name in names)
+
+
+class SharedCache:
+    """
+    TTLCache-compatible adapter over a shared store (Redis API), so every
+    worker sees the same entries and invalidations. Values are strings.
+    """
+    
+    def __init__(self, client, ttl=300, prefix='payment_service:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+    
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return default
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+    
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl)
+        return 0
+    
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl, nx=True))
+    
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class PaymentCache:
+    """
+    Read-through cache of serialized payments keyed by payment_id.
+    Entries carry an ETag of the payload so unchanged polls can be
+    answered with 304. Reads fill with add() and writes refresh with
+    set(), so a slow reader cannot overwrite a newer transition.
+    """
+    
+    def __init__(self, store):
+        self.store = store
+    
+    @staticmethod
+    def entry(payment):
+        """Serialize a payment into a CachedPayment."""
+        body = json.dumps(payment.to_dict(), separators=(',', ':'), sort_keys=True)
+        etag = hashlib.sha256(body.encode('utf-8')).hexdigest()[:32]
+        return CachedPayment(etag, payment.user_id, body)
+    
+    def get(self, payment_id):
+        """Return the CachedPayment for payment_id or None on a miss."""
+        value = self.store.get(payment_id)
+        if value is None:
+            track_payment_cache('miss')
+            return None
+        
+        track_payment_cache('hit')
+        etag, user_id, body = value.split(' ', 2)
+        return CachedPayment(etag, int(user_id), body)
+    
+    def fill(self, payment):
+        """Cache a payment read from the database unless a newer entry exists."""
+        entry = self.entry(payment)
+        self.store.add(payment.payment_id, self._encode(entry))
+        return entry
+    
+    def refresh(self, payment):
+        """Replace the entry after a write."""
+        entry = self.entry(payment)
+        self.store.set(payment.payment_id, self._encode(entry))
+        return entry
+    
+    def invalidate(self, payment_id):
+        self.store.delete(payment_id)
+    
+    @staticmethod
+    def _encode(entry):
+        return f'{entry.etag} {entry.user_id} {entry.body}'
+
+
+def create_payment_cache(config):
+    """Build the payment cache selected by PAYMENT_CACHE_BACKEND."""
+    backend = config.get('PAYMENT_CACHE_BACKEND', 'local')
+    ttl = config['PAYMENT_CACHE_TTL']
+    if backend == 'local':
+        return PaymentCache(TTLCache(max_size=config['PAYMENT_CACHE_MAX_SIZE'], ttl=ttl))
+    if backend == 'shared':
+        url = config['PAYMENT_CACHE_URL']
+        if url == 'memory':
+            client = InMemoryStore()
+        else:
+            import redis
+            client = redis.Redis.from_url(url)
+        return PaymentCache(SharedCache(client, ttl=ttl))
+    raise ValueError(f'Invalid PAYMENT_CACHE_BACKEND: {backend}')
@@ -0,0 +1,101 @@
+from decimal import Context, Decimal, Inexact, InvalidOperation, Overflow
+
+DEFAULT_EXPONENT = 2
+
+# ISO 4217 minor-unit exponents that differ from the default of 2
+CURRENCY_EXPONENTS = {
+    'BIF': 0, 'CLP': 0, 'DJF': 0, 'GNF': 0, 'ISK': 0, 'JPY': 0, 'KMF': 0,
+    'KRW': 0, 'PYG': 0, 'RWF': 0, 'UGX': 0, 'UYI': 0, 'VND': 0, 'VUV': 0,
+    'XAF': 0, 'XOF': 0, 'XPF': 0,
+    'BHD': 3, 'IQD': 3, 'JOD': 3, 'KWD': 3, 'LYD': 3, 'OMR': 3, 'TND': 3,
+    'CLF': 4, 'UYW': 4
+}
+
+DEFAULT_SCALE = 10 ** DEFAULT_EXPONENT
+# Largest amount whose major-unit float in JSON is still exact; well within BIGINT
+MAX_MINOR_UNITS = 2 ** 53 - 1
+CURRENCY_SCALES = {currency: 10 ** exponent for currency, exponent in CURRENCY_EXPONENTS.items()}
+# Scaling must be exact: signal instead of rounding, overflowing or underflowing
+EXACT_CONTEXT = Context(traps=[Inexact, Overflow, InvalidOperation])
+
+
+def currency_exponent(currency):
+    """Number of minor-unit digits for a currency code."""
+    return CURRENCY_EXPONENTS.get(currency, DEFAULT_EXPONENT)
+
+
+def currency_scale(currency):
+    """Minor units per major unit (10 ** exponent)."""
+    return CURRENCY_SCALES.get(currency, DEFAULT_SCALE)
+
+
+def parse_amount(value):
+    """
+    Parse a JSON amount (int, float or numeric string) into a Decimal
+    without binary rounding. Raises ValueError if it is not a finite number.
+    """
+    if isinstance(value, bool):
+        raise ValueError('Amount must be a number')
+    if isinstance(value, float):
+        # repr() is the shortest string that round-trips, i.e. what the client sent
+        value = repr(value)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValueError('Amount must be a number')
+    if not amount.is_finite():
+        raise ValueError('Amount must be a number')
+    return amount
+
+
+def to_minor_units(amount, currency):
+    """
+    Convert a major-unit amount to integer minor units, exactly.
+    Raises ValueError if it has more decimal places than the currency
+    allows or exceeds MAX_MINOR_UNITS.
+    """
+    return _to_minor(parse_amount(amount), currency_scale(currency), currency)
+
+
+def _to_minor(amount, scale, currency):
+    try:
+        minor = EXACT_CONTEXT.multiply(amount, scale)
+    except Overflow:
+        # e.g. 1e999999999, past Decimal's exponent range
+        raise ValueError('Amount is too large')
+    except Inexact:
+        # Digits lost to precision or underflow, e.g. 1e-999999999
+        minor = None
+    if minor is None or minor != minor.to_integral_value():
+        raise ValueError(f'Amount has more than {currency_exponent(currency)} decimal places for {currency}')
+    if abs(minor) > MAX_MINOR_UNITS:
+        raise ValueError('Amount is too large')
+    return int(minor)
+
+
+def from_minor_units(minor, currency):
+    """
+    Major-unit float for JSON and event payloads. Division by a power of
+    ten is correctly rounded, so the float prints as the exact decimal.
+    """
+    if minor is None:
+        return None
+    return minor / CURRENCY_SCALES.get(currency, DEFAULT_SCALE)
+
+
+def to_minor_units_many(amounts, currencies):
+    """to_minor_units() over parallel sequences, for bulk inserts."""
+    scales = CURRENCY_SCALES
+    result = []
+    for amount, currency in zip(amounts, currencies):
+        result.append(_to_minor(parse_amount(amount), scales.get(currency, DEFAULT_SCALE), currency))
+    return result
+
+
+def from_minor_units_many(minors, currencies):
+    """from_minor_units() over parallel sequences, for bulk reads."""
+    scales = CURRENCY_SCALES
+    return [
+        None if minor is None else minor / scales.get(currency, DEFAULT_SCALE)
+        for minor, currency in zip(minors, currencies)
+    ]
@@ -0,0 +1,149 @@
+"""
+Connection-pool and statement metrics for the SQLAlchemy engines.
+
+The instrumented pools time every checkout (waiting for a free connection
+included) and refresh the checked-out/idle/overflow gauges on each
+checkout and checkin; engine events add connection age, per-statement
+latency by normalized fingerprint, and the slow-query log.
+"""
+import hashlib
+import logging
+import re
+import threading
+from functools import lru_cache
+from time import monotonic, perf_counter
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app.services.metrics_service import DBPoolMetrics, statement_metrics
+
+logger = logging.getLogger(__name__)
+
+_CONNECTED_AT = 'payment_service.connected_at'
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+|\?")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_ROWS = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+_WHITESPACE = re.compile(r"\s+")
+_TABLE = re.compile(r"\b(?:from|into|update|join)\s+\"?(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(sql):
+    """
+    SQL with literals and bind placeholders replaced by ?, IN lists and
+    multi-row VALUES collapsed to a single (?), and whitespace squeezed,
+    so statements differing only in parameters normalize the same.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _VALUE_LIST.sub('(?)', sql)
+    sql = _VALUES_ROWS.sub(r'\1', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+@lru_cache(maxsize=1024)
+def statement_fingerprint(sql):
+    """Short, stable label for a statement: '<verb> <table> <hash>'."""
+    normalized = normalize_statement(sql)
+    verb = normalized.split(' ', 1)[0].lower() if normalized else 'unknown'
+    table = _TABLE.search(normalized)
+    digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:8]
+    return f"{verb} {table.group(1) if table else '-'} {digest}"
+
+
+class _InstrumentedPool:
+    """
+    Checkout timing and pool-state gauges for a QueuePool subclass,
+    recorded once instrument_engine() has set `metrics`.
+    """
+    
+    metrics = None
+    
+    def connect(self):
+        start = perf_counter()
+        connection = super().connect()
+        if self.metrics is not None:
+            self.metrics.checkout_latency.observe(perf_counter() - start)
+            self.track_state()
+        return connection
+    
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        if self.metrics is not None:
+            self.track_state()
+    
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool of the same class
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+    
+    def track_state(self):
+        # overflow() starts at -pool_size and only turns positive past it
+        self.metrics.track_state(self.checkedout(), self.checkedin(), max(0, self.overflow()))
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    """QueuePool exporting checkout latency and pool state."""
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPool, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool exporting checkout latency and pool state."""
+
+
+def instrumented_engine_options(options, is_async=False):
+    """Copy of SQLALCHEMY_ENGINE_OPTIONS using an instrumented pool class."""
+    options = dict(options)
+    options.setdefault('poolclass', InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool)
+    return options
+
+
+def instrument_engine(engine, label, slow_query_ms=0, statements=statement_metrics):
+    """
+    Attach connection-age and statement-latency listeners to a (sync)
+    Engine; pass `async_engine.sync_engine` for an AsyncEngine.
+    Statements slower than `slow_query_ms` (0 disables) are logged with
+    their normalized SQL, never with parameter values.
+    """
+    pool_metrics = DBPoolMetrics(label)
+    if isinstance(engine.pool, _InstrumentedPool):
+        engine.pool.metrics = pool_metrics
+    slow_query_seconds = slow_query_ms / 1000
+    
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info[_CONNECTED_AT] = monotonic()
+    
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connected_at = connection_record.info.get(_CONNECTED_AT)
+        if connected_at is not None:
+            pool_metrics.connection_age.observe(monotonic() - connected_at)
+    
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, so a failed statement leaves nothing behind
+        if context is not None:
+            context.payment_service_query_start = perf_counter()
+    
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, 'payment_service_query_start', None)
+        if start is None:
+            return
+        elapsed = perf_counter() - start
+        slow = bool(slow_query_seconds) and elapsed >= slow_query_seconds
+        fingerprint = statement_fingerprint(statement)
+        statements.observe(fingerprint, elapsed, slow)
+        if slow:
+            logger.warning(
+                'Slow query (%.1f ms, %s, %s engine%s): %s',
+                elapsed * 1000, fingerprint, label,
+                ', executemany' if executemany else '',
+                normalize_statement(statement)
+            )
+    
+    return engine
@@ -0,0 +1,242 @@
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, jsonify, current_app, Response
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.idempotency import IdempotencyKey
+from app.services.cache_service import TTLCache
+
+IN_PROGRESS = 'in_progress'
+COMPLETED = 'completed'
+
+IdempotencyRecord = namedtuple('IdempotencyRecord', ['fingerprint', 'state', 'status_code', 'body'])
+
+
+class MemoryIdempotencyStore:
+    """
+    In-process LRU+TTL idempotency store.
+    Only deduplicates within one worker process; use the database store
+    when running several workers.
+    """
+    
+    def __init__(self, max_keys=100000, ttl=86400):
+        self._records = TTLCache(max_size=max_keys, ttl=ttl)
+        self._cond = threading.Condition()
+    
+    def begin(self, key, fingerprint):
+        """
+        Claim a key for a new request.
+        Returns None if claimed, otherwise the existing IdempotencyRecord.
+        """
+        with self._cond:
+            record = self._records.get(key)
+            if record is not None:
+                return record
+            self._records.set(key, IdempotencyRecord(fingerprint, IN_PROGRESS, None, None))
+            return None
+    
+    def wait(self, key, timeout):
+        """Wait for an in-progress key to complete; returns its record or None."""
+        def settled():
+            record = self._records.get(key)
+            return record is None or record.state != IN_PROGRESS
+        
+        with self._cond:
+            self._cond.wait_for(settled, timeout)
+            return self._records.get(key)
+    
+    def complete(self, key, fingerprint, status_code, body):
+        with self._cond:
+            self._records.set(key, IdempotencyRecord(fingerprint, COMPLETED, status_code, body))
+            self._cond.notify_all()
+    
+    def release(self, key):
+        with self._cond:
+            self._records.delete(key)
+            self._cond.notify_all()
+
+
+class DatabaseIdempotencyStore:
+    """
+    Idempotency store backed by the idempotency_keys table, shared by all
+    workers. A key is claimed with a short committed INSERT, so concurrent
+    duplicates are serialized by the primary key rather than by row locks
+    held for the length of the request.
+    A claim expires after `lease` seconds and complete() extends it to
+    `ttl`, so a worker that dies mid-request only blocks retries until the
+    lease runs out.
+    """
+    
+    PURGE_EVERY = 1000
+    
+    def __init__(self, ttl=86400, lease=60, poll_interval=0.05):
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._claims = 0
+    
+    def _load(self, key):
+        row = db.session.execute(
+            select(
+                IdempotencyKey.fingerprint,
+                IdempotencyKey.state,
+                IdempotencyKey.status_code,
+                IdempotencyKey.response_body,
+                IdempotencyKey.expires_at
+            ).where(IdempotencyKey.key == key)
+        ).first()
+        db.session.commit()
+        return row
+    
+    def begin(self, key, fingerprint):
+        """
+        Claim a key for a new request.
+        Returns None if claimed, otherwise the existing IdempotencyRecord.
+        """
+        now = datetime.utcnow()
+        row = self._load(key)
+        if row is not None:
+            if row.expires_at > now:
+                return IdempotencyRecord(*row[:4])
+            # Expired response or abandoned claim; only if no one took it over since
+            db.session.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.expires_at <= now)
+            )
+        
+        db.session.add(IdempotencyKey(
+            key=key,
+            fingerprint=fingerprint,
+            state=IN_PROGRESS,
+            expires_at=now + timedelta(seconds=self.lease)
+        ))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent duplicate claimed the key first
+            db.session.rollback()
+            row = self._load(key)
+            return IdempotencyRecord(*row[:4]) if row else IdempotencyRecord(fingerprint, IN_PROGRESS, None, None)
+        
+        self._claims += 1
+        if self._claims % self.PURGE_EVERY == 0:
+            self.purge_expired()
+        return None
+    
+    def wait(self, key, timeout):
+        """Poll an in-progress key until it completes; returns its record or None."""
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self._load(key)
+            if row is None or row.state != IN_PROGRESS or time.monotonic() >= deadline:
+                return IdempotencyRecord(*row[:4]) if row else None
+            time.sleep(self.poll_interval)
+    
+    def complete(self, key, fingerprint, status_code, body):
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(
+                state=COMPLETED,
+                status_code=status_code,
+                response_body=body,
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl)
+            )
+        )
+        db.session.commit()
+    
+    def release(self, key):
+        db.session.rollback()
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        db.session.commit()
+    
+    def purge_expired(self):
+        """Bulk delete expired keys."""
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+        db.session.commit()
+
+
+def create_idempotency_store(config):
+    """Build the idempotency store selected by IDEMPOTENCY_BACKEND."""
+    backend = config.get('IDEMPOTENCY_BACKEND', 'memory')
+    if backend == 'database':
+        return DatabaseIdempotencyStore(
+            ttl=config['IDEMPOTENCY_TTL'],
+            lease=config['IDEMPOTENCY_LEASE']
+        )
+    if backend == 'memory':
+        return MemoryIdempotencyStore(
+            max_keys=config['IDEMPOTENCY_MAX_KEYS'],
+            ttl=config['IDEMPOTENCY_TTL']
+        )
+    raise ValueError(f'Invalid IDEMPOTENCY_BACKEND: {backend}')
+
+
+def _replay(record):
+    response = Response(record.body, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response, record.status_code
+
+
+def idempotent(f):
+    """
+    Decorator honouring the Idempotency-Key header.
+    A repeated key replays the stored response without running the view;
+    a duplicate that arrives while the first is running waits for it.
+    Must be applied inside jwt_required.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        store = getattr(current_app, 'idempotency_store', None)
+        
+        if not idempotency_key or store is None:
+            return f(*args, **kwargs)
+        
+        if len(idempotency_key) > 255:
+            return jsonify({
+                'error': 'Idempotency-Key must be at most 255 characters',
+                'code': 'IDEMPOTENCY_KEY_INVALID'
+            }), 400
+        
+        key = f'{request.current_user.id}:{request.endpoint}:{idempotency_key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        
+        record = store.begin(key, fingerprint)
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return jsonify({
+                    'error': 'Idempotency-Key was reused with a different request body',
+                    'code': 'IDEMPOTENCY_KEY_MISMATCH'
+                }), 422
+            
+            if record.state == IN_PROGRESS:
+                record = store.wait(key, current_app.config['IDEMPOTENCY_WAIT_TIMEOUT'])
+            
+            if record is None or record.state == IN_PROGRESS:
+                return jsonify({
+                    'error': 'A request with this Idempotency-Key is still in progress',
+                    'code': 'IDEMPOTENCY_KEY_IN_PROGRESS'
+                }), 409
+            
+            return _replay(record)
+        
+        try:
+            rv = f(*args, **kwargs)
+        except Exception:
+            store.release(key)
+            raise
+        
+        response = current_app.make_response(rv)
+        if response.status_code >= 500:
+            store.release(key)
+        else:
+            store.complete(key, fingerprint, response.status_code, response.get_data(as_text=True))
+        return response, response.status_code
+    
+    return decorated
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+import logging
+import urllib.request
+import jwt
+from app.services.metrics_service import track_jwks
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_jwks(url, timeout=5.0):
+    """GET a JWKS document."""
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+class JWKSClient:
+    """
+    In-memory copy of the auth service's public signing keys.
+    
+    start() fetches the JWKS once, then a daemon thread refetches it every
+    `refresh_interval` seconds. get_key() only reads the in-memory dict, so
+    verifying a token never waits on the network. An unknown kid (a freshly
+    rotated key) wakes the thread for an early refresh, at most once per
+    `min_refresh_interval`; the token itself is rejected.
+    """
+    
+    def __init__(self, url, refresh_interval=300, min_refresh_interval=30, timeout=5.0, fetch=fetch_jwks):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.fetch = fetch
+        
+        self._keys = {}  # kid -> (public key, algorithm)
+        self._last_refresh = 0.0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+    
+    def refresh(self):
+        """Replace the keys with the current JWKS; returns how many were loaded."""
+        self._last_refresh = time.monotonic()
+        try:
+            document = self.fetch(self.url, self.timeout)
+        except Exception:
+            track_jwks('refresh_error')
+            raise
+        
+        keys = {}
+        for jwk in document.get('keys', []):
+            # Only signing keys that name their algorithm: the algorithm
+            # must come from the key, never from the token being checked
+            if jwk.get('use', 'sig') != 'sig' or not jwk.get('kid') or not jwk.get('alg'):
+                continue
+            try:
+                keys[jwk['kid']] = (jwt.PyJWK(jwk).key, jwk['alg'])
+            except (jwt.PyJWKError, jwt.InvalidKeyError) as e:
+                logger.warning("Skipping JWKS key %s: %s", jwk.get('kid'), e)
+        self._keys = keys
+        track_jwks('refresh_ok', len(keys))
+        return len(keys)
+    
+    def run_forever(self):
+        """Refresh in a loop until stop() is called."""
+        failed = not self._keys
+        while not self._stopping.is_set():
+            # Retry a failed fetch sooner than the regular refresh
+            self._wakeup.wait(self.min_refresh_interval if failed else self.refresh_interval)
+            self._wakeup.clear()
+            wait = self._last_refresh + self.min_refresh_interval - time.monotonic()
+            if wait > 0 and self._stopping.wait(wait):
+                break
+            if self._stopping.is_set():
+                break
+            try:
+                self.refresh()
+                failed = False
+            except Exception as e:
+                logger.warning("JWKS refresh from %s failed: %s", self.url, e)
+                failed = True
+    
+    def _start_thread(self):
+        self._pid = os.getpid()
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self.run_forever,
+            name='jwks-refresh',
+            daemon=True
+        )
+        self._thread.start()
+    
+    def start(self):
+        """Load the keys, then keep them fresh from a background daemon thread."""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("JWKS fetch from %s failed, retrying in the background: %s", self.url, e)
+        self._start_thread()
+        return self
+    
+    def stop(self, timeout=5.0):
+        """Stop the refresh loop."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+    
+    def get_key(self, kid):
+        """(public key, algorithm) for a kid, or None. Never touches the network."""
+        if self._pid not in (None, os.getpid()) and not self._stopping.is_set():
+            # A forked worker inherits the keys but not the refresh thread;
+            # a client that was never start()ed gets none
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start_thread()
+        
+        entry = self._keys.get(kid)
+        if entry is None:
+            track_jwks('unknown_kid')
+            if time.monotonic() - self._last_refresh >= self.min_refresh_interval:
+                self._wakeup.set()
+        return entry
+    
+    def __len__(self):
+        return len(self._keys)
@@ -1,11 +1,116 @@
 import jwt
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from flask import current_app
 from functools import wraps
 from flask import request, jsonify
 from app.models.user import User
+from app.services.metrics_service import track_jwt_cache
 from app import db
 
 
+class TokenCache:
+    """
+    Bounded LRU cache of verified JWT payloads.
+    Keyed by a SHA-256 digest of the token; entries expire at the token's exp.
+    """
+    
+    def __init__(self, max_size=10000, max_ttl=300):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+    
+    def get(self, token):
+        """Return cached payload for token or None if missing/expired."""
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    size = len(self._entries)
+                    track_jwt_cache('hit', size)
+                    return payload
+                del self._entries[key]
+            size = len(self._entries)
+        track_jwt_cache('miss', size)
+        return None
+    
+    def set(self, token, payload):
+        """Cache a verified payload until its exp (capped at max_ttl)."""
+        now = time.time()
+        expires_at = now + self.max_ttl
+        exp = payload.get('exp')
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= now:
+            return
+        
+        key = self._key(token)
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            size = len(self._entries)
+        for _ in range(evicted):
+            track_jwt_cache('eviction')
+        track_jwt_cache(size=size)
+    
+    def clear(self):
+        """Drop all cached payloads."""
+        with self._lock:
+            self._entries.clear()
+        track_jwt_cache(size=0)
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class IdentityMap:
+    """
+    Bounded in-process map of auth_user_id -> UserIdentity.
+    Lets jwt_required skip the database while token claims are unchanged.
+    """
+    
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, auth_user_id):
+        with self._lock:
+            identity = self._entries.get(auth_user_id)
+            if identity is not None:
+                self._entries.move_to_end(auth_user_id)
+            return identity
+    
+    def set(self, identity):
+        with self._lock:
+            self._entries[identity.auth_user_id] = identity
+            self._entries.move_to_end(identity.auth_user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+
 class JWTService:
     """Service to handle JWT token verification."""
     
@@ -14,19 +119,63 @@ class JWTService:
         """
         Decode and verify JWT token.
         Returns decoded payload or None if invalid.
+        Verified payloads are served from the token cache when enabled.
         """
+        return JWTService.verify_token(
+            token,
+            current_app.config,
+            getattr(current_app, 'jwt_cache', None),
+            getattr(current_app, 'jwks_client', None)
+        )
+    
+    @staticmethod
+    def verification_key(token, config, jwks=None):
+        """
+        (key, algorithms) to check a token with. Tokens with a `kid` use that
+        key from the cached JWKS and the algorithm it was published with;
+        others use JWT_SECRET_KEY, unless it is empty.
+        """
+        kid = jwt.get_unverified_header(token).get('kid')
+        if kid is not None:
+            entry = jwks.get_key(kid) if jwks is not None else None
+            if entry is None:
+                raise jwt.InvalidTokenError(f'Unknown signing key {kid!r}')
+            key, algorithm = entry
+            return key, [algorithm]
+        if not config['JWT_SECRET_KEY']:
+            raise jwt.InvalidTokenError('Shared-secret tokens are disabled')
+        return config['JWT_SECRET_KEY'], [config['JWT_ALGORITHM']]
+    
+    @staticmethod
+    def verify_token(token, config, cache=None, jwks=None):
+        """Verify a token against app config and `jwks`, using `cache` if given."""
+        if cache is not None:
+            payload = cache.get(token)
+            if payload is not None:
+                return payload
+        
         try:
-            payload = jwt.decode(
-                token,
-                current_app.config['JWT_SECRET_KEY'],
-                algorithms=[current_app.config['JWT_ALGORITHM']]
-            )
+            key, algorithms = JWTService.verification_key(token, config, jwks)
+            payload = jwt.decode(token, key, algorithms=algorithms)
+            if cache is not None:
+                cache.set(token, payload)
             return payload
         except jwt.ExpiredSignatureError:
             return None
         except jwt.InvalidTokenError:
             return None
     
+    @staticmethod
+    def identity_claims(payload):
+        """Return (auth_user_id, email, is_verified) from a payload, or None."""
+        auth_user_id = payload.get('sub') or payload.get('user_id')
+        if not auth_user_id:
+            return None
+        
+        email = payload.get('email')
+        is_verified = bool(payload.get('is_verified', False) or payload.get('verified', False))
+        return str(auth_user_id), email, is_verified
+    
     @staticmethod
     def extract_token_from_header():
         """Extract JWT token from Authorization header."""
@@ -40,20 +189,28 @@ class JWTService:
         """
         Get or create user from token payload.
         Stores user info in database from auth microservice.
+        Returns a UserIdentity; the database is only touched when the
+        identity map has no entry or the token claims differ from it.
         """
-        auth_user_id = payload.get('sub') or payload.get('user_id')
-        if not auth_user_id:
+        claims = JWTService.identity_claims(payload)
+        if claims is None:
             return None
         
-        email = payload.get('email')
-        is_verified = payload.get('is_verified', False) or payload.get('verified', False)
+        auth_user_id, email, is_verified = claims
+        identities = getattr(current_app, 'user_identities', None)
+        if identities is not None:
+            identity = identities.get(auth_user_id)
+            if identity is not None and User.claims_match(identity, email, is_verified):
+                return identity
         
-        user = User.get_or_create(
-            auth_user_id=str(auth_user_id),
+        identity = User.get_identity(
+            auth_user_id=auth_user_id,
             email=email,
             is_verified=is_verified
         )
-        return user
+        if identities is not None:
+            identities.set(identity)
+        return identity
 
 
 def jwt_required(f):
@@ -1,6 +1,16 @@
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
-import time
-from functools import wraps
+from prometheus_client import (
+    Counter,
+    Histogram,
+    Gauge,
+    CollectorRegistry,
+    REGISTRY,
+    generate_latest,
+    CONTENT_TYPE_LATEST
+)
+from prometheus_client import multiprocess
+import os
+import threading
+from time import monotonic, perf_counter_ns
 from flask import request
 
 # Request metrics
@@ -42,49 +52,308 @@ PAYMENT_AMOUNT = Histogram(
     buckets=[10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
 )
 
+# Gauges declare how worker values combine in multiprocess mode (ignored
+# in a single process): livesum adds up the workers that are still alive
 ACTIVE_REQUESTS = Gauge(
     'payment_service_active_requests',
-    'Number of active requests'
+    'Number of active requests',
+    multiprocess_mode='livesum'
 )
 
+# Database pool and statement metrics (see db_metrics_service)
 DB_CONNECTIONS = Gauge(
     'payment_service_db_connections',
-    'Number of database connections'
+    'Database pool connections by state',
+    ['engine', 'state'],  # state: checked_out, idle, overflow
+    multiprocess_mode='livesum'
 )
 
+DB_CHECKOUT_LATENCY = Histogram(
+    'payment_service_db_checkout_latency_seconds',
+    'Time to check a connection out of the pool, including waiting for a free one',
+    ['engine'],
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0]
+)
 
-def track_request_metrics(f):
-    """Decorator to track request metrics."""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        ACTIVE_REQUESTS.inc()
-        start_time = time.time()
+DB_CONNECTION_AGE = Histogram(
+    'payment_service_db_connection_age_seconds',
+    'Age of connections when checked out of the pool',
+    ['engine'],
+    buckets=[1, 10, 30, 60, 120, 300, 600, 1800, 3600]
+)
+
+DB_QUERY_LATENCY = Histogram(
+    'payment_service_db_query_latency_seconds',
+    'Statement execution time by normalized statement fingerprint',
+    ['statement'],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0]
+)
+
+DB_SLOW_QUERIES = Counter(
+    'payment_service_db_slow_queries_total',
+    'Statements slower than DB_SLOW_QUERY_MS',
+    ['statement']
+)
+
+# Auth metrics
+JWT_CACHE_EVENTS = Counter(
+    'payment_service_jwt_cache_events_total',
+    'Verified-token cache lookups and evictions',
+    ['result']  # hit, miss, eviction
+)
+
+JWT_CACHE_SIZE = Gauge(
+    'payment_service_jwt_cache_size',
+    'Number of verified tokens held in the cache',
+    multiprocess_mode='livesum'
+)
+
+JWKS_EVENTS = Counter(
+    'payment_service_jwks_events_total',
+    'JWKS refreshes and lookups of unknown signing keys',
+    ['result']  # refresh_ok, refresh_error, unknown_kid
+)
+
+JWKS_KEYS = Gauge(
+    'payment_service_jwks_keys',
+    'Signing keys loaded from the auth service JWKS',
+    multiprocess_mode='livemin'
+)
+
+PAYMENT_CACHE_EVENTS = Counter(
+    'payment_service_payment_cache_events_total',
+    'Payment read-through cache lookups',
+    ['result']  # hit, miss
+)
+
+PAYMENT_WAITERS = Gauge(
+    'payment_service_payment_waiters',
+    'Long-poll and SSE clients waiting on payment changes',
+    multiprocess_mode='livesum'
+)
+
+# Event publishing metrics
+EVENTS_QUEUE_DEPTH = Gauge(
+    'payment_service_events_queue_depth',
+    'Number of events waiting to be published',
+    multiprocess_mode='livesum'
+)
+
+EVENTS_BATCH_SIZE = Histogram(
+    'payment_service_events_batch_size',
+    'Number of events published per batch',
+    buckets=[1, 2, 5, 10, 25, 50, 100, 250, 500]
+)
+
+EVENTS_CONFIRM_LATENCY = Histogram(
+    'payment_service_events_confirm_latency_seconds',
+    'Time to publish a batch and receive broker confirms',
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0]
+)
+
+EVENTS_PUBLISHED = Counter(
+    'payment_service_events_total',
+    'Events handled by the background publisher',
+    ['result']  # published, dropped, failed
+)
+
+OUTBOX_RELAYED = Counter(
+    'payment_service_outbox_relayed_total',
+    'Outbox events relayed to the broker'
+)
+
+OUTBOX_RELAY_FAILURES = Counter(
+    'payment_service_outbox_relay_failures_total',
+    'Outbox relay batches that failed and will be retried'
+)
+
+OUTBOX_PARKED = Counter(
+    'payment_service_outbox_parked_total',
+    'Outbox events moved to outbox_failed after they could not be relayed'
+)
+
+
+PROFILE_SECONDS = Counter(
+    'payment_service_profile_seconds_total',
+    'Wall time of profiled requests by category (ORM, JWT, serialization, broker, other)',
+    ['endpoint', 'category']
+)
+
+PROFILED_REQUESTS = Counter(
+    'payment_service_profiled_requests_total',
+    'Requests captured by the sampling profiler',
+    ['endpoint']
+)
+
+# Label values outside these sets are folded so request series stay bounded
+KNOWN_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+UNMATCHED_ENDPOINT = 'unmatched'
+OTHER_ENDPOINT = 'other'
+
+
+class _RequestSeries:
+    """Cached REQUEST_LATENCY child and REQUEST_COUNT children of one (method, endpoint)."""
+    __slots__ = ('method', 'endpoint', 'latency', 'counts')
+    
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.latency = REQUEST_LATENCY.labels(method=method, endpoint=endpoint)
+        self.counts = {}
+    
+    def count(self, status_code):
+        counter = self.counts.get(status_code)
+        if counter is None:
+            counter = REQUEST_COUNT.labels(method=self.method, endpoint=self.endpoint, status_code=status_code)
+            self.counts[status_code] = counter
+        return counter
+
+
+class RequestMetrics:
+    """
+    Request count and latency with the label children cached per
+    (method, endpoint), so a request costs one dict lookup, an observe()
+    and an inc() instead of two labels() resolutions.
+    Unknown methods are recorded as OTHER, requests that matched no
+    route as `unmatched`, and endpoints beyond `max_endpoints` as `other`.
+    """
+    
+    def __init__(self, max_endpoints=200):
+        self.max_endpoints = max_endpoints
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, method, endpoint, status_code, latency_ns):
+        """Record one finished request; `latency_ns` from perf_counter_ns()."""
+        if method not in KNOWN_METHODS:
+            method = 'OTHER'
+        series = self._series.get((method, endpoint or UNMATCHED_ENDPOINT))
+        if series is None:
+            series = self._add_series(method, endpoint or UNMATCHED_ENDPOINT)
         
-        try:
-            response = f(*args, **kwargs)
-            status_code = response[1] if isinstance(response, tuple) else 200
-            return response
-        except Exception as e:
-            status_code = 500
-            raise
-        finally:
-            latency = time.time() - start_time
-            endpoint = request.endpoint or 'unknown'
-            
-            REQUEST_COUNT.labels(
-                method=request.method,
-                endpoint=endpoint,
-                status_code=status_code
-            ).inc()
-            
-            REQUEST_LATENCY.labels(
-                method=request.method,
-                endpoint=endpoint
-            ).observe(latency)
-            
-            ACTIVE_REQUESTS.dec()
+        series.latency.observe(latency_ns / 1e9)
+        series.count(status_code).inc()
     
-    return decorated
+    def _add_series(self, method, endpoint):
+        with self._lock:
+            series = self._series.get((method, endpoint))
+            if series is not None:
+                return series
+            if len(self._series) >= self.max_endpoints:
+                # Not cached under `endpoint`, so the map cannot grow past the cap
+                endpoint = OTHER_ENDPOINT
+                series = self._series.get((method, endpoint))
+                if series is not None:
+                    return series
+            series = _RequestSeries(method, endpoint)
+            self._series[(method, endpoint)] = series
+            return series
+
+
+request_metrics = RequestMetrics()
+
+
+# Statement fingerprints past StatementMetrics.max_statements
+OTHER_STATEMENT = 'other'
+
+
+class DBPoolMetrics:
+    """Cached DB_CONNECTIONS, checkout latency and connection age children of one engine."""
+    __slots__ = ('checked_out', 'idle', 'overflow', 'checkout_latency', 'connection_age')
+    
+    def __init__(self, engine):
+        self.checked_out = DB_CONNECTIONS.labels(engine=engine, state='checked_out')
+        self.idle = DB_CONNECTIONS.labels(engine=engine, state='idle')
+        self.overflow = DB_CONNECTIONS.labels(engine=engine, state='overflow')
+        self.checkout_latency = DB_CHECKOUT_LATENCY.labels(engine=engine)
+        self.connection_age = DB_CONNECTION_AGE.labels(engine=engine)
+    
+    def track_state(self, checked_out, idle, overflow):
+        """Track connection pool state."""
+        self.checked_out.set(checked_out)
+        self.idle.set(idle)
+        self.overflow.set(overflow)
+
+
+class StatementMetrics:
+    """
+    Statement latency and slow-query counts with the label children cached
+    per statement fingerprint; fingerprints beyond `max_statements` are
+    recorded as `other`.
+    """
+    
+    def __init__(self, max_statements=200):
+        self.max_statements = max_statements
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, statement, latency, slow=False):
+        """Record one statement execution; `latency` in seconds."""
+        series = self._series.get(statement)
+        if series is None:
+            series = self._add_series(statement)
+        
+        series[0].observe(latency)
+        if slow:
+            series[1].inc()
+    
+    def _add_series(self, statement):
+        with self._lock:
+            series = self._series.get(statement)
+            if series is not None:
+                return series
+            if len(self._series) >= self.max_statements:
+                statement = OTHER_STATEMENT
+                series = self._series.get(statement)
+                if series is not None:
+                    return series
+            series = (
+                DB_QUERY_LATENCY.labels(statement=statement),
+                DB_SLOW_QUERIES.labels(statement=statement)
+            )
+            self._series[statement] = series
+            return series
+
+
+statement_metrics = StatementMetrics()
+
+
+def init_request_metrics(app, metrics=request_metrics):
+    """
+    Record every request of a Flask app from before/after-request hooks.
+    Status comes from the final Response, including error handlers' and
+    aborts'; an exception that escapes Flask counts as 500. Latency ends
+    when the response is returned, before a streamed body is sent.
+    """
+    # State lives in the WSGI environ and each hook resolves the request
+    # proxy once, which keeps the hooks well under 20us per request
+    start_key = 'payment_service.request_start_ns'
+    
+    @app.before_request
+    def start_request_timer():
+        ACTIVE_REQUESTS.inc()
+        request.environ[start_key] = perf_counter_ns()
+    
+    @app.after_request
+    def record_request(response):
+        req = request._get_current_object()
+        start = req.environ.get(start_key)
+        if start is not None:
+            metrics.observe(req.method, req.endpoint, response.status_code, perf_counter_ns() - start)
+            # Recorded; teardown only has to finish the request
+            req.environ[start_key] = None
+        return response
+    
+    @app.teardown_request
+    def finish_request(exc):
+        req = request._get_current_object()
+        if start_key not in req.environ:
+            return
+        start = req.environ.pop(start_key)
+        if start is not None:
+            # after_request never ran: the error propagated out of Flask
+            metrics.observe(req.method, req.endpoint, 500, perf_counter_ns() - start)
+        ACTIVE_REQUESTS.dec()
 
 
 def track_payment_created(amount, currency='USD', payment_method='unknown'):
@@ -93,7 +362,7 @@ def track_payment_created(amount, currency='USD', payment_method='unknown'):
         currency=currency,
         payment_method=payment_method or 'unknown'
     ).inc()
-    PAYMENT_AMOUNT.labels(currency=currency).observe(amount)
+    PAYMENT_AMOUNT.labels(currency=currency).observe(float(amount))
 
 
 def track_payment_processed(status='completed'):
@@ -106,6 +375,109 @@ def track_payment_refunded():
     PAYMENTS_REFUNDED.inc()
 
 
-def get_metrics():
+def track_jwt_cache(result=None, size=None):
+    """Track verified-token cache metric; pass `size` after every change to the cache."""
+    if result is not None:
+        JWT_CACHE_EVENTS.labels(result=result).inc()
+    if size is not None:
+        JWT_CACHE_SIZE.set(size)
+
+
+def track_jwks(result, keys=None):
+    """Track JWKS client metric."""
+    JWKS_EVENTS.labels(result=result).inc()
+    if keys is not None:
+        JWKS_KEYS.set(keys)
+
+
+def track_payment_cache(result):
+    """Track payment cache lookup metric."""
+    PAYMENT_CACHE_EVENTS.labels(result=result).inc()
+
+
+def track_payment_waiters(count):
+    """Track waiting long-poll/SSE clients metric."""
+    PAYMENT_WAITERS.set(count)
+
+
+def track_event_queue_depth(depth):
+    """Track publisher queue depth metric."""
+    EVENTS_QUEUE_DEPTH.set(depth)
+
+
+def track_event_batch(size, latency):
+    """Track a confirmed event batch."""
+    EVENTS_BATCH_SIZE.observe(size)
+    EVENTS_CONFIRM_LATENCY.observe(latency)
+    EVENTS_PUBLISHED.labels(result='published').inc(size)
+
+
+def track_events_dropped(count=1, result='dropped'):
+    """Track events that were dropped or failed to publish."""
+    EVENTS_PUBLISHED.labels(result=result).inc(count)
+
+
+def track_outbox_relayed(count, failed=False, parked=0):
+    """Track outbox relay progress."""
+    if failed:
+        OUTBOX_RELAY_FAILURES.inc()
+    else:
+        OUTBOX_RELAYED.inc(count)
+    if parked:
+        OUTBOX_PARKED.inc(parked)
+
+
+def track_profile(endpoint, timings):
+    """Track a profiled request's time split by category."""
+    PROFILED_REQUESTS.labels(endpoint=endpoint).inc()
+    for category, seconds in timings.items():
+        PROFILE_SECONDS.labels(endpoint=endpoint, category=category).inc(seconds)
+
+
+def multiprocess_enabled():
+    """Whether metrics are shared between worker processes (PROMETHEUS_MULTIPROC_DIR set)."""
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+class MetricsExporter:
+    """
+    Renders the /metrics payload and caches it for `ttl` seconds.
+    In multiprocess mode it merges the metric files of every worker,
+    which gets slower with worker count and restarts, so one thread
+    re-renders at a time while concurrent scrapes get the previous
+    payload instead of waiting.
+    """
+    
+    def __init__(self, ttl=1.0, registry=None):
+        self.ttl = ttl
+        if registry is None:
+            registry = REGISTRY
+            if multiprocess_enabled():
+                registry = CollectorRegistry()
+                multiprocess.MultiProcessCollector(registry)
+        self.registry = registry
+        self._output = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+    
+    def render(self):
+        output = self._output
+        if output is not None and monotonic() < self._expires:
+            return output
+        
+        # Only the first render waits; later ones serve the stale payload
+        if not self._lock.acquire(blocking=output is None):
+            return output
+        try:
+            if self._output is None or monotonic() >= self._expires:
+                self._output = generate_latest(self.registry)
+                self._expires = monotonic() + self.ttl
+            return self._output
+        finally:
+            self._lock.release()
+
+
+def get_metrics(exporter=None):
     """Generate Prometheus metrics output."""
-    return generate_latest(), CONTENT_TYPE_LATEST
+    data = exporter.render() if exporter is not None else generate_latest()
+    return data, CONTENT_TYPE_LATEST
@@ -0,0 +1,212 @@
+import json
+import threading
+import logging
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, update, delete
+from app import db
+from app.models.outbox import OutboxEvent, FailedOutboxEvent
+from app.services.metrics_service import track_outbox_relayed
+from app.services.rabbitmq_service import PartialPublishError
+
+logger = logging.getLogger(__name__)
+
+# Dialects that support SELECT ... FOR UPDATE SKIP LOCKED
+SKIP_LOCKED_DIALECTS = ('postgresql', 'mysql', 'mariadb', 'oracle')
+
+
+def outbox_enabled():
+    """Whether payment events go through the outbox instead of direct publish."""
+    return bool(current_app.config.get('RABBITMQ_ENABLED') and
+                current_app.config.get('OUTBOX_ENABLED'))
+
+
+def record_event(event_type, payment):
+    """
+    Stage a payment event in the outbox as part of the current transaction.
+    The caller must flush the payment first so its generated fields are set.
+    """
+    if outbox_enabled():
+        OutboxEvent.add(event_type, payment.to_dict())
+
+
+def record_events(event_type, payments):
+    """Stage one event per payment with a single multi-row INSERT."""
+    if outbox_enabled() and payments:
+        OutboxEvent.add_many(event_type, [payment.to_dict() for payment in payments])
+
+
+class OutboxRelay:
+    """
+    Streams unsent outbox rows to RabbitMQ in bulk.
+    
+    Each pass walks the outbox by id cursor in batches. Rows are locked with
+    FOR UPDATE SKIP LOCKED where supported so several relays can run side by
+    side; on SQLite run a single relay. A row is deleted (or marked
+    published) only after the broker confirmed it, in the same transaction
+    that held the locks.
+    
+    Rows are relayed in order, so a row the broker keeps rejecting would hold
+    back everything behind it. Undecodable rows are parked in outbox_failed
+    straight away; a rejected row is parked after `max_attempts` tries.
+    Failures while the broker is unreachable do not count as attempts.
+    """
+    
+    def __init__(self, app, rabbitmq, batch_size=500, poll_interval=0.5, delete_sent=True, max_attempts=5):
+        self.app = app
+        self.rabbitmq = rabbitmq
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.delete_sent = delete_sent
+        self.max_attempts = max_attempts
+        
+        self._attempts = {}  # outbox id -> failed deliveries so far
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+    
+    def _select_batch(self, last_id):
+        stmt = select(OutboxEvent.id, OutboxEvent.event_type, OutboxEvent.payload)\
+            .where(OutboxEvent.id > last_id, OutboxEvent.published_at.is_(None))\
+            .order_by(OutboxEvent.id)\
+            .limit(self.batch_size)
+        
+        if db.session.get_bind().dialect.name in SKIP_LOCKED_DIALECTS:
+            stmt = stmt.with_for_update(skip_locked=True)
+        return db.session.execute(stmt).all()
+    
+    def _finish_batch(self, ids):
+        if self.delete_sent:
+            stmt = delete(OutboxEvent).where(OutboxEvent.id.in_(ids))
+        else:
+            stmt = update(OutboxEvent).where(OutboxEvent.id.in_(ids))\
+                .values(published_at=datetime.utcnow())
+        db.session.execute(stmt)
+        if self._attempts:
+            for event_id in ids:
+                self._attempts.pop(event_id, None)
+    
+    def _park(self, row, error, attempts):
+        """Move a row from the outbox to outbox_failed."""
+        self._attempts.pop(row.id, None)
+        db.session.add(FailedOutboxEvent(
+            id=row.id,
+            event_type=row.event_type,
+            payload=row.payload,
+            error=str(error),
+            attempts=attempts
+        ))
+        db.session.execute(delete(OutboxEvent).where(OutboxEvent.id == row.id))
+        logger.error(f"Parked outbox event {row.id} after {attempts} attempts: {error}")
+    
+    def _record_failure(self, row, error):
+        """Count a rejected delivery of `row`; returns True if it was parked."""
+        attempts = self._attempts.get(row.id, 0) + 1
+        if attempts >= self.max_attempts:
+            self._park(row, error, attempts)
+            return True
+        self._attempts[row.id] = attempts
+        return False
+    
+    def relay_once(self):
+        """
+        Relay all currently unsent events.
+        Returns the number of events published; stops at the first failure.
+        """
+        total = 0
+        last_id = 0
+        
+        with self.app.app_context():
+            while True:
+                try:
+                    rows = self._select_batch(last_id)
+                    if not rows:
+                        db.session.commit()
+                        break
+                    
+                    parked = 0
+                    events, pending = [], []
+                    for row in rows:
+                        try:
+                            events.append((row.event_type, json.loads(row.payload)))
+                            pending.append(row)
+                        except ValueError as e:
+                            self._park(row, f'Undecodable payload: {e}', 1)
+                            parked += 1
+                    
+                    failure = None
+                    sent = pending
+                    try:
+                        if events:
+                            self.rabbitmq.publish_batch(events)
+                    except PartialPublishError as e:
+                        failed = set(e.failed)
+                        sent = [row for index, row in enumerate(pending) if index not in failed]
+                        failure = (pending[e.failed[0]], e.cause)
+                    except Exception as e:
+                        sent = []
+                        failure = (pending[0], e)
+                        if not self.rabbitmq.is_connected():
+                            # Broker outage: not the row's fault
+                            raise
+                    
+                    if sent:
+                        self._finish_batch([row.id for row in sent])
+                    if failure and self._record_failure(*failure):
+                        parked += 1
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    track_outbox_relayed(0, failed=True)
+                    logger.error(f"Outbox relay failed, will retry: {e}")
+                    break
+                
+                total += len(sent)
+                track_outbox_relayed(len(sent), parked=parked)
+                if failure:
+                    track_outbox_relayed(0, failed=True)
+                    logger.error(f"Outbox relay failed on event {failure[0].id}, will retry: {failure[1]}")
+                    break
+                
+                last_id = rows[-1].id
+                if len(rows) < self.batch_size:
+                    break
+        
+        return total
+    
+    def wake(self):
+        """
+        Signal that new events were committed.
+        Without a background thread the relay runs inline instead.
+        """
+        if self._thread is None:
+            self.relay_once()
+            return
+        self._wakeup.set()
+    
+    def run_forever(self):
+        """Relay in a loop until stop() is called."""
+        while not self._stopping.is_set():
+            relayed = self.relay_once()
+            if not relayed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+    
+    def start(self):
+        """Run the relay in a background daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self.run_forever,
+            name='outbox-relay',
+            daemon=True
+        )
+        self._thread.start()
+    
+    def stop(self, timeout=5.0):
+        """Stop the relay loop."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
@@ -1,32 +1,188 @@
+import base64
+import json
+import math
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, insert, update, func, tuple_
 from app import db
 from app.models.payment import Payment
+from app.models.rollup import PaymentRollup
+from app.services.outbox_service import record_event, record_events
+from app.services.cache_service import PaymentCache
+from app.services.currency_service import to_minor_units, to_minor_units_many
+from app.services.serialization_service import PAYMENT_COLUMNS
+from app.services.stats_service import created_deltas, transition_deltas
+from app.services.rabbitmq_service import PaymentEvents
 import uuid
 
 
+class TransitionOutcome:
+    """Result codes for a payment status transition."""
+    OK = 'ok'
+    NOT_FOUND = 'not_found'
+    FORBIDDEN = 'forbidden'
+    INVALID_STATE = 'invalid_state'
+
+
+TransitionResult = namedtuple('TransitionResult', ['payment', 'outcome', 'error'])
+
+CursorPage = namedtuple('CursorPage', ['items', 'next_cursor', 'total'])
+
+
+class RowPage(namedtuple('RowPage', ['items', 'page', 'per_page', 'total'])):
+    """Offset page of rows exposing the same fields as a flask-sqlalchemy Pagination."""
+    
+    @property
+    def pages(self):
+        return math.ceil(self.total / self.per_page) if self.total else 0
+    
+    @property
+    def has_next(self):
+        return self.page < self.pages
+    
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+
+def encode_cursor(created_at, id):
+    """Encode a (created_at, id) position as an opaque continuation token."""
+    raw = json.dumps([created_at.isoformat(), id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a continuation token; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def payment_changed(payment):
+    """
+    Announce a committed write: replace the payment's cache entry and
+    wake long-poll/SSE waiters with the new payload.
+    """
+    cache = getattr(current_app, 'payment_cache', None)
+    notifier = getattr(current_app, 'payment_notifier', None)
+    if cache is None and notifier is None:
+        return
+    
+    entry = cache.refresh(payment) if cache is not None else PaymentCache.entry(payment)
+    if notifier is not None:
+        notifier.publish(payment.payment_id, entry)
+
+
 class PaymentService:
     """Service to handle payment operations."""
     
+    @staticmethod
+    def new_payment_values(user_id, spec, amount_minor=None):
+        """
+        Column values for a new pending payment from a create spec.
+        Pass `amount_minor` when already converted from spec['amount'].
+        """
+        currency = spec.get('currency', 'USD')
+        if amount_minor is None:
+            amount_minor = to_minor_units(spec['amount'], currency)
+        
+        return {
+            'payment_id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'booking_id': spec['booking_id'],
+            'amount_minor': amount_minor,
+            'currency': currency,
+            'payment_method': spec.get('payment_method'),
+            'status': 'pending'
+        }
+    
     @staticmethod
     def create_payment(user_id, booking_id, amount, currency='USD', payment_method=None):
         """Create a new payment."""
-        payment = Payment(
-            payment_id=str(uuid.uuid4()),
-            user_id=user_id,
-            booking_id=booking_id,
-            amount=amount,
-            currency=currency,
-            payment_method=payment_method,
-            status='pending'
-        )
+        payment = Payment(**PaymentService.new_payment_values(user_id, {
+            'booking_id': booking_id,
+            'amount': amount,
+            'currency': currency,
+            'payment_method': payment_method
+        }))
         db.session.add(payment)
+        db.session.flush()
+        record_event(PaymentEvents.CREATED, payment)
+        PaymentRollup.increment(created_deltas([payment]))
         db.session.commit()
+        
+        # Prime the cache for the status polls that follow a create
+        payment_changed(payment)
         return payment
     
+    @staticmethod
+    def create_payments_bulk(user_id, specs):
+        """
+        Create many payments with one multi-row INSERT ... RETURNING in a
+        single transaction. `specs` are create_payment keyword dicts.
+        Returns the payments in input order.
+        """
+        minors = to_minor_units_many(
+            [spec['amount'] for spec in specs],
+            [spec.get('currency', 'USD') for spec in specs]
+        )
+        rows = [
+            PaymentService.new_payment_values(user_id, spec, amount_minor)
+            for spec, amount_minor in zip(specs, minors)
+        ]
+        
+        payments = db.session.scalars(
+            insert(Payment).returning(Payment, sort_by_parameter_order=True),
+            rows
+        ).all()
+        record_events(PaymentEvents.CREATED, payments)
+        PaymentRollup.increment(created_deltas(payments))
+        
+        # Detach so the RETURNING values survive commit without refresh SELECTs
+        for payment in payments:
+            db.session.expunge(payment)
+        db.session.commit()
+        return payments
+    
     @staticmethod
     def get_payment_by_id(payment_id):
         """Get payment by payment_id."""
         return Payment.query.filter_by(payment_id=payment_id).first()
     
+    @staticmethod
+    def get_cached_payment(payment_id):
+        """
+        Serialized payment with its ETag, read through the payment cache.
+        Returns a CachedPayment, or None if the payment does not exist.
+        """
+        cache = getattr(current_app, 'payment_cache', None)
+        if cache is not None:
+            entry = cache.get(payment_id)
+            if entry is not None:
+                return entry
+        
+        payment = PaymentService.get_payment_by_id(payment_id)
+        if payment is None:
+            return None
+        if cache is not None:
+            return cache.fill(payment)
+        return PaymentCache.entry(payment)
+    
+    @staticmethod
+    def load_cached_payment(payment_id):
+        """
+        get_cached_payment() for long waits: ends the session's transaction
+        so a waiting request does not hold a pooled connection.
+        """
+        try:
+            return PaymentService.get_cached_payment(payment_id)
+        finally:
+            db.session.rollback()
+    
     @staticmethod
     def get_payments_by_user(user_id, page=1, per_page=20):
         """Get paginated payments for a user."""
@@ -35,59 +191,238 @@ class PaymentService:
             .paginate(page=page, per_page=per_page, error_out=False)
     
     @staticmethod
-    def get_payments_by_booking(booking_id):
-        """Get all payments for a booking."""
-        return Payment.query.filter_by(booking_id=booking_id).all()
+    def get_payment_rows_by_user(user_id, page=1, per_page=20):
+        """
+        Offset page of a user's payments as PAYMENT_COLUMNS rows, skipping
+        ORM object construction. Returns a RowPage.
+        """
+        # Out-of-range values fall back like paginate(error_out=False)
+        page = max(page, 1)
+        per_page = per_page if per_page >= 1 else 20
+        rows = db.session.execute(PaymentService.offset_query(user_id, page, per_page)).all()
+        total = db.session.scalar(PaymentService.count_query(user_id))
+        return RowPage(rows, page, per_page, total)
+    
+    @staticmethod
+    def offset_query(user_id, page, per_page):
+        """SELECT of PAYMENT_COLUMNS for one legacy page, newest first."""
+        return select(*PAYMENT_COLUMNS).where(Payment.user_id == user_id)\
+            .order_by(Payment.created_at.desc())\
+            .limit(per_page).offset((page - 1) * per_page)
+    
+    @staticmethod
+    def count_query(user_id):
+        return select(func.count()).select_from(Payment).where(Payment.user_id == user_id)
     
     @staticmethod
-    def process_payment(payment_id):
+    def get_payments_by_user_cursor(user_id, limit=20, cursor=None, include_total=False, as_rows=False):
         """
-        Mock payment processing.
-        In production, integrate with payment gateway.
+        Get a page of a user's payments using keyset pagination on
+        (created_at, id), newest first. Uses the (user_id, created_at, id)
+        index, so deep pages cost the same as the first one.
+        With as_rows, items are PAYMENT_COLUMNS rows instead of Payments.
         """
-        payment = PaymentService.get_payment_by_id(payment_id)
-        if not payment:
-            return None, 'Payment not found'
+        stmt = PaymentService.cursor_query(user_id, limit, cursor, as_rows)
+        rows = db.session.execute(stmt).all() if as_rows else db.session.scalars(stmt).all()
+        total = db.session.scalar(PaymentService.count_query(user_id)) if include_total else None
+        return PaymentService.cursor_page(rows, limit, total)
+    
+    @staticmethod
+    def cursor_query(user_id, limit, cursor=None, as_rows=False):
+        """SELECT for one keyset page; fetches limit + 1 rows to detect a next page."""
+        stmt = select(*PAYMENT_COLUMNS) if as_rows else select(Payment)
+        stmt = stmt.where(Payment.user_id == user_id)
         
-        if payment.status != 'pending':
-            return None, f'Payment already {payment.status}'
+        if cursor:
+            created_at, id = decode_cursor(cursor)
+            stmt = stmt.where(tuple_(Payment.created_at, Payment.id) < (created_at, id))
         
-        # Mock processing - in production, call payment gateway
-        payment.status = 'processing'
-        db.session.commit()
+        return stmt.order_by(Payment.created_at.desc(), Payment.id.desc()).limit(limit + 1)
+    
+    @staticmethod
+    def cursor_page(rows, limit, total=None):
+        """Build a CursorPage from the rows of cursor_query."""
+        items = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+        return CursorPage(items, next_cursor, total)
+    
+    @staticmethod
+    def get_payments_by_booking(booking_id, user_id=None, as_rows=False):
+        """Get all payments for a booking, optionally only the user's own."""
+        stmt = PaymentService.bookings_query([booking_id], user_id, as_rows)
+        return db.session.execute(stmt).all() if as_rows else db.session.scalars(stmt).all()
+    
+    @staticmethod
+    def get_payments_by_bookings(booking_ids, user_id, as_rows=False):
+        """
+        Resolve several bookings with one IN query.
+        Returns {booking_id: [payments]} with an entry for every requested id.
+        With as_rows, payments are PAYMENT_COLUMNS rows.
+        """
+        stmt = PaymentService.bookings_query(booking_ids, user_id, as_rows)
+        rows = db.session.execute(stmt).all() if as_rows else db.session.scalars(stmt).all()
+        return PaymentService.group_by_booking(booking_ids, rows)
+    
+    @staticmethod
+    def bookings_query(booking_ids, user_id=None, as_rows=False):
+        """SELECT of the payments for some bookings, using the (booking_id, user_id) index."""
+        stmt = select(*PAYMENT_COLUMNS) if as_rows else select(Payment)
+        stmt = stmt.where(Payment.booking_id.in_(booking_ids))
+        if user_id is not None:
+            stmt = stmt.where(Payment.user_id == user_id)
+        return stmt.order_by(Payment.booking_id, Payment.created_at, Payment.id)
+    
+    @staticmethod
+    def group_by_booking(booking_ids, payments):
+        grouped = {booking_id: [] for booking_id in booking_ids}
+        for payment in payments:
+            grouped[payment.booking_id].append(payment)
+        return grouped
+    
+    @staticmethod
+    def export_query(user_id=None, start=None, end=None):
+        """
+        SELECT of PAYMENT_COLUMNS for an export, oldest first, optionally
+        for one user and created_at in [start, end). The range is served by
+        the (user_id, created_at, id) or created_at index.
+        """
+        stmt = select(*PAYMENT_COLUMNS)
+        if user_id is not None:
+            stmt = stmt.where(Payment.user_id == user_id)
+        if start is not None:
+            stmt = stmt.where(Payment.created_at >= start)
+        if end is not None:
+            stmt = stmt.where(Payment.created_at < end)
+        return stmt.order_by(Payment.created_at, Payment.id)
+    
+    @staticmethod
+    def stream_rows(stmt, chunk_size=1000):
+        """
+        Yield the rows of `stmt` in lists of up to `chunk_size`, fetched
+        through a server-side cursor where the driver has one, so memory
+        stays flat however many rows match. Ends the transaction when done
+        or when the consumer stops early.
+        """
+        try:
+            result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+            for rows in result.partitions():
+                yield rows
+        finally:
+            db.session.rollback()
+    
+    @staticmethod
+    def transition(payment_id, to_status, from_status=None, user_id=None,
+                   event_type=None, invalid_state_error='Payment already {status}', **values):
+        """
+        Move a payment to `to_status` with one conditional
+        UPDATE ... WHERE payment_id AND status AND user_id RETURNING *.
+        The expected status and owner live in the WHERE clause, so no prior
+        SELECT is needed and two concurrent transitions cannot both succeed.
+        Failures are classified with a lookup only on the error path.
+        The payment_rollups counters move in the same transaction.
+        """
+        if from_status is None:
+            # The rollups need the previous status; lock the row so it cannot change first
+            from_status = db.session.scalar(
+                select(Payment.status).where(Payment.payment_id == payment_id).with_for_update()
+            )
+        
+        stmt = PaymentService.transition_statement(payment_id, to_status, from_status, user_id, **values)
+        
+        if db.session.get_bind().dialect.update_returning:
+            payment = db.session.execute(stmt.returning(Payment)).scalar_one_or_none()
+        elif db.session.execute(stmt).rowcount:
+            payment = Payment.query.filter_by(payment_id=payment_id).first()
+        else:
+            payment = None
+        
+        if payment is None:
+            db.session.rollback()
+            return PaymentService._transition_failure(payment_id, user_id, invalid_state_error)
+        
+        if event_type:
+            record_event(event_type, payment)
+        PaymentRollup.increment(transition_deltas(payment, from_status))
         
-        # Simulate successful payment
-        payment.status = 'completed'
-        payment.transaction_ref = f'TXN-{uuid.uuid4().hex[:12].upper()}'
+        # Detach so the RETURNING values survive commit without a refresh SELECT
+        db.session.expunge(payment)
         db.session.commit()
         
-        return payment, None
+        payment_changed(payment)
+        return TransitionResult(payment, TransitionOutcome.OK, None)
+    
+    @staticmethod
+    def transition_statement(payment_id, to_status, from_status=None, user_id=None, **values):
+        """Conditional UPDATE guarded by the expected status and owner."""
+        conditions = [Payment.payment_id == payment_id]
+        if from_status is not None:
+            conditions.append(Payment.status == from_status)
+        if user_id is not None:
+            conditions.append(Payment.user_id == user_id)
+        return update(Payment).where(*conditions).values(status=to_status, **values)
+    
+    @staticmethod
+    def _transition_failure(payment_id, user_id, invalid_state_error):
+        """Explain why a conditional transition matched no row."""
+        row = db.session.query(Payment.status, Payment.user_id)\
+            .filter_by(payment_id=payment_id).first()
+        return PaymentService.transition_failure(row, user_id, invalid_state_error)
+    
+    @staticmethod
+    def transition_failure(row, user_id, invalid_state_error):
+        """Classify a failed transition from the payment's (status, user_id) row."""
+        if row is None:
+            return TransitionResult(None, TransitionOutcome.NOT_FOUND, 'Payment not found')
+        if user_id is not None and row.user_id != user_id:
+            return TransitionResult(None, TransitionOutcome.FORBIDDEN, 'Unauthorized')
+        return TransitionResult(
+            None,
+            TransitionOutcome.INVALID_STATE,
+            invalid_state_error.format(status=row.status)
+        )
+    
+    @staticmethod
+    def process_payment(payment_id, user_id=None):
+        """
+        Mock payment processing: pending -> completed in one statement.
+        In production, integrate with payment gateway.
+        """
+        # Mock processing - in production, call payment gateway first
+        return PaymentService.transition(
+            payment_id,
+            user_id=user_id,
+            **PaymentService.process_transition()
+        )
+    
+    @staticmethod
+    def process_transition():
+        """Transition arguments for mock processing (pending -> completed)."""
+        return {
+            'to_status': 'completed',
+            'from_status': 'pending',
+            'event_type': PaymentEvents.COMPLETED,
+            'transaction_ref': f'TXN-{uuid.uuid4().hex[:12].upper()}'
+        }
     
     @staticmethod
     def update_payment_status(payment_id, status, transaction_ref=None):
         """Update payment status."""
-        payment = PaymentService.get_payment_by_id(payment_id)
-        if not payment:
-            return None
-        
-        payment.status = status
-        if transaction_ref:
-            payment.transaction_ref = transaction_ref
-        db.session.commit()
-        return payment
+        values = {'transaction_ref': transaction_ref} if transaction_ref else {}
+        result = PaymentService.transition(payment_id, status, **values)
+        return result.payment
     
     @staticmethod
-    def refund_payment(payment_id):
+    def refund_payment(payment_id, user_id=None):
         """Refund a completed payment."""
-        payment = PaymentService.get_payment_by_id(payment_id)
-        if not payment:
-            return None, 'Payment not found'
-        
-        if payment.status != 'completed':
-            return None, 'Only completed payments can be refunded'
-        
         # Mock refund - in production, call payment gateway
-        payment.status = 'refunded'
-        db.session.commit()
-        
-        return payment, None
+        return PaymentService.transition(
+            payment_id,
+            'refunded',
+            from_status='completed',
+            user_id=user_id,
+            event_type=PaymentEvents.REFUNDED,
+            invalid_state_error='Only completed payments can be refunded'
+        )
@@ -0,0 +1,236 @@
+"""
+Opt-in sampling profiler for individual Flask requests.
+
+A profiled request registers its thread with the process-wide sampler,
+which reads that thread's stack every `interval` seconds from
+sys._current_frames(). When the request ends its samples are attributed
+to ORM, JWT, serialization and broker time and appended to a
+collapsed-stack file per endpoint (flamegraph.pl, speedscope and
+inferno read the format). Nothing here is imported or hooked unless
+PROFILING_ENABLED is set.
+"""
+import hmac
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import request
+from app.services.metrics_service import track_profile
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Module prefixes per category; a sample counts under the innermost frame
+# that matches one, and as 'other' if none does
+CATEGORY_MODULES = (
+    ('jwt', ('jwt', 'cryptography', 'app.services.jwt_service')),
+    ('orm', (
+        'sqlalchemy', 'flask_sqlalchemy', 'sqlite3', 'psycopg2', 'asyncpg', 'aiosqlite',
+        'app.models'
+    )),
+    ('serialization', ('json', 'orjson', 'app.services.serialization_service')),
+    ('broker', (
+        'pika', 'aio_pika', 'aiormq', 'app.services.rabbitmq_service',
+        'app.services.aio_rabbitmq_service', 'app.services.outbox_service'
+    ))
+)
+CATEGORIES = tuple(name for name, _ in CATEGORY_MODULES) + ('other',)
+
+
+def module_category(module):
+    for name, prefixes in CATEGORY_MODULES:
+        for prefix in prefixes:
+            if module == prefix or module.startswith(prefix + '.'):
+                return name
+    return None
+
+
+class RequestProfile:
+    """Stack samples of one request, keyed by root-to-leaf tuples of code objects."""
+    __slots__ = ('thread_id', 'endpoint', 'started', 'duration', 'stacks', 'timings')
+    
+    def __init__(self, thread_id, endpoint):
+        self.thread_id = thread_id
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.duration = None
+        self.stacks = Counter()
+        self.timings = None
+
+
+class SamplingProfiler:
+    """
+    One daemon thread per process samples the stacks of every thread with
+    a running profile and writes finished profiles to
+    `<output_dir>/<endpoint>.<pid>.folded`. The thread sleeps on an event
+    while no profile is running.
+    """
+    
+    def __init__(self, output_dir, interval=0.001, max_depth=128):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_depth = max_depth
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._finished = queue.SimpleQueue()
+        self._frame_info = {}
+        self._thread = None
+    
+    def start(self, endpoint):
+        """Start sampling the calling thread."""
+        profile = RequestProfile(threading.get_ident(), endpoint)
+        with self._lock:
+            self._active[profile.thread_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return profile
+    
+    def stop(self, profile):
+        """
+        Stop sampling and fill in `profile.timings` ({category: seconds},
+        the request's wall time split by sample share); the stacks are
+        written by the sampler thread.
+        """
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+        profile.duration = time.perf_counter() - profile.started
+        
+        categories = Counter()
+        for codes, count in profile.stacks.items():
+            categories[self._stack_category(codes)] += count
+        total = sum(categories.values())
+        profile.timings = {
+            category: profile.duration * count / total
+            for category, count in categories.items()
+        } if total else {}
+        
+        self._finished.put(profile)
+        self._wake.set()
+        return profile
+    
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                # Under the lock, so stop() never sees stacks mid-update
+                sampled = self._sample()
+                if not sampled:
+                    self._wake.clear()
+            self._write_finished()
+            if sampled:
+                time.sleep(self.interval)
+    
+    def _sample(self):
+        if not self._active:
+            return False
+        frames = sys._current_frames()
+        frame_info = self._frame_info
+        for profile in self._active.values():
+            frame = frames.get(profile.thread_id)
+            codes = []
+            while frame is not None and len(codes) < self.max_depth:
+                code = frame.f_code
+                if code not in frame_info:
+                    frame_info[code] = _frame_info(code, frame.f_globals.get('__name__') or '?')
+                codes.append(code)
+                frame = frame.f_back
+            if codes:
+                codes.reverse()
+                profile.stacks[tuple(codes)] += 1
+        return True
+    
+    def _info(self, code):
+        """(collapsed-stack label, category) of a sampled code object."""
+        return self._frame_info.get(code) or _frame_info(code, '?')
+    
+    def _stack_category(self, codes):
+        for code in reversed(codes):
+            category = self._info(code)[1]
+            if category is not None:
+                return category
+        return 'other'
+    
+    def _write_finished(self):
+        while True:
+            try:
+                profile = self._finished.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.write(profile)
+            except OSError:
+                logger.exception('Could not write profile for %s', profile.endpoint)
+    
+    def write(self, profile):
+        """Append a profile's stacks as `frame;frame;frame count` lines."""
+        if not profile.stacks:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f'{profile.endpoint}.{os.getpid()}.folded')
+        lines = [
+            ';'.join(self._info(code)[0] for code in codes) + f' {count}\n'
+            for codes, count in profile.stacks.items()
+        ]
+        with open(path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+
+def _frame_info(code, module):
+    return f'{code.co_qualname} ({module})', module_category(module)
+
+
+def server_timing(timings):
+    """Server-Timing header value for a profile's category timings."""
+    return ', '.join(
+        f'{category};dur={timings[category] * 1000:.2f}'
+        for category in CATEGORIES if category in timings
+    )
+
+
+def init_profiling(app, profiler):
+    """
+    Profile requests of a Flask app that send `X-Profile: <PROFILING_TOKEN>`
+    (those also get a Server-Timing header with the category split), plus
+    a random PROFILING_SAMPLE_RATE fraction of the rest. A profile covers
+    the request up to the returned response, not a streamed body.
+    """
+    token = app.config['PROFILING_TOKEN']
+    sample_rate = app.config['PROFILING_SAMPLE_RATE']
+    endpoints = frozenset(app.config['PROFILING_ENDPOINTS'])
+    profile_key = 'payment_service.profile'
+    
+    @app.before_request
+    def start_profile():
+        req = request._get_current_object()
+        if req.endpoint is None or (endpoints and req.endpoint not in endpoints):
+            return
+        header = req.headers.get(PROFILE_HEADER)
+        requested = bool(token and header) and hmac.compare_digest(header.encode(), token.encode())
+        if requested or (sample_rate and random.random() < sample_rate):
+            req.environ[profile_key] = (profiler.start(req.endpoint), requested)
+    
+    @app.after_request
+    def finish_profile(response):
+        entry = request.environ.pop(profile_key, None)
+        if entry is not None:
+            profile, requested = entry
+            profiler.stop(profile)
+            track_profile(profile.endpoint, profile.timings)
+            if requested:
+                response.headers['Server-Timing'] = server_timing(profile.timings)
+        return response
+    
+    @app.teardown_request
+    def abandon_profile(exc):
+        # after_request never ran: keep the stacks of the failed request
+        entry = request.environ.pop(profile_key, None)
+        if entry is not None:
+            profiler.stop(entry[0])
@@ -0,0 +1,183 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import defaultdict
+from app.services.metrics_service import track_payment_waiters
+
+SSE_KEEPALIVE = ': keepalive\n\n'
+
+
+def format_sse(entry):
+    """Encode a CachedPayment as one server-sent event, identified by its ETag."""
+    return f'id: {entry.etag}\nevent: payment\ndata: {{"payment":{entry.body}}}\n\n'
+
+
+class Subscription:
+    """Mailbox of one thread waiting on a payment; receives CachedPayment entries."""
+    
+    def __init__(self, notifier, payment_id):
+        self.notifier = notifier
+        self.payment_id = payment_id
+        self._queue = queue.SimpleQueue()
+    
+    def deliver(self, entry):
+        self._queue.put(entry)
+    
+    def get(self, timeout):
+        """Next published entry, or None after `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def close(self):
+        self.notifier.unsubscribe(self)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncSubscription(Subscription):
+    """
+    Mailbox of one asyncio task waiting on a payment. Costs a queue
+    rather than a thread; publishers in other threads hand entries over
+    with call_soon_threadsafe.
+    """
+    
+    def __init__(self, notifier, payment_id):
+        super().__init__(notifier, payment_id)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+    
+    def deliver(self, entry):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, entry)
+        except RuntimeError:
+            # Event loop already closed
+            pass
+    
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class PaymentNotifier:
+    """
+    In-process pub/sub of payment changes keyed by payment_id, feeding
+    long-poll and SSE waiters. Only sees writes made by this worker, so
+    waiters also re-read the payment every `recheck_interval` seconds to
+    pick up changes made elsewhere.
+    
+    A waiter on the WSGI app blocks its worker thread for the whole wait,
+    so those requests must also take one of `max_thread_waiters` thread
+    slots; asyncio waiters only count against `max_waiters`.
+    """
+    
+    def __init__(self, max_waiters=10000, recheck_interval=2.0, max_thread_waiters=1):
+        self.max_waiters = max_waiters
+        self.max_thread_waiters = max_thread_waiters
+        self.recheck_interval = recheck_interval
+        self._subscribers = defaultdict(set)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._thread_slots = threading.BoundedSemaphore(max_thread_waiters)
+    
+    def acquire_thread(self):
+        """
+        Reserve a thread slot for a blocking wait without waiting for one.
+        Returns False when max_thread_waiters requests are already waiting;
+        otherwise the caller must release_thread() when done.
+        """
+        return self._thread_slots.acquire(blocking=False)
+    
+    def release_thread(self):
+        self._thread_slots.release()
+    
+    def subscribe(self, payment_id, subscription_class=Subscription):
+        """Register a waiter. Returns None when max_waiters are already waiting."""
+        with self._lock:
+            if self._count >= self.max_waiters:
+                return None
+            subscription = subscription_class(self, payment_id)
+            self._subscribers[payment_id].add(subscription)
+            self._count += 1
+            count = self._count
+        track_payment_waiters(count)
+        return subscription
+    
+    def subscribe_async(self, payment_id):
+        """subscribe() for a coroutine running on an event loop."""
+        return self.subscribe(payment_id, AsyncSubscription)
+    
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.payment_id)
+            if not subscribers or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.payment_id]
+            self._count -= 1
+            count = self._count
+        track_payment_waiters(count)
+    
+    def publish(self, payment_id, entry):
+        """Hand a payment's new CachedPayment entry to its waiters."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(payment_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(entry)
+    
+    def wait_for_change(self, payment_id, etag, timeout, load):
+        """
+        Block until the payment's ETag differs from `etag`.
+        `load()` returns the current entry and is re-run every
+        recheck_interval. Returns the new entry, None on timeout, or
+        False if too many waiters are already held.
+        """
+        subscription = self.subscribe(payment_id)
+        if subscription is None:
+            return False
+        
+        deadline = time.monotonic() + timeout
+        with subscription:
+            while True:
+                entry = load()
+                if entry is None or entry.etag != etag:
+                    return entry
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                entry = subscription.get(min(remaining, self.recheck_interval))
+                if entry is not None and entry.etag != etag:
+                    return entry
+    
+    async def wait_for_change_async(self, payment_id, etag, timeout, load):
+        """wait_for_change() for coroutines; `load` is a coroutine function."""
+        subscription = self.subscribe_async(payment_id)
+        if subscription is None:
+            return False
+        
+        deadline = time.monotonic() + timeout
+        with subscription:
+            while True:
+                entry = await load()
+                if entry is None or entry.etag != etag:
+                    return entry
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                entry = await subscription.get(min(remaining, self.recheck_interval))
+                if entry is not None and entry.etag != etag:
+                    return entry
+    
+    def __len__(self):
+        return self._count
@@ -1,22 +1,273 @@
+import atexit
 import json
+import queue
+import threading
+import time
 import pika
-from pika.exceptions import AMQPConnectionError
+from pika.exceptions import AMQPConnectionError, NackError
+from pika.spec import Basic
 import logging
+from app.services.metrics_service import (
+    track_event_queue_depth,
+    track_event_batch,
+    track_events_dropped
+)
 
 logger = logging.getLogger(__name__)
 
 
+class PartialPublishError(Exception):
+    """
+    Some messages of a batch were confirmed before the rest failed.
+    `failed` holds the indexes of the unconfirmed messages; retry only those.
+    """
+    
+    def __init__(self, failed, cause):
+        super().__init__(f'{len(failed)} messages unconfirmed: {cause}')
+        self.failed = failed
+        self.cause = cause
+
+
+class InMemoryBroker:
+    """
+    In-process stand-in for RabbitMQ.
+    Records published messages; used for tests, benchmarks and local runs.
+    """
+    
+    def __init__(self, confirm_latency=0.0):
+        self.confirm_latency = confirm_latency
+        self.fail_next = 0
+        self.fail_after = None  # accept this many messages of the next batch, then fail
+        self.messages = []
+        self.batches = []
+        self._cond = threading.Condition()
+    
+    def publish_batch(self, messages):
+        """Publish (routing_key, body) pairs, raising if a failure is injected."""
+        with self._cond:
+            if self.fail_next:
+                self.fail_next -= 1
+                raise ConnectionError('In-memory broker unavailable')
+            accepted, self.fail_after = self.fail_after, None
+        
+        if self.confirm_latency:
+            time.sleep(self.confirm_latency)
+        
+        if accepted is not None and accepted < len(messages):
+            messages, failed = messages[:accepted], list(range(accepted, len(messages)))
+        else:
+            failed = None
+        
+        with self._cond:
+            self.messages.extend(messages)
+            self.batches.append(len(messages))
+            self._cond.notify_all()
+        if failed:
+            raise PartialPublishError(failed, ConnectionError('In-memory broker unavailable'))
+        return len(messages)
+    
+    def wait_for(self, count, timeout=5.0):
+        """Block until at least `count` messages were published."""
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.messages) >= count, timeout)
+    
+    def is_connected(self):
+        return True
+    
+    def close(self):
+        pass
+
+
+class AsyncEventPublisher:
+    """
+    Background publisher that drains a bounded queue in batches.
+    Request threads only enqueue; a single daemon thread owns the broker
+    connection, so the AMQP channel is never shared across threads.
+    
+    Overflow policies when the queue is full:
+        block       - wait up to block_timeout, then drop the new event
+        drop_newest - drop the new event immediately
+        drop_oldest - discard the oldest queued event to make room
+    """
+    
+    OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+    
+    def __init__(self, publish_batch, max_queue_size=10000, batch_size=100,
+                 overflow='block', block_timeout=0.1, max_retries=3,
+                 retry_backoff=0.5, on_start=None, on_idle=None, idle_interval=1.0):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f'Invalid overflow policy: {overflow}')
+        
+        self.publish_batch = publish_batch
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_start = on_start
+        self.on_idle = on_idle
+        self.idle_interval = idle_interval
+        
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """Start the publisher thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='event-publisher',
+            daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self, timeout=5.0):
+        """Flush queued events and stop the publisher thread."""
+        self._stopping.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+    
+    def enqueue(self, event):
+        """
+        Queue an event for publishing.
+        Returns True if queued, False if dropped by the overflow policy.
+        """
+        try:
+            if self.overflow == 'block':
+                self._queue.put(event, timeout=self.block_timeout)
+            elif self.overflow == 'drop_newest':
+                self._queue.put_nowait(event)
+            else:
+                self._put_drop_oldest(event)
+        except queue.Full:
+            track_events_dropped()
+            logger.warning("Event queue full, dropping event")
+            return False
+        
+        track_event_queue_depth(self._queue.qsize())
+        return True
+    
+    def _put_drop_oldest(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    track_events_dropped()
+                    logger.warning("Event queue full, dropping oldest event")
+                except queue.Empty:
+                    pass
+    
+    def qsize(self):
+        return self._queue.qsize()
+    
+    def _next_batch(self):
+        """Wait for one event, then take whatever else is ready up to batch_size."""
+        try:
+            batch = [self._queue.get(timeout=self.idle_interval)]
+        except queue.Empty:
+            return []
+        
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _publish_with_retry(self, batch):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                self.publish_batch(batch)
+                track_event_batch(len(batch), time.perf_counter() - start)
+                return True
+            except PartialPublishError as e:
+                # Retrying the confirmed messages would publish them twice
+                logger.error(f"Failed to publish {len(e.failed)} of {len(batch)} events: {e.cause}")
+                track_event_batch(len(batch) - len(e.failed), time.perf_counter() - start)
+                batch = [batch[i] for i in e.failed]
+            except Exception as e:
+                logger.error(f"Failed to publish batch of {len(batch)} events: {e}")
+            if attempt < self.max_retries and not self._stopping.is_set():
+                time.sleep(self.retry_backoff * (2 ** attempt))
+        
+        track_events_dropped(len(batch), result='failed')
+        return False
+    
+    def _run(self):
+        if self.on_start:
+            try:
+                self.on_start()
+            except Exception as e:
+                logger.error(f"Event publisher startup failed: {e}")
+        
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            track_event_queue_depth(self._queue.qsize())
+            
+            if not batch:
+                if self.on_idle:
+                    try:
+                        self.on_idle()
+                    except Exception as e:
+                        logger.error(f"Event publisher idle callback failed: {e}")
+                continue
+            
+            self._publish_with_retry(batch)
+
+
 class RabbitMQService:
     """
     RabbitMQ service for event-driven architecture.
     Enables horizontal scaling and async communication.
+    
+    With RABBITMQ_ASYNC_PUBLISH, publish_event only enqueues and a background
+    AsyncEventPublisher publishes in batches. publish_batch sends a whole
+    batch and then waits once for the broker's confirms, rather than one
+    round trip per message as pika's blocking confirm mode would; if only
+    some messages are acked it raises PartialPublishError and only the
+    unconfirmed ones are retried.
+    RABBITMQ_BROKER=memory swaps the AMQP connection for an InMemoryBroker.
     """
     
-    def __init__(self, config):
+    def __init__(self, config, broker=None, async_publish=None):
         self.config = config
         self.connection = None
         self.channel = None
-        self._connect()
+        self.publisher = None
+        self.confirm_timeout = config.get('RABBITMQ_CONFIRM_TIMEOUT', 30)
+        self._delivery_tag = 0
+        self._pending = {}  # delivery tag -> index in the batch being published
+        self._nacked = []
+        
+        if broker is None and config.get('RABBITMQ_BROKER') == 'memory':
+            broker = InMemoryBroker()
+        self.broker = broker
+        
+        if async_publish is None:
+            async_publish = config.get('RABBITMQ_ASYNC_PUBLISH')
+        
+        if async_publish:
+            self.publisher = AsyncEventPublisher(
+                self.publish_batch,
+                max_queue_size=config.get('RABBITMQ_PUBLISH_QUEUE_SIZE', 10000),
+                batch_size=config.get('RABBITMQ_PUBLISH_BATCH_SIZE', 100),
+                overflow=config.get('RABBITMQ_PUBLISH_OVERFLOW', 'block'),
+                block_timeout=config.get('RABBITMQ_PUBLISH_BLOCK_TIMEOUT', 0.1),
+                max_retries=config.get('RABBITMQ_PUBLISH_MAX_RETRIES', 3),
+                on_start=self._ensure_connection,
+                on_idle=self._process_data_events
+            )
+            self.publisher.start()
+        else:
+            self._ensure_connection()
     
     def _connect(self):
         """Establish connection to RabbitMQ."""
@@ -56,17 +307,133 @@ class RabbitMQService:
                 routing_key='payment.*'
             )
             
+            if self.config.get('RABBITMQ_PUBLISHER_CONFIRMS'):
+                self._enable_confirms()
+            
             logger.info("Connected to RabbitMQ successfully")
         except AMQPConnectionError as e:
             logger.error(f"Failed to connect to RabbitMQ: {e}")
             self.connection = None
             self.channel = None
     
+    def _enable_confirms(self):
+        """
+        Put the channel in confirm mode with our own ack/nack callback.
+        BlockingChannel.confirm_delivery() would make every basic_publish
+        wait for its confirm, so this goes through the underlying channel.
+        """
+        self._delivery_tag = 0
+        self._pending = {}
+        selected = []
+        self.channel._impl.confirm_delivery(
+            ack_nack_callback=self._on_confirm,
+            callback=selected.append
+        )
+        deadline = time.monotonic() + self.confirm_timeout
+        while not selected and time.monotonic() < deadline:
+            self.connection.process_data_events(time_limit=0.1)
+        if not selected:
+            raise AMQPConnectionError('Broker did not enable publisher confirms')
+    
+    def _on_confirm(self, frame):
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in self._pending if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._pending else []
+        for tag in tags:
+            index = self._pending.pop(tag)
+            if isinstance(method, Basic.Nack):
+                self._nacked.append(index)
+    
+    def _wait_for_confirms(self):
+        """Wait for the confirms of the batch just published; returns the failed indexes."""
+        deadline = time.monotonic() + self.confirm_timeout
+        while self._pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.connection.process_data_events(time_limit=min(remaining, 1))
+        
+        # Unconfirmed by the deadline counts as failed
+        failed = sorted(self._nacked + list(self._pending.values()))
+        self._pending = {}
+        self._nacked = []
+        return failed
+    
     def _ensure_connection(self):
         """Ensure connection is alive, reconnect if needed."""
+        if self.broker is not None:
+            return
         if not self.connection or self.connection.is_closed:
             self._connect()
     
+    def _process_data_events(self):
+        """Service AMQP heartbeats while the publisher is idle."""
+        if self.connection and self.connection.is_open:
+            self.connection.process_data_events(time_limit=0)
+    
+    def is_connected(self):
+        """Whether events can currently be delivered to the broker."""
+        if self.broker is not None:
+            return self.broker.is_connected()
+        return bool(self.connection and not self.connection.is_closed)
+    
+    @staticmethod
+    def _build_message(event_type, data):
+        return json.dumps({
+            'event_type': event_type,
+            'data': data
+        })
+    
+    def publish_batch(self, events):
+        """
+        Publish a batch of (event_type, data) events, then wait once for
+        their confirms. Raises on connection failure or broker nack so
+        callers can retry; PartialPublishError if only some were confirmed.
+        """
+        messages = [(event_type, self._build_message(event_type, data))
+                    for event_type, data in events]
+        
+        if self.broker is not None:
+            return self.broker.publish_batch(messages)
+        
+        self._ensure_connection()
+        if not self.channel:
+            raise AMQPConnectionError('No RabbitMQ channel available')
+        
+        properties = pika.BasicProperties(
+            delivery_mode=2,  # Persistent message
+            content_type='application/json'
+        )
+        confirms = self.config.get('RABBITMQ_PUBLISHER_CONFIRMS')
+        try:
+            for index, (routing_key, body) in enumerate(messages):
+                self.channel.basic_publish(
+                    exchange=self.config['RABBITMQ_EXCHANGE'],
+                    routing_key=routing_key,
+                    body=body,
+                    properties=properties
+                )
+                if confirms:
+                    self._delivery_tag += 1
+                    self._pending[self._delivery_tag] = index
+        except Exception:
+            # No confirm is known for any of them: the whole batch is retried
+            self._pending = {}
+            self._nacked = []
+            raise
+        
+        if confirms:
+            failed = self._wait_for_confirms()
+            if len(failed) == len(messages):
+                raise NackError([])
+            if failed:
+                raise PartialPublishError(failed, NackError([]))
+        
+        logger.info(f"Published {len(messages)} events")
+        return len(messages)
+    
     def publish_event(self, event_type, data):
         """
         Publish payment event to RabbitMQ.
@@ -79,36 +446,40 @@ class RabbitMQService:
             logger.debug("RabbitMQ disabled, skipping event publish")
             return False
         
+        if self.publisher is not None:
+            return self.publisher.enqueue((event_type, data))
+        
         try:
-            self._ensure_connection()
-            
-            if not self.channel:
-                logger.error("No RabbitMQ channel available")
-                return False
-            
-            message = json.dumps({
-                'event_type': event_type,
-                'data': data
-            })
-            
-            self.channel.basic_publish(
-                exchange=self.config['RABBITMQ_EXCHANGE'],
-                routing_key=event_type,
-                body=message,
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Persistent message
-                    content_type='application/json'
-                )
-            )
-            
-            logger.info(f"Published event: {event_type}")
+            self.publish_batch([(event_type, data)])
             return True
         except Exception as e:
             logger.error(f"Failed to publish event: {e}")
             return False
     
+    def publish_events(self, events):
+        """
+        Publish several (event_type, data) events as one batch.
+        Returns the number of events queued or published.
+        """
+        if not self.config.get('RABBITMQ_ENABLED'):
+            logger.debug("RabbitMQ disabled, skipping event publish")
+            return 0
+        
+        if self.publisher is not None:
+            return sum(1 for event in events if self.publisher.enqueue(event))
+        
+        try:
+            return self.publish_batch(events)
+        except Exception as e:
+            logger.error(f"Failed to publish {len(events)} events: {e}")
+            return 0
+    
     def close(self):
-        """Close RabbitMQ connection."""
+        """Flush pending events and close RabbitMQ connection."""
+        if self.publisher is not None:
+            self.publisher.stop()
+        if self.broker is not None:
+            self.broker.close()
         if self.connection and not self.connection.is_closed:
             self.connection.close()
             logger.info("RabbitMQ connection closed")
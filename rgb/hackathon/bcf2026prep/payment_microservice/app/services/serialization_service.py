@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+from datetime import datetime
+from functools import lru_cache
+from app.models.payment import Payment
+from app.services.currency_service import CURRENCY_SCALES, DEFAULT_SCALE
+
+try:
+    import orjson
+except ImportError:  # optional fast JSON backend
+    orjson = None
+
+# Payment.to_dict() keys in jsonify's sorted order
+PAYMENT_FIELDS = (
+    'amount', 'booking_id', 'created_at', 'currency', 'id', 'payment_id',
+    'payment_method', 'status', 'transaction_ref', 'updated_at', 'user_id'
+)
+PAYMENT_COLUMNS = tuple(
+    Payment.amount_minor if field == 'amount' else getattr(Payment, field)
+    for field in PAYMENT_FIELDS
+)
+PAYMENT_DATETIME_FIELDS = ('created_at', 'updated_at')
+# amount is selected as amount_minor and converted with the row's currency
+PAYMENT_MINOR_UNIT_FIELDS = {'amount': 'currency'}
+
+JSON_BACKENDS = ('auto', 'orjson', 'json')
+
+# Streaming export formats and their media types
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+class RowEncoder:
+    """
+    JSON encoder for column-projected rows.
+    Builds one function that turns a row tuple into a dict with fixed
+    keys, formatting datetimes and minor-unit amounts like to_dict(), so
+    rows never go through ORM objects. Keys keep the given order, so pass
+    them sorted to match jsonify output. `minor_unit_fields` maps an
+    amount field to the field holding its currency.
+    """
+    
+    def __init__(self, fields, datetime_fields=(), backend='auto', minor_unit_fields=None):
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f'Invalid JSON backend: {backend}')
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'json'
+        if backend == 'orjson' and orjson is None:
+            raise ValueError('JSON backend orjson is not installed')
+        
+        self.fields = tuple(fields)
+        self.backend = backend
+        
+        # orjson formats naive datetimes exactly like isoformat()
+        self.row_to_dict = self._row_converter(
+            self.fields,
+            () if self.backend == 'orjson' else datetime_fields,
+            minor_unit_fields or {}
+        )
+    
+    @staticmethod
+    def _row_converter(fields, datetime_fields, minor_unit_fields):
+        # Values are copied by position; only these fields are reformatted
+        datetime_fields = tuple(field for field in fields if field in datetime_fields)
+        minor_unit_fields = tuple(
+            (field, minor_unit_fields[field]) for field in fields if field in minor_unit_fields
+        )
+        if not datetime_fields and not minor_unit_fields:
+            return lambda row: dict(zip(fields, row))
+        
+        scales = CURRENCY_SCALES
+        
+        def row_to_dict(row):
+            data = dict(zip(fields, row))
+            for field in datetime_fields:
+                value = data[field]
+                if value is not None:
+                    data[field] = value.isoformat()
+            for field, currency_field in minor_unit_fields:
+                value = data[field]
+                if value is not None:
+                    data[field] = value / scales.get(data[currency_field], DEFAULT_SCALE)
+            return data
+        return row_to_dict
+    
+    def dicts(self, rows):
+        row_to_dict = self.row_to_dict
+        return [row_to_dict(row) for row in rows]
+    
+    def encode(self, obj):
+        """Compact JSON text of an already row-converted structure."""
+        if self.backend == 'orjson':
+            return orjson.dumps(obj).decode('utf-8')
+        return json.dumps(obj, separators=(',', ':'), default=_default)
+    
+    def dumps(self, rows):
+        """JSON array of row objects."""
+        return self.encode(self.dicts(rows))
+    
+    def lines(self, rows):
+        """NDJSON text: one compact JSON object per row, newline-terminated."""
+        row_to_dict = self.row_to_dict
+        if self.backend == 'orjson':
+            option = orjson.OPT_APPEND_NEWLINE
+            return b''.join(orjson.dumps(row_to_dict(row), option=option) for row in rows).decode('utf-8')
+        return ''.join(json.dumps(row_to_dict(row), separators=(',', ':'), default=_default) + '\n' for row in rows)
+    
+    def csv_rows(self, rows, header=False):
+        """CSV text of rows in field order; None becomes an empty cell."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if header:
+            writer.writerow(self.fields)
+        row_to_dict = self.row_to_dict
+        writer.writerows(row_to_dict(row).values() for row in rows)
+        return buffer.getvalue()
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+@lru_cache(maxsize=None)
+def payment_encoder(backend='auto'):
+    """Shared RowEncoder for rows selected with PAYMENT_COLUMNS."""
+    return RowEncoder(PAYMENT_FIELDS, PAYMENT_DATETIME_FIELDS, backend, PAYMENT_MINOR_UNIT_FIELDS)
+
+
+def export_writer(export_format, backend='auto'):
+    """
+    (header, encode) for streaming PAYMENT_COLUMNS rows as NDJSON or CSV:
+    send the header once, then encode(rows) per fetched chunk.
+    """
+    if export_format == 'csv':
+        # CSV cells need datetimes as text, which only the json backend formats
+        encoder = payment_encoder('json')
+        return encoder.csv_rows((), header=True), encoder.csv_rows
+    return '', payment_encoder(backend).lines
+
+
+def json_object(**members):
+    """
+    Join pre-encoded JSON values into one object body with sorted keys
+    and a trailing newline, matching jsonify.
+    """
+    return '{' + ','.join(f'"{key}":{value}' for key, value in sorted(members.items())) + '}\n'
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, insert, func, cast, type_coerce
+from app import db
+from app.models.payment import Payment
+from app.models.rollup import PaymentRollup
+from app.services.currency_service import from_minor_units
+
+
+def rollup_key(payment, status=None):
+    """(day, currency, status) rollup row a payment counts under."""
+    return (payment.created_at.date(), payment.currency or '', status or payment.status)
+
+
+def created_deltas(payments):
+    """Rollup deltas for newly created payments."""
+    deltas = defaultdict(lambda: [0, 0])
+    for payment in payments:
+        delta = deltas[rollup_key(payment)]
+        delta[0] += 1
+        delta[1] += payment.amount_minor
+    return deltas
+
+
+def transition_deltas(payment, from_status):
+    """Rollup deltas moving a transitioned payment out of `from_status`."""
+    if from_status is None or from_status == payment.status:
+        return {}
+    return {
+        rollup_key(payment, from_status): (-1, -payment.amount_minor),
+        rollup_key(payment): (1, payment.amount_minor)
+    }
+
+
+def day_column(dialect_name):
+    """Payment.created_at truncated to its day, as a Date expression."""
+    if dialect_name == 'sqlite':
+        # SQLite has no DATE type; date() yields the ISO day string Date expects
+        return type_coerce(func.date(Payment.created_at), db.Date)
+    return cast(Payment.created_at, db.Date)
+
+
+class StatsService:
+    """Reads and rebuilds the payment_rollups aggregates."""
+    
+    @staticmethod
+    def get_stats(start, end, currency=None, status=None):
+        """
+        Rollup rows for days start..end inclusive, as dicts with the amount
+        in major units. Reads only payment_rollups, never payments.
+        """
+        rows = db.session.execute(StatsService.stats_query(start, end, currency, status)).all()
+        return StatsService.stats_dicts(rows)
+    
+    @staticmethod
+    def stats_dicts(rows):
+        """JSON-ready dicts of stats_query rows."""
+        return [{
+            'day': row.day.isoformat(),
+            'currency': row.currency,
+            'status': row.status,
+            'count': row.count,
+            'amount': from_minor_units(row.amount_minor, row.currency)
+        } for row in rows]
+    
+    @staticmethod
+    def stats_query(start, end, currency=None, status=None):
+        stmt = select(
+            PaymentRollup.day,
+            PaymentRollup.currency,
+            PaymentRollup.status,
+            PaymentRollup.count,
+            PaymentRollup.amount_minor
+        ).where(
+            PaymentRollup.day >= start,
+            PaymentRollup.day <= end,
+            # Rows emptied by transitions are kept at zero
+            PaymentRollup.count != 0
+        )
+        if currency is not None:
+            stmt = stmt.where(PaymentRollup.currency == currency)
+        if status is not None:
+            stmt = stmt.where(PaymentRollup.status == status)
+        return stmt.order_by(PaymentRollup.day, PaymentRollup.currency, PaymentRollup.status)
+    
+    @staticmethod
+    def aggregate_query(dialect_name, start, end):
+        """GROUP BY over payments created on days [start, end), using the created_at index."""
+        day = day_column(dialect_name)
+        currency = func.coalesce(Payment.currency, '')
+        return select(
+            day.label('day'),
+            currency.label('currency'),
+            Payment.status,
+            func.count().label('count'),
+            func.sum(Payment.amount_minor).label('amount_minor')
+        ).where(
+            Payment.created_at >= datetime.combine(start, datetime.min.time()),
+            Payment.created_at < datetime.combine(end, datetime.min.time())
+        ).group_by(day, currency, Payment.status)
+    
+    @staticmethod
+    def rebuild(start=None, end=None, days_per_chunk=7):
+        """
+        Recompute the rollups for days start..end (default: all history)
+        from payments, one transaction per `days_per_chunk` days so no
+        long scan or lock competes with live traffic. Counters for those
+        days are replaced, so it also repairs drift. Returns rows written.
+        """
+        if start is None or end is None:
+            first, last = db.session.execute(
+                select(func.min(Payment.created_at), func.max(Payment.created_at))
+            ).one()
+            db.session.rollback()
+            if first is None:
+                return 0
+            start = start or first.date()
+            end = end or last.date()
+        
+        dialect_name = db.session.get_bind().dialect.name
+        written = 0
+        day = start
+        while day <= end:
+            chunk_end = min(day + timedelta(days=days_per_chunk), end + timedelta(days=1))
+            db.session.execute(delete(PaymentRollup).where(
+                PaymentRollup.day >= day,
+                PaymentRollup.day < chunk_end
+            ))
+            rows = db.session.execute(StatsService.aggregate_query(dialect_name, day, chunk_end)).all()
+            if rows:
+                db.session.execute(insert(PaymentRollup), [row._asdict() for row in rows])
+            db.session.commit()
+            
+            written += len(rows)
+            day = chunk_end
+        return written
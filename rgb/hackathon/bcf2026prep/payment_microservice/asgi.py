@@ -0,0 +1,5 @@
+"""ASGI entry point for production deployment with Uvicorn workers."""
+from app.asgi import create_asgi_app
+from config import ProductionConfig
+
+app = create_asgi_app(ProductionConfig)
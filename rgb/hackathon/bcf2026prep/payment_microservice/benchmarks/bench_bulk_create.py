@@ -0,0 +1,70 @@
+"""
+Benchmark: one-by-one POST /api/payments vs POST /api/payments/batch.
+Runs in-process against TestingConfig with an in-memory fake broker.
+
+Usage (from the service root):
+    python -m benchmarks.bench_bulk_create [count] [batch_size]
+"""
+import sys
+import time
+from app import create_app
+from benchmarks.bench_jwt_cache import create_test_token
+from config import TestingConfig
+
+
+class BenchConfig(TestingConfig):
+    RABBITMQ_ENABLED = True
+    RABBITMQ_BROKER = 'memory'
+
+
+def payment_spec(i):
+    return {
+        "booking_id": f"GROUP-{i // 10}",
+        "amount": 25.0 + i % 10,
+        "currency": "USD",
+        "payment_method": "credit_card"
+    }
+
+
+def run_single(client, headers, count):
+    start = time.perf_counter()
+    for i in range(count):
+        response = client.post('/api/payments', json=payment_spec(i), headers=headers)
+        assert response.status_code == 201, response.get_json()
+    return time.perf_counter() - start
+
+
+def run_batch(client, headers, count, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        specs = [payment_spec(i) for i in range(offset, min(offset + batch_size, count))]
+        response = client.post('/api/payments/batch', json={"payments": specs}, headers=headers)
+        assert response.status_code == 201, response.get_json()
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    
+    results = {}
+    for mode in ('single', 'batch'):
+        app = create_app(BenchConfig)
+        client = app.test_client()
+        token = create_test_token(app.config['JWT_SECRET_KEY'], 'bench_user', 'bench@example.com')
+        headers = {'Authorization': f'Bearer {token}'}
+        
+        if mode == 'single':
+            results[mode] = run_single(client, headers, count)
+        else:
+            results[mode] = run_batch(client, headers, count, batch_size)
+        app.rabbitmq.close()
+    
+    print(f"Creating {count} payments")
+    print(f"  one by one        {results['single'] * 1000:9.1f} ms  ({count / results['single']:8.0f} payments/s)")
+    print(f"  batches of {batch_size:<5}  {results['batch'] * 1000:9.1f} ms  ({count / results['batch']:8.0f} payments/s)")
+    print(f"  speedup           {results['single'] / results['batch']:9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
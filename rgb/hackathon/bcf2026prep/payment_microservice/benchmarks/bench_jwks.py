@@ -0,0 +1,70 @@
+"""
+Micro-benchmark for token signature checks with a shared secret vs JWKS keys.
+Times JWTService.verify_token with the verified-token cache off, so every
+call checks the signature. The JWKS comes from an in-process fetch; lookups
+never touch the network either way.
+
+Usage (from the service root):
+    python -m benchmarks.bench_jwks [iterations]
+"""
+import sys
+import time
+import datetime
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+from app.services.jwks_service import JWKSClient
+from app.services.jwt_service import JWTService
+
+SECRET = 'bench-secret-at-least-32-bytes-long'
+CONFIG = {'JWT_SECRET_KEY': SECRET, 'JWT_ALGORITHM': 'HS256'}
+
+
+def payload():
+    return {
+        "sub": "bench_user",
+        "email": "bench@example.com",
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }
+
+
+def signing_keys():
+    """{algorithm: (private key, public JWK)} for EdDSA and ES256."""
+    keys = {}
+    for algorithm, private_key, jwk_type in (
+        ('EdDSA', ed25519.Ed25519PrivateKey.generate(), OKPAlgorithm),
+        ('ES256', ec.generate_private_key(ec.SECP256R1()), ECAlgorithm),
+    ):
+        jwk = jwk_type.to_jwk(private_key.public_key(), as_dict=True)
+        jwk.update(kid=f'bench-{algorithm}', alg=algorithm, use='sig')
+        keys[algorithm] = (private_key, jwk)
+    return keys
+
+
+def run(token, jwks, iterations):
+    """Return mean microseconds per verify_token call."""
+    assert JWTService.verify_token(token, CONFIG, jwks=jwks) is not None
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        JWTService.verify_token(token, CONFIG, jwks=jwks)
+    return (time.perf_counter_ns() - start) / iterations / 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    keys = signing_keys()
+    document = {'keys': [jwk for _, jwk in keys.values()]}
+    jwks = JWKSClient('inprocess', fetch=lambda url, timeout: document)
+    jwks.refresh()
+
+    tokens = {'HS256': jwt.encode(payload(), SECRET, algorithm='HS256')}
+    for algorithm, (private_key, jwk) in keys.items():
+        tokens[algorithm] = jwt.encode(payload(), private_key, algorithm=algorithm, headers={'kid': jwk['kid']})
+
+    print(f"verify_token cost over {iterations} calls, cache off")
+    for algorithm, token in tokens.items():
+        print(f"  {algorithm:<6} {run(token, jwks, iterations):8.1f} us/token")
+
+
+if __name__ == '__main__':
+    main()
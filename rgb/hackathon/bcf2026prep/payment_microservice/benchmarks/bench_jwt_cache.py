@@ -0,0 +1,73 @@
+"""
+Micro-benchmark for the per-request cost of jwt_required.
+Runs in-process against TestingConfig with the verified-token cache on and off.
+
+Usage (from the service root):
+    python -m benchmarks.bench_jwt_cache [iterations]
+"""
+import sys
+import time
+import datetime
+import jwt
+from app import create_app
+from app.services.jwt_service import jwt_required
+from config import TestingConfig
+
+
+def create_test_token(secret, user_id, email, is_verified=True):
+    """Create a test JWT token (simulating auth microservice)."""
+    payload = {
+        "sub": user_id,
+        "email": email,
+        "is_verified": is_verified,
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def make_config(cache_enabled):
+    class BenchConfig(TestingConfig):
+        JWT_CACHE_ENABLED = cache_enabled
+    return BenchConfig
+
+
+@jwt_required
+def protected_view():
+    return 'ok'
+
+
+def run(cache_enabled, iterations):
+    """Return mean microseconds per jwt_required call."""
+    app = create_app(make_config(cache_enabled))
+    token = create_test_token(app.config['JWT_SECRET_KEY'], 'bench_user', 'bench@example.com')
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    # Warm up: create the user row and populate the cache
+    with app.test_request_context('/', headers=headers):
+        protected_view()
+    
+    elapsed = 0
+    for _ in range(iterations):
+        with app.test_request_context('/', headers=headers):
+            start = time.perf_counter_ns()
+            protected_view()
+            elapsed += time.perf_counter_ns() - start
+    return elapsed / iterations / 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    
+    print(f"jwt_required cost over {iterations} requests")
+    results = {}
+    for cache_enabled in (False, True):
+        label = 'cache on' if cache_enabled else 'cache off'
+        results[label] = run(cache_enabled, iterations)
+        print(f"  {label:<10} {results[label]:8.1f} us/request")
+    
+    speedup = results['cache off'] / results['cache on']
+    print(f"  speedup    {speedup:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: per-request cost of request metrics.
+Compares the old decorator's bookkeeping (time.time() and two labels()
+lookups per request) with RequestMetrics.observe(), and times the full
+before/after/teardown hooks of init_request_metrics inside a request
+context, without routing or the test client.
+
+Usage (from the service root):
+    python -m benchmarks.bench_request_metrics [requests]
+"""
+import sys
+import time
+from flask import Flask, Response
+from app.services.metrics_service import (
+    REQUEST_COUNT,
+    REQUEST_LATENCY,
+    RequestMetrics,
+    init_request_metrics
+)
+
+
+def legacy_observe(method, endpoint, status_code, start_time):
+    REQUEST_COUNT.labels(method=method, endpoint=endpoint, status_code=status_code).inc()
+    REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(time.time() - start_time)
+
+
+def timed(fn, requests):
+    fn()
+    start = time.perf_counter_ns()
+    for _ in range(requests):
+        fn()
+    return (time.perf_counter_ns() - start) / requests / 1000
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    metrics = RequestMetrics()
+    
+    app = Flask(__name__)
+    init_request_metrics(app, metrics)
+    before = app.before_request_funcs[None][0]
+    after = app.after_request_funcs[None][0]
+    teardown = app.teardown_request_funcs[None][0]
+    response = Response('ok')
+    
+    def hooks():
+        before()
+        after(response)
+        teardown(None)
+    
+    results = [
+        ('decorator bookkeeping', timed(lambda: legacy_observe('GET', 'bench', 200, time.time()), requests)),
+        ('RequestMetrics.observe', timed(lambda: metrics.observe('GET', 'bench', 200, time.perf_counter_ns()), requests))
+    ]
+    with app.test_request_context('/bench'):
+        results.append(('request hooks (total)', timed(hooks, requests)))
+    
+    print(f"Request metrics overhead ({requests} requests)")
+    for name, us in results:
+        print(f"  {name:<24} {us:6.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: ms per list page, ORM objects + to_dict() vs column-projected
+rows + RowEncoder (stdlib json and, if installed, orjson).
+Runs in-process against TestingConfig; measures query + serialization
+of one keyset page, without HTTP or auth overhead.
+
+Usage (from the service root):
+    python -m benchmarks.bench_serialization [page_size] [pages]
+"""
+import sys
+import time
+from flask import current_app
+from app import create_app, db
+from app.models.user import User
+from app.services.payment_service import PaymentService
+from app.services.serialization_service import payment_encoder, orjson
+from config import TestingConfig
+
+
+def seed(user_id, count):
+    PaymentService.create_payments_bulk(user_id, [{
+        'booking_id': f'BENCH-{i // 4}',
+        'amount': 10.0 + i % 50,
+        'currency': 'USD',
+        'payment_method': 'credit_card'
+    } for i in range(count)])
+
+
+def orm_page(user_id, page_size):
+    page = PaymentService.get_payments_by_user_cursor(user_id, limit=page_size)
+    return current_app.json.dumps({'payments': [p.to_dict() for p in page.items]})
+
+
+def row_page(user_id, page_size, encoder):
+    page = PaymentService.get_payments_by_user_cursor(user_id, limit=page_size, as_rows=True)
+    return encoder.dumps(page.items)
+
+
+def timed(fn, pages):
+    # Warm up statement caches and the encoder once
+    fn()
+    db.session.remove()
+    start = time.perf_counter()
+    for _ in range(pages):
+        fn()
+        db.session.remove()
+    return (time.perf_counter() - start) * 1000 / pages
+
+
+def main():
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    
+    app = create_app(TestingConfig)
+    with app.app_context():
+        user = User.get_identity('bench_user', 'bench@example.com', True)
+        seed(user.id, page_size * 2)
+        
+        results = [('ORM + to_dict()', timed(lambda: orm_page(user.id, page_size), pages))]
+        results.append((
+            'rows + RowEncoder(json)',
+            timed(lambda: row_page(user.id, page_size, payment_encoder('json')), pages)
+        ))
+        if orjson is not None:
+            results.append((
+                'rows + RowEncoder(orjson)',
+                timed(lambda: row_page(user.id, page_size, payment_encoder('orjson')), pages)
+            ))
+    
+    baseline = results[0][1]
+    print(f"Serializing a {page_size}-item page ({pages} pages)")
+    for name, ms in results:
+        print(f"  {name:<26} {ms:7.3f} ms/page  ({baseline / ms:5.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+Load test: p50/p95/p99 latency and throughput of a payment API request mix.
+Virtual users, one thread each, mint tokens like the auth service
+(create_test_token) and drive a weighted create/get/list/process/refund
+mix against the app in-process (create_app on a TestingConfig), or
+against gunicorn/uvicorn subprocesses. The database is a temporary SQLite
+file unless --database is given, and RabbitMQ is replaced by the
+in-memory broker. Results are printed, or written with --output, as JSON
+for regression tracking; --baseline compares against an earlier file.
+
+The in-process target needs nothing extra; the server targets need httpx
+(`pip install httpx`) and gunicorn or uvicorn.
+
+Usage (from the service root):
+    python -m benchmarks.loadtest [--target inprocess|gunicorn|uvicorn] [--concurrency 1,8,32]
+        [--requests 2000] [--mix create=3,get=4,list=2,process=2,refund=1]
+        [--database postgresql://...] [--output run.json] [--baseline main.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from benchmarks.bench_jwt_cache import create_test_token
+from benchmarks.loadtest_asgi import JWT_SECRET, start_server
+
+OPERATIONS = ('create', 'get', 'list', 'process', 'refund')
+DEFAULT_MIX = 'create=3,get=4,list=2,process=2,refund=1'
+TARGET_MODES = {'gunicorn': 'wsgi', 'uvicorn': 'asgi'}
+
+
+def parse_mix(text):
+    """'create=3,get=4' -> {'create': 3, 'get': 4}."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f'Unknown operation {name!r}; expected one of {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class InProcessClient:
+    """Flask test client of a shared app, one per virtual user."""
+    
+    def __init__(self, app):
+        self.client = app.test_client()
+    
+    def request(self, method, path, headers, body=None):
+        response = self.client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.get_json(silent=True)
+    
+    def close(self):
+        pass
+
+
+class HTTPClient:
+    """Keep-alive HTTP connection to a server target, one per virtual user."""
+    
+    def __init__(self, base_url):
+        # Imported here so the in-process target runs without httpx
+        import httpx
+        
+        self.client = httpx.Client(base_url=base_url, timeout=60)
+    
+    def request(self, method, path, headers, body=None):
+        response = self.client.request(method, path, headers=headers, json=body)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+    
+    def close(self):
+        self.client.close()
+
+
+class VirtualUser:
+    """
+    One authenticated user drawing operations from the mix. Operations
+    that need a payment in a given state fall back to one that creates
+    it (refund -> process -> create), so every mix is runnable.
+    """
+    
+    def __init__(self, index, client, mix, seed):
+        token = create_test_token(JWT_SECRET, f'load_user_{index}', f'load{index}@example.com')
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.client = client
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed * 100003 + index)
+        self.pending = []
+        self.completed = []
+        self.created = 0
+    
+    def next_operation(self):
+        operation = self.rng.choices(self.operations, self.weights)[0]
+        if operation == 'refund' and not self.completed:
+            operation = 'process'
+        if operation == 'process' and not self.pending:
+            operation = 'create'
+        if operation == 'get' and not (self.pending or self.completed):
+            operation = 'create'
+        return operation
+    
+    def run(self, operation):
+        """Perform one operation; returns (succeeded, latency seconds)."""
+        if operation == 'create':
+            self.created += 1
+            method, path, body = 'POST', '/api/payments', {
+                'booking_id': f'LOAD-{self.created % 50}',
+                'amount': round(self.rng.uniform(1, 500), 2),
+                'currency': 'USD',
+                'payment_method': 'credit_card'
+            }
+        elif operation == 'get':
+            payment_id = self.rng.choice(self.pending or self.completed)
+            method, path, body = 'GET', f'/api/payments/{payment_id}', None
+        elif operation == 'list':
+            method, path, body = 'GET', '/api/payments?cursor=&limit=20', None
+        elif operation == 'process':
+            method, path, body = 'POST', f'/api/payments/{self.pending.pop()}/process', None
+        else:
+            method, path, body = 'POST', f'/api/payments/{self.completed.pop()}/refund', None
+        
+        start = time.perf_counter()
+        status, payload = self.client.request(method, path, self.headers, body)
+        latency = time.perf_counter() - start
+        ok = status < 400
+        
+        if ok and operation == 'create':
+            self.pending.append(payload['payment']['payment_id'])
+        elif ok and operation == 'process':
+            self.completed.append(path.split('/')[3])
+        return ok, latency
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * fraction // 1))
+    return sorted_values[int(rank) - 1]
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'p50': ms(percentile(latencies, 0.50)),
+        'p95': ms(percentile(latencies, 0.95)),
+        'p99': ms(percentile(latencies, 0.99)),
+        'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'max': ms(latencies[-1]) if latencies else None
+    }
+
+
+def run_level(client_factory, concurrency, requests, mix, seed, warmup):
+    """Run `requests` operations split over `concurrency` users; returns the result dict."""
+    per_user = max(requests // concurrency, 1)
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+    
+    def user_thread(index):
+        client = client_factory()
+        user = VirtualUser(index, client, mix, seed)
+        try:
+            for _ in range(warmup):
+                user.run(user.next_operation())
+            barrier.wait()
+            mine = defaultdict(list)
+            failed = defaultdict(int)
+            for _ in range(per_user):
+                operation = user.next_operation()
+                ok, latency = user.run(operation)
+                mine[operation].append(latency)
+                if not ok:
+                    failed[operation] += 1
+            with lock:
+                for operation, latencies in mine.items():
+                    samples[operation].extend(latencies)
+                for operation, count in failed.items():
+                    errors[operation] += count
+        except BaseException:
+            # Release the other users and the timer instead of deadlocking
+            barrier.abort()
+            raise
+        finally:
+            client.close()
+    
+    threads = [threading.Thread(target=user_thread, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if barrier.broken:
+        raise RuntimeError('A virtual user failed; see the traceback above')
+    
+    every = [latency for latencies in samples.values() for latency in latencies]
+    return {
+        'concurrency': concurrency,
+        'requests': len(every),
+        'errors': sum(errors.values()),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(every) / elapsed, 1),
+        'latency_ms': latency_summary(every),
+        'operations': {
+            operation: {
+                'count': len(samples[operation]),
+                'errors': errors[operation],
+                'throughput_rps': round(len(samples[operation]) / elapsed, 1),
+                'latency_ms': latency_summary(samples[operation])
+            }
+            for operation in OPERATIONS if samples[operation]
+        }
+    }
+
+
+def loadtest_config(database_url):
+    """TestingConfig for the in-process target: given database, in-memory broker."""
+    from config import TestingConfig
+    
+    class LoadTestConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        JWT_SECRET_KEY = JWT_SECRET
+        RABBITMQ_ENABLED = True
+        RABBITMQ_BROKER = 'memory'
+    return LoadTestConfig
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Print p95/throughput change per level; returns False past `max_regression` percent."""
+    previous = {run['concurrency']: run for run in baseline['runs']}
+    within = True
+    for run in results['runs']:
+        old = previous.get(run['concurrency'])
+        if old is None:
+            continue
+        p95 = (run['latency_ms']['p95'] / old['latency_ms']['p95'] - 1) * 100
+        rps = (run['throughput_rps'] / old['throughput_rps'] - 1) * 100
+        regressed = max_regression is not None and (p95 > max_regression or -rps > max_regression)
+        within = within and not regressed
+        print(
+            f"concurrency {run['concurrency']}: p95 {p95:+.1f}%, throughput {rps:+.1f}%"
+            + ('  REGRESSION' if regressed else ''),
+            file=sys.stderr
+        )
+    return within
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--target', choices=('inprocess', 'gunicorn', 'uvicorn'), default='inprocess')
+    parser.add_argument('--concurrency', default='1,8', help='comma-separated virtual user counts')
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured operations per user first')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='operation weights')
+    parser.add_argument('--seed', type=int, default=1, help='seed for the operation sequence')
+    parser.add_argument('--database', help='DATABASE_URL (default: a temporary SQLite file)')
+    parser.add_argument('--workers', type=int, default=2, help='server worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='earlier JSON results to compare against')
+    parser.add_argument('--max-regression', type=float, help='exit 1 if p95 or throughput regress by more percent')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(',')]
+    
+    workdir = tempfile.mkdtemp(prefix='loadtest_')
+    database_url = args.database or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+    process = app = None
+    try:
+        if args.target == 'inprocess':
+            from app import create_app
+            app = create_app(loadtest_config(database_url))
+            client_factory = lambda: InProcessClient(app)
+        else:
+            process, base_url = start_server(
+                TARGET_MODES[args.target], args, workdir,
+                DATABASE_URL=database_url,
+                RABBITMQ_ENABLED='True',
+                RABBITMQ_BROKER='memory'
+            )
+            client_factory = lambda: HTTPClient(base_url)
+        
+        results = {
+            'target': args.target,
+            'database': database_url.split(':', 1)[0],
+            'mix': mix,
+            'seed': args.seed,
+            'environment': environment(),
+            'runs': [
+                run_level(client_factory, concurrency, args.requests, mix, args.seed, args.warmup)
+                for concurrency in levels
+            ]
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if getattr(app, 'outbox_relay', None) is not None:
+            app.outbox_relay.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Load test: concurrency vs latency for the WSGI and ASGI deployments.
+Starts `gunicorn wsgi:app` (gthread workers) and `uvicorn asgi:app` as
+subprocesses, each on its own temporary SQLite file, and drives both
+with the same create/get/list/process mix at increasing concurrency.
+
+Needs gunicorn, uvicorn and httpx (`pip install httpx`).
+
+Usage (from the service root):
+    python -m benchmarks.loadtest_asgi [--levels 1,8,32,64] [--requests 500]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.bench_jwt_cache import create_test_token
+
+JWT_SECRET = 'loadtest-secret-key-for-hs256-signing'
+
+SERVERS = {
+    'wsgi': lambda port, args: [
+        sys.executable, '-m', 'gunicorn', 'wsgi:app',
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers),
+        '--threads', str(args.threads),
+        '--worker-class', 'gthread'
+    ],
+    'asgi': lambda port, args: [
+        sys.executable, '-m', 'uvicorn', 'asgi:app',
+        '--host', '127.0.0.1',
+        '--port', str(port),
+        '--workers', str(args.workers),
+        '--no-access-log'
+    ]
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, args, workdir, **env_overrides):
+    """Start a server subprocess; `env_overrides` replace the default environment."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        FLASK_ENV='production',
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, f'{mode}.db')}",
+        JWT_SECRET_KEY=JWT_SECRET,
+        RABBITMQ_ENABLED='False'
+    )
+    env.update(env_overrides)
+    process = subprocess.Popen(
+        SERVERS[mode](port, args),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    
+    # Imported here: benchmarks.loadtest imports this module for its in-process target
+    import httpx
+    
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'{base_url}/health/live').status_code == 200:
+                return process, base_url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def user_session(client, headers, operations, latencies):
+    """One virtual user cycling create -> get -> list -> process."""
+    payment_id = None
+    for i in range(operations):
+        step = i % 4
+        start = time.perf_counter()
+        if step == 0:
+            response = await client.post('/api/payments', headers=headers, json={
+                'booking_id': f'LOAD-{i}',
+                'amount': 42.0,
+                'currency': 'USD',
+                'payment_method': 'credit_card'
+            })
+            payment_id = response.json()['payment']['payment_id']
+        elif step == 1:
+            response = await client.get(f'/api/payments/{payment_id}', headers=headers)
+        elif step == 2:
+            response = await client.get('/api/payments?cursor=&limit=20', headers=headers)
+        else:
+            response = await client.post(f'/api/payments/{payment_id}/process', headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+
+async def run_level(base_url, concurrency, total_requests):
+    import httpx
+    
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        latencies = []
+        per_user = max(total_requests // concurrency, 4)
+        sessions = []
+        for n in range(concurrency):
+            token = create_test_token(JWT_SECRET, f'load_user_{n}', f'load{n}@example.com')
+            headers = {'Authorization': f'Bearer {token}'}
+            sessions.append(user_session(client, headers, per_user, latencies))
+        
+        start = time.perf_counter()
+        await asyncio.gather(*sessions)
+        elapsed = time.perf_counter() - start
+    
+    latencies.sort()
+    return {
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95)],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'rps': len(latencies) / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--levels', default='1,8,32,64', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=500, help='requests per level')
+    parser.add_argument('--workers', type=int, default=1, help='server worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(',')]
+    
+    workdir = tempfile.mkdtemp(prefix='loadtest_')
+    try:
+        for mode in args.modes.split(','):
+            process, base_url = start_server(mode, args, workdir)
+            try:
+                print(f"{mode}: {' '.join(process.args[2:])}")
+                print(f"  {'concurrency':>11}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'req/s':>8}")
+                for concurrency in levels:
+                    result = asyncio.run(run_level(base_url, concurrency, args.requests))
+                    print(f"  {concurrency:>11}  {result['p50'] * 1000:8.1f}  {result['p95'] * 1000:8.1f}  "
+                          f"{result['p99'] * 1000:8.1f}  {result['rps']:8.0f}")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
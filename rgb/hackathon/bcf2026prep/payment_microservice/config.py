@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,6 +10,17 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key')
     JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+    # Verify EdDSA/ES256 tokens (those with a kid) with the auth service's
+    # public keys; empty JWT_SECRET_KEY then rejects shared-secret tokens
+    JWT_JWKS_URL = os.getenv('JWT_JWKS_URL', '')
+    JWT_JWKS_REFRESH_INTERVAL = float(os.getenv('JWT_JWKS_REFRESH_INTERVAL', 300))
+    JWT_JWKS_MIN_REFRESH_INTERVAL = float(os.getenv('JWT_JWKS_MIN_REFRESH_INTERVAL', 30))
+    JWT_JWKS_TIMEOUT = float(os.getenv('JWT_JWKS_TIMEOUT', 5))
+    JWT_CACHE_ENABLED = os.getenv('JWT_CACHE_ENABLED', 'True').lower() == 'true'
+    JWT_CACHE_MAX_SIZE = int(os.getenv('JWT_CACHE_MAX_SIZE', 10000))
+    JWT_CACHE_MAX_TTL = int(os.getenv('JWT_CACHE_MAX_TTL', 300))
+    USER_CACHE_ENABLED = os.getenv('USER_CACHE_ENABLED', 'True').lower() == 'true'
+    USER_CACHE_MAX_SIZE = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))
     
     # Database
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///payments.db')
@@ -27,6 +39,90 @@ class Config:
     RABBITMQ_VHOST = os.getenv('RABBITMQ_VHOST', '/')
     RABBITMQ_EXCHANGE = os.getenv('RABBITMQ_EXCHANGE', 'payments')
     RABBITMQ_QUEUE = os.getenv('RABBITMQ_QUEUE', 'payment_events')
+    RABBITMQ_BROKER = os.getenv('RABBITMQ_BROKER', 'amqp')  # amqp, memory
+    RABBITMQ_PUBLISHER_CONFIRMS = os.getenv('RABBITMQ_PUBLISHER_CONFIRMS', 'True').lower() == 'true'
+    # Seconds publish_batch waits for a batch's confirms
+    RABBITMQ_CONFIRM_TIMEOUT = float(os.getenv('RABBITMQ_CONFIRM_TIMEOUT', 30))
+    RABBITMQ_ASYNC_PUBLISH = os.getenv('RABBITMQ_ASYNC_PUBLISH', 'True').lower() == 'true'
+    RABBITMQ_PUBLISH_QUEUE_SIZE = int(os.getenv('RABBITMQ_PUBLISH_QUEUE_SIZE', 10000))
+    RABBITMQ_PUBLISH_BATCH_SIZE = int(os.getenv('RABBITMQ_PUBLISH_BATCH_SIZE', 100))
+    RABBITMQ_PUBLISH_OVERFLOW = os.getenv('RABBITMQ_PUBLISH_OVERFLOW', 'block')  # block, drop_newest, drop_oldest
+    RABBITMQ_PUBLISH_BLOCK_TIMEOUT = float(os.getenv('RABBITMQ_PUBLISH_BLOCK_TIMEOUT', 0.1))
+    RABBITMQ_PUBLISH_MAX_RETRIES = int(os.getenv('RABBITMQ_PUBLISH_MAX_RETRIES', 3))
+    
+    # Transactional outbox
+    OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'True').lower() == 'true'
+    # A relay thread in every web worker; off by default because gunicorn
+    # runs several workers and SQLite has no SKIP LOCKED, so run relay.py
+    OUTBOX_RELAY_IN_PROCESS = os.getenv('OUTBOX_RELAY_IN_PROCESS', 'False').lower() == 'true'
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.5))
+    OUTBOX_DELETE_SENT = os.getenv('OUTBOX_DELETE_SENT', 'True').lower() == 'true'
+    # Broker rejections before an event is parked in outbox_failed
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+    
+    # Payments
+    PAYMENT_BATCH_MAX_SIZE = int(os.getenv('PAYMENT_BATCH_MAX_SIZE', 100))
+    PAYMENT_BOOKINGS_MAX_IDS = int(os.getenv('PAYMENT_BOOKINGS_MAX_IDS', 100))
+    PAYMENT_JSON_BACKEND = os.getenv('PAYMENT_JSON_BACKEND', 'auto')  # auto, orjson, json
+    
+    # GET /api/payments/stats, served from the payment_rollups table
+    PAYMENT_STATS_MAX_DAYS = int(os.getenv('PAYMENT_STATS_MAX_DAYS', 366))
+    # Comma-separated auth user ids allowed to read the service-wide stats; empty denies everyone
+    PAYMENT_STATS_USERS = [u.strip() for u in os.getenv('PAYMENT_STATS_USERS', '').split(',') if u.strip()]
+    
+    # GET /api/payments/export
+    PAYMENT_EXPORT_CHUNK_SIZE = int(os.getenv('PAYMENT_EXPORT_CHUNK_SIZE', 1000))
+    # Comma-separated auth user ids allowed to export every user's payments (?scope=all)
+    PAYMENT_EXPORT_ALL_USERS = [u.strip() for u in os.getenv('PAYMENT_EXPORT_ALL_USERS', '').split(',') if u.strip()]
+    
+    # Read-through cache for GET /api/payments/<payment_id>
+    # Off by default: a local cache is per worker, so other workers would
+    # serve a stale status; enable it with the shared backend
+    PAYMENT_CACHE_ENABLED = os.getenv('PAYMENT_CACHE_ENABLED', 'False').lower() == 'true'
+    PAYMENT_CACHE_BACKEND = os.getenv('PAYMENT_CACHE_BACKEND', 'local')  # local, shared
+    PAYMENT_CACHE_URL = os.getenv('PAYMENT_CACHE_URL', 'redis://localhost:6379/0')  # or memory
+    PAYMENT_CACHE_TTL = int(os.getenv('PAYMENT_CACHE_TTL', 5))
+    PAYMENT_CACHE_MAX_SIZE = int(os.getenv('PAYMENT_CACHE_MAX_SIZE', 10000))
+    
+    # Long-poll (?wait=) and SSE (/events) for payment changes
+    PAYMENT_EVENTS_ENABLED = os.getenv('PAYMENT_EVENTS_ENABLED', 'True').lower() == 'true'
+    PAYMENT_WAIT_MAX = float(os.getenv('PAYMENT_WAIT_MAX', 30))
+    PAYMENT_EVENTS_KEEPALIVE = float(os.getenv('PAYMENT_EVENTS_KEEPALIVE', 15))
+    PAYMENT_EVENTS_MAX_DURATION = float(os.getenv('PAYMENT_EVENTS_MAX_DURATION', 300))
+    PAYMENT_EVENTS_MAX_WAITERS = int(os.getenv('PAYMENT_EVENTS_MAX_WAITERS', 10000))
+    # Under wsgi:app each waiter holds a worker thread: keep this below
+    # gunicorn --threads so ordinary requests still get one
+    PAYMENT_EVENTS_MAX_THREAD_WAITERS = int(os.getenv('PAYMENT_EVENTS_MAX_THREAD_WAITERS', 1))
+    PAYMENT_EVENTS_RECHECK_INTERVAL = float(os.getenv('PAYMENT_EVENTS_RECHECK_INTERVAL', 2))
+    
+    # Idempotency-Key support on payment creation
+    IDEMPOTENCY_ENABLED = os.getenv('IDEMPOTENCY_ENABLED', 'True').lower() == 'true'
+    IDEMPOTENCY_BACKEND = os.getenv('IDEMPOTENCY_BACKEND', 'memory')  # memory, database
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+    # Seconds an unfinished request holds its key; keep above the worker timeout
+    IDEMPOTENCY_LEASE = int(os.getenv('IDEMPOTENCY_LEASE', 60))
+    IDEMPOTENCY_MAX_KEYS = int(os.getenv('IDEMPOTENCY_MAX_KEYS', 100000))
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 5))
+    
+    # Connection-pool and per-statement metrics (see db_metrics_service)
+    DB_METRICS_ENABLED = os.getenv('DB_METRICS_ENABLED', 'True').lower() == 'true'
+    # Log statements slower than this many milliseconds; 0 disables the log
+    DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 500))
+    
+    # Sampling profiler for Flask requests (see profiling_service)
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+    # Requests sending `X-Profile: <token>` are always profiled; empty disables the header
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+    PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', 1))
+    # Comma-separated endpoints to profile (e.g. payments.create_payment); empty profiles all
+    PROFILING_ENDPOINTS = [e.strip() for e in os.getenv('PROFILING_ENDPOINTS', '').split(',') if e.strip()]
+    PROFILING_DIR = os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'payment_service_profiles'))
+    
+    # Seconds a rendered /metrics payload is reused; under gunicorn the
+    # payload merges every worker (see gunicorn.conf.py)
+    METRICS_CACHE_TTL = float(os.getenv('METRICS_CACHE_TTL', 1))
     
     # Service
     SERVICE_NAME = os.getenv('SERVICE_NAME', 'payment-service')
@@ -38,6 +134,9 @@ class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
     SQLALCHEMY_ECHO = True
+    # Single-process dev server: relay in process unless told otherwise
+    OUTBOX_RELAY_IN_PROCESS = os.getenv('OUTBOX_RELAY_IN_PROCESS', 'True').lower() == 'true'
+    PAYMENT_CACHE_ENABLED = os.getenv('PAYMENT_CACHE_ENABLED', 'True').lower() == 'true'
 
 
 class ProductionConfig(Config):
@@ -47,8 +146,10 @@ class ProductionConfig(Config):
     SQLALCHEMY_ENGINE_OPTIONS = {
         'pool_pre_ping': True,
         'pool_recycle': 300,
-        'pool_size': 10,
-        'max_overflow': 20,
+        # Size from payment_service_db_connections and the checkout latency histogram
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
     }
 
 
@@ -56,6 +157,8 @@ class TestingConfig(Config):
     """Testing configuration."""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    OUTBOX_RELAY_IN_PROCESS = True
+    PAYMENT_CACHE_ENABLED = True
 
 
 config = {
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings, loaded automatically from the service root.
+
+Turns on Prometheus multiprocess mode so /metrics reports the sum of all
+workers rather than whichever one answered the scrape. Set
+METRICS_MULTIPROCESS=false to keep per-worker metrics.
+"""
+import os
+import shutil
+import tempfile
+
+# Directory created for this master; removed again on exit
+_metrics_dir = None
+
+# Must be set before any worker imports prometheus_client
+if os.getenv('METRICS_MULTIPROCESS', 'True').lower() == 'true' and not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    # A fresh directory per master, so a second gunicorn neither shares nor wipes it
+    _metrics_dir = tempfile.mkdtemp(prefix=f'payment_service_metrics_{os.getpid()}_')
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = _metrics_dir
+
+
+def on_starting(server):
+    """
+    Start from an empty metrics directory; files left by a previous run
+    would be summed in. Only an explicitly configured directory can hold
+    such files, and it must not be shared with another running server.
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path and path != _metrics_dir:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def on_exit(server):
+    if _metrics_dir:
+        shutil.rmtree(_metrics_dir, ignore_errors=True)
+
+
+def child_exit(server, worker):
+    """Stop counting an exited worker in the livesum gauges; its counters stay in the totals."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Not via app.services: the master never imports the app
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
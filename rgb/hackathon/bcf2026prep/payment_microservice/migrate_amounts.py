@@ -0,0 +1,119 @@
+"""
+One-off migration: payments.amount (float) -> payments.amount_minor (integer
+minor units of the row's currency). Safe to re-run.
+
+Usage (from the service root, with the service's DATABASE_URL):
+    python migrate_amounts.py                 # add + backfill amount_minor
+    python migrate_amounts.py --drop-amount   # then drop the old column
+
+Run without --drop-amount first and deploy; drop the float column once no
+running worker still reads it. The first run also makes amount nullable:
+the new model no longer writes it, so inserts would otherwise fail.
+"""
+import argparse
+import logging
+import re
+from sqlalchemy import inspect, text
+from app import create_app, db
+from app.services.currency_service import CURRENCY_SCALES, DEFAULT_SCALE
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('migrate_amounts')
+
+
+def payment_columns(conn):
+    return {column['name'] for column in inspect(conn).get_columns('payments')}
+
+
+def add_amount_minor(conn):
+    if 'amount_minor' in payment_columns(conn):
+        return
+    conn.execute(text('ALTER TABLE payments ADD COLUMN amount_minor BIGINT'))
+    logger.info('Added payments.amount_minor')
+
+
+def relax_amount(conn):
+    """Drop NOT NULL from payments.amount."""
+    amount = next(column for column in inspect(conn).get_columns('payments') if column['name'] == 'amount')
+    if amount['nullable']:
+        return
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE payments ALTER COLUMN amount DROP NOT NULL'))
+    elif conn.dialect.name in ('mysql', 'mariadb'):
+        conn.execute(text('ALTER TABLE payments MODIFY amount FLOAT NULL'))
+    elif conn.dialect.name == 'sqlite':
+        rebuild_sqlite_payments(conn)
+    else:
+        raise RuntimeError(f'Cannot drop NOT NULL on payments.amount for {conn.dialect.name}')
+    logger.info('Made payments.amount nullable')
+
+
+def rebuild_sqlite_payments(conn):
+    """
+    SQLite cannot change a column constraint in place: copy the rows into a
+    table created from the same DDL minus the constraint, then swap it in
+    and recreate the indexes.
+    """
+    create_table = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'payments'"
+    )).scalar()
+    indexes = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'payments' AND sql IS NOT NULL"
+    )).scalars().all()
+    
+    create_table, found = re.subn(r'(\bamount\s+FLOAT)\s+NOT NULL', r'\1', create_table, count=1, flags=re.IGNORECASE)
+    if not found:
+        raise RuntimeError('Could not find the NOT NULL amount column in the payments DDL')
+    create_table = re.sub(r'^CREATE TABLE\s+"?payments"?', 'CREATE TABLE payments_rebuild', create_table)
+    
+    conn.execute(text(create_table))
+    conn.execute(text('INSERT INTO payments_rebuild SELECT * FROM payments'))
+    conn.execute(text('DROP TABLE payments'))
+    conn.execute(text('ALTER TABLE payments_rebuild RENAME TO payments'))
+    for create_index in indexes:
+        conn.execute(text(create_index))
+
+
+def backfill_amount_minor(conn):
+    """Convert rows not yet migrated, one UPDATE per non-default currency."""
+    update = 'UPDATE payments SET amount_minor = CAST(ROUND(amount * :scale) AS BIGINT) WHERE amount_minor IS NULL'
+    total = 0
+    for currency, scale in CURRENCY_SCALES.items():
+        total += conn.execute(text(f'{update} AND currency = :currency'), {'scale': scale, 'currency': currency}).rowcount
+    # Everything else, including NULL currency, uses the default exponent
+    total += conn.execute(text(update), {'scale': DEFAULT_SCALE}).rowcount
+    logger.info('Backfilled amount_minor on %d rows', total)
+
+
+def drop_amount(conn):
+    missing = conn.execute(text('SELECT COUNT(*) FROM payments WHERE amount_minor IS NULL')).scalar()
+    if missing:
+        raise RuntimeError(f'{missing} payments have no amount_minor; not dropping amount')
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ALTER TABLE payments ALTER COLUMN amount_minor SET NOT NULL'))
+    # SQLite needs 3.35+ for DROP COLUMN and cannot add NOT NULL in place
+    conn.execute(text('ALTER TABLE payments DROP COLUMN amount'))
+    logger.info('Dropped payments.amount')
+
+
+def migrate(engine, drop=False):
+    with engine.begin() as conn:
+        if 'amount' not in payment_columns(conn):
+            logger.info('payments.amount already migrated')
+            return
+        add_amount_minor(conn)
+        relax_amount(conn)
+        backfill_amount_minor(conn)
+        if drop:
+            drop_amount(conn)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--drop-amount', action='store_true', help='drop the float column after backfilling')
+    args = parser.parse_args()
+    
+    app = create_app(get_config())
+    with app.app_context():
+        migrate(db.engine, drop=args.drop_amount)
@@ -0,0 +1,59 @@
+"""
+One-off migration: add payments indexes missing from older databases.
+db.create_all() skips tables that already exist, so indexes added to the
+Payment model later never reach them. Safe to re-run.
+
+Usage (from the service root, with the service's DATABASE_URL):
+    python migrate_indexes.py
+
+Creating an index locks payments against writes while it builds, so run
+this while writes are quiet.
+"""
+import argparse
+import logging
+from sqlalchemy import inspect, text
+from app import create_app, db
+from app.models import Payment
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('migrate_indexes')
+
+# Indexes declared in Payment.__table_args__ after the table first shipped
+PAYMENT_INDEXES = (
+    'ix_payments_user_created_id',
+    'ix_payments_booking_user',
+)
+
+
+def payment_indexes(conn):
+    return {index['name'] for index in inspect(conn).get_indexes('payments')}
+
+
+def create_index(conn, name):
+    """CREATE INDEX IF NOT EXISTS with the columns the model declares."""
+    index = next(index for index in Payment.__table__.indexes if index.name == name)
+    columns = ', '.join(column.name for column in index.columns)
+    # MySQL has no IF NOT EXISTS for indexes; check the catalog instead
+    if conn.dialect.name in ('mysql', 'mariadb'):
+        if name in payment_indexes(conn):
+            return
+        conn.execute(text(f'CREATE INDEX {name} ON payments ({columns})'))
+    else:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON payments ({columns})'))
+    logger.info('Ensured index %s on payments (%s)', name, columns)
+
+
+def migrate(engine):
+    with engine.begin() as conn:
+        for name in PAYMENT_INDEXES:
+            create_index(conn, name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.parse_args()
+    
+    app = create_app(get_config())
+    with app.app_context():
+        migrate(db.engine)
@@ -0,0 +1,32 @@
+"""
+Batch job: rebuild payment_rollups from the payments table.
+Run once after deploying the rollups to backfill history, or for a date
+range to repair counters. Works through `--days-per-chunk` days per
+transaction; run it while writes are quiet, as payments changing in the
+chunk being rebuilt can be counted twice.
+
+Usage (from the service root, with the service's DATABASE_URL):
+    python rebuild_rollups.py [--from 2026-01-01] [--to 2026-01-31] [--days-per-chunk 7]
+"""
+import argparse
+import logging
+from datetime import date
+from app import create_app
+from app.services.stats_service import StatsService
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('rebuild_rollups')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--from', dest='start', type=date.fromisoformat, help='first day (default: oldest payment)')
+    parser.add_argument('--to', dest='end', type=date.fromisoformat, help='last day (default: newest payment)')
+    parser.add_argument('--days-per-chunk', type=int, default=7, help='days rebuilt per transaction')
+    args = parser.parse_args()
+    
+    app = create_app(get_config())
+    with app.app_context():
+        written = StatsService.rebuild(args.start, args.end, args.days_per_chunk)
+    logger.info('Rebuilt %d rollup rows', written)
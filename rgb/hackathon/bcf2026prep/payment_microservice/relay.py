@@ -0,0 +1,25 @@
+"""
+Standalone outbox relay.
+Run alongside the web workers when OUTBOX_RELAY_IN_PROCESS is disabled.
+"""
+import logging
+from app import create_app, create_outbox_relay
+from config import get_config
+
+logging.basicConfig(level=logging.INFO)
+
+
+class RelayConfig(get_config()):
+    RABBITMQ_ENABLED = True
+    RABBITMQ_ASYNC_PUBLISH = False
+    OUTBOX_RELAY_IN_PROCESS = False
+
+
+app = create_app(RelayConfig)
+
+if __name__ == '__main__':
+    relay = create_outbox_relay(app)
+    try:
+        relay.run_forever()
+    except KeyboardInterrupt:
+        relay.stop()
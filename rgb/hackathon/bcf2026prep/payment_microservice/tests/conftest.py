@@ -0,0 +1,37 @@
+import datetime
+import jwt
+import pytest
+from app import create_app, db
+from config import TestingConfig
+
+
+def make_token(app, subject='test_user'):
+    return jwt.encode({
+        'sub': subject,
+        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }, app.config['JWT_SECRET_KEY'], algorithm=app.config['JWT_ALGORITHM'])
+
+
+@pytest.fixture
+def config_class():
+    return TestingConfig
+
+
+@pytest.fixture
+def app(config_class):
+    app = create_app(config_class)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app):
+    return {'Authorization': f'Bearer {make_token(app)}'}
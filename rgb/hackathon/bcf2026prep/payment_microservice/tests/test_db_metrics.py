@@ -0,0 +1,98 @@
+"""Connection-pool and statement metrics of an instrumented engine."""
+import logging
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from app.services.db_metrics_service import (
+    InstrumentedQueuePool,
+    instrument_engine,
+    normalize_statement,
+    statement_fingerprint
+)
+from app.services.metrics_service import StatementMetrics
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        f'sqlite:///{tmp_path / "metrics.db"}',
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=2
+    )
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE payments (id INTEGER PRIMARY KEY, status VARCHAR(20))'))
+    yield engine
+    engine.dispose()
+
+
+def pool_state(label):
+    return {
+        state: REGISTRY.get_sample_value('payment_service_db_connections', {'engine': label, 'state': state})
+        for state in ('checked_out', 'idle', 'overflow')
+    }
+
+
+def query_count(fingerprint):
+    value = REGISTRY.get_sample_value('payment_service_db_query_latency_seconds_count', {'statement': fingerprint})
+    return value or 0
+
+
+def slow_count(fingerprint):
+    value = REGISTRY.get_sample_value('payment_service_db_slow_queries_total', {'statement': fingerprint})
+    return value or 0
+
+
+def test_statements_differing_in_parameters_share_a_fingerprint():
+    first = "SELECT * FROM payments WHERE id IN (1, 2, 3) AND status = 'pending'"
+    second = "SELECT  *\nFROM payments WHERE id IN (?) AND status = 'refunded'"
+    
+    assert normalize_statement(first) == 'SELECT * FROM payments WHERE id IN (?) AND status = ?'
+    assert statement_fingerprint(first) == statement_fingerprint(second)
+    assert statement_fingerprint(first).startswith('select payments ')
+    assert normalize_statement('INSERT INTO payments (id) VALUES (?), (?), (?)') == \
+        'INSERT INTO payments (id) VALUES (?)'
+
+
+def test_pool_gauges_follow_checkouts(engine):
+    instrument_engine(engine, 'test-pool')
+    
+    first = engine.connect()
+    second = engine.connect()
+    assert pool_state('test-pool') == {'checked_out': 2, 'idle': 0, 'overflow': 1}
+    
+    first.close()
+    second.close()
+    assert pool_state('test-pool') == {'checked_out': 0, 'idle': 1, 'overflow': 0}
+    
+    # dispose() replaces the pool; the new one keeps reporting
+    engine.dispose()
+    with engine.connect():
+        assert pool_state('test-pool')['checked_out'] == 1
+
+
+def test_slow_statements_are_counted_and_logged_without_values(engine, caplog):
+    instrument_engine(engine, 'test-slow', slow_query_ms=1e-6)
+    sql = 'SELECT id FROM payments WHERE status = :status'
+    fingerprint = statement_fingerprint('SELECT id FROM payments WHERE status = ?')
+    queries, slow = query_count(fingerprint), slow_count(fingerprint)
+    
+    with caplog.at_level(logging.WARNING, logger='app.services.db_metrics_service'):
+        with engine.connect() as conn:
+            conn.execute(text(sql), {'status': 'secret-value'})
+    
+    assert query_count(fingerprint) - queries == 1
+    assert slow_count(fingerprint) - slow == 1
+    assert fingerprint in caplog.text
+    assert 'secret-value' not in caplog.text
+
+
+def test_statement_series_are_bounded():
+    before = query_count('other')
+    metrics = StatementMetrics(max_statements=1)
+    metrics.observe('select bounded 1', 0.001)
+    metrics.observe('select bounded 2', 0.001)
+    
+    assert query_count('select bounded 1') == 1
+    assert query_count('select bounded 2') == 0
+    assert query_count('other') - before == 1
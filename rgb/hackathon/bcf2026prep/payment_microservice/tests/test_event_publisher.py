@@ -0,0 +1,215 @@
+"""Batched event publishing against the in-memory broker."""
+import json
+from types import SimpleNamespace
+import pytest
+from pika.spec import Basic, Confirm
+from app.services import rabbitmq_service
+from app.services.rabbitmq_service import (
+    AsyncEventPublisher,
+    InMemoryBroker,
+    PartialPublishError,
+    RabbitMQService
+)
+
+CONFIG = {
+    'RABBITMQ_ENABLED': True,
+    'RABBITMQ_EXCHANGE': 'payments',
+    'RABBITMQ_PUBLISH_BATCH_SIZE': 10
+}
+
+
+@pytest.fixture
+def broker():
+    return InMemoryBroker()
+
+
+@pytest.fixture
+def service(broker):
+    service = RabbitMQService(CONFIG, broker=broker, async_publish=False)
+    yield service
+    service.close()
+
+
+def make_publisher(service, **options):
+    options.setdefault('batch_size', 10)
+    options.setdefault('retry_backoff', 0)
+    options.setdefault('idle_interval', 0.01)
+    return AsyncEventPublisher(service.publish_batch, **options)
+
+
+def published_ids(broker):
+    return [json.loads(body)['data']['id'] for _, body in broker.messages]
+
+
+def test_events_publish_in_batches(broker, service):
+    publisher = make_publisher(service)
+    for n in range(25):
+        assert publisher.enqueue(('payment.created', {'id': n}))
+    publisher.start()
+    assert broker.wait_for(25)
+    publisher.stop()
+    
+    assert published_ids(broker) == list(range(25))
+    assert all(size <= 10 for size in broker.batches)
+    assert broker.messages[0][0] == 'payment.created'
+
+
+def test_failed_batch_is_retried(broker, service):
+    broker.fail_next = 2
+    publisher = make_publisher(service)
+    for n in range(5):
+        publisher.enqueue(('payment.created', {'id': n}))
+    publisher.start()
+    assert broker.wait_for(5)
+    publisher.stop()
+    
+    assert published_ids(broker) == list(range(5))
+
+
+def test_partial_failure_retries_only_unconfirmed(broker, service):
+    broker.fail_after = 3
+    publisher = make_publisher(service)
+    for n in range(8):
+        publisher.enqueue(('payment.created', {'id': n}))
+    publisher.start()
+    assert broker.wait_for(8)
+    publisher.stop()
+    
+    # No event was published twice
+    assert published_ids(broker) == list(range(8))
+    assert broker.batches == [3, 5]
+
+
+def test_partial_failure_reports_unconfirmed_indexes(broker, service):
+    broker.fail_after = 1
+    with pytest.raises(PartialPublishError) as error:
+        service.publish_batch([('payment.created', {'id': n}) for n in range(3)])
+    assert error.value.failed == [1, 2]
+
+
+def test_batch_dropped_after_max_retries(broker, service):
+    broker.fail_next = 3
+    publisher = make_publisher(service, max_retries=2)
+    publisher.enqueue(('payment.created', {'id': 1}))
+    publisher.start()
+    publisher.stop()
+    
+    assert broker.fail_next == 0
+    assert broker.messages == []
+
+
+def test_overflow_drop_newest(service):
+    publisher = make_publisher(service, max_queue_size=2, overflow='drop_newest')
+    assert publisher.enqueue(('payment.created', {'id': 1}))
+    assert publisher.enqueue(('payment.created', {'id': 2}))
+    assert not publisher.enqueue(('payment.created', {'id': 3}))
+    assert publisher.qsize() == 2
+
+
+def test_overflow_drop_oldest(broker, service):
+    publisher = make_publisher(service, max_queue_size=2, overflow='drop_oldest')
+    for n in range(4):
+        assert publisher.enqueue(('payment.created', {'id': n}))
+    publisher.start()
+    assert broker.wait_for(2)
+    publisher.stop()
+    
+    assert published_ids(broker) == [2, 3]
+
+
+def test_publish_events_disabled():
+    service = RabbitMQService(dict(CONFIG, RABBITMQ_ENABLED=False), broker=InMemoryBroker(), async_publish=False)
+    assert service.publish_events([('payment.created', {'id': 1})]) == 0
+    assert service.broker.messages == []
+
+
+class FakeAMQPChannel:
+    """pika BlockingChannel stand-in; `_impl` is the underlying channel."""
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self._impl = self
+        self.published = []
+        self.confirm_callbacks = None
+    
+    def exchange_declare(self, **kwargs):
+        pass
+    
+    def queue_declare(self, **kwargs):
+        pass
+    
+    def queue_bind(self, **kwargs):
+        pass
+    
+    def confirm_delivery(self, ack_nack_callback, callback):
+        self.confirm_callbacks = (ack_nack_callback, callback)
+    
+    def basic_publish(self, exchange, routing_key, body, properties):
+        self.published.append(json.loads(body)['data']['id'])
+
+
+class FakeAMQPConnection:
+    """
+    pika BlockingConnection stand-in. Frames arrive only from
+    process_data_events, which acks (or nacks `nack_tags`) every
+    message published so far with one frame per delivery tag.
+    """
+    
+    def __init__(self, nack_tags=()):
+        self.nack_tags = set(nack_tags)
+        self.channel_ = FakeAMQPChannel(self)
+        self.is_closed = False
+        self.is_open = True
+        self.rounds = 0
+        self.selected = False
+        self.confirmed = 0
+    
+    def channel(self):
+        return self.channel_
+    
+    def process_data_events(self, time_limit=0):
+        self.rounds += 1
+        on_confirm, on_select = self.channel_.confirm_callbacks
+        if not self.selected:
+            self.selected = True
+            on_select(SimpleNamespace(method=Confirm.SelectOk()))
+            return
+        while self.confirmed < len(self.channel_.published):
+            self.confirmed += 1
+            method = Basic.Nack if self.confirmed in self.nack_tags else Basic.Ack
+            on_confirm(SimpleNamespace(method=method(delivery_tag=self.confirmed, multiple=False)))
+    
+    def close(self):
+        self.is_closed = True
+
+
+def amqp_service(monkeypatch, connection):
+    monkeypatch.setattr(rabbitmq_service.pika, 'BlockingConnection', lambda parameters: connection)
+    config = dict(
+        CONFIG,
+        RABBITMQ_HOST='localhost', RABBITMQ_PORT=5672, RABBITMQ_USER='guest', RABBITMQ_PASSWORD='guest',
+        RABBITMQ_VHOST='/', RABBITMQ_QUEUE='payment_events', RABBITMQ_PUBLISHER_CONFIRMS=True
+    )
+    return RabbitMQService(config, async_publish=False)
+
+
+def test_amqp_batch_waits_for_confirms_once(monkeypatch):
+    connection = FakeAMQPConnection()
+    service = amqp_service(monkeypatch, connection)
+    rounds = connection.rounds
+    
+    assert service.publish_batch([('payment.created', {'id': n}) for n in range(50)]) == 50
+    assert connection.channel_.published == list(range(50))
+    assert connection.rounds - rounds == 1
+
+
+def test_amqp_nacked_messages_are_reported(monkeypatch):
+    connection = FakeAMQPConnection(nack_tags={2, 3})
+    service = amqp_service(monkeypatch, connection)
+    
+    with pytest.raises(PartialPublishError) as error:
+        service.publish_batch([('payment.created', {'id': n}) for n in range(4)])
+    assert error.value.failed == [1, 2]
+    
+    # Delivery tags keep counting on the channel
+    assert service.publish_batch([('payment.created', {'id': 4})]) == 1
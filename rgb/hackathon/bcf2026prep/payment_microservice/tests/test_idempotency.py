@@ -0,0 +1,67 @@
+"""Idempotency-Key handling with the shared database store."""
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import IdempotencyKey, Payment
+from app.services.idempotency_service import IN_PROGRESS
+from config import TestingConfig
+
+
+class DatabaseIdempotencyConfig(TestingConfig):
+    IDEMPOTENCY_BACKEND = 'database'
+    IDEMPOTENCY_WAIT_TIMEOUT = 0.1
+
+
+@pytest.fixture
+def config_class():
+    return DatabaseIdempotencyConfig
+
+
+def post_payment(client, auth_headers):
+    return client.post('/api/payments', json={'booking_id': 'B1', 'amount': 10}, headers={
+        **auth_headers,
+        'Idempotency-Key': 'K1'
+    })
+
+
+def leave_in_progress(expires_at):
+    """Turn the stored key back into the claim of a request that never finished."""
+    record = IdempotencyKey.query.one()
+    record.state = IN_PROGRESS
+    record.status_code = record.response_body = None
+    record.expires_at = expires_at
+    db.session.commit()
+
+
+def test_retry_replays_completed_request(app, client, auth_headers):
+    first = post_payment(client, auth_headers)
+    retry = post_payment(client, auth_headers)
+    
+    assert first.status_code == 201
+    assert retry.json == first.json
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    # Completion extends the claim's lease to the full TTL
+    assert IdempotencyKey.query.one().expires_at > datetime.utcnow() + timedelta(seconds=app.config['IDEMPOTENCY_LEASE'])
+
+
+def test_live_claim_blocks_retries(client, auth_headers):
+    post_payment(client, auth_headers)
+    leave_in_progress(datetime.utcnow() + timedelta(minutes=1))
+    
+    response = post_payment(client, auth_headers)
+    assert response.status_code == 409
+    assert response.json['code'] == 'IDEMPOTENCY_KEY_IN_PROGRESS'
+
+
+def test_stale_claim_is_taken_over(client, auth_headers):
+    post_payment(client, auth_headers)
+    # The claiming worker died and its lease ran out
+    leave_in_progress(datetime.utcnow() - timedelta(seconds=1))
+    
+    response = post_payment(client, auth_headers)
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert Payment.query.count() == 2
+    
+    assert post_payment(client, auth_headers).headers['Idempotent-Replayed'] == 'true'
+    assert Payment.query.count() == 2
@@ -0,0 +1,128 @@
+"""JWKS key lookup and token verification with published keys."""
+import datetime
+import os
+import time
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from jwt.algorithms import OKPAlgorithm
+from app.services.jwks_service import JWKSClient
+from app.services.jwt_service import JWTService
+
+SECRET = 'test-secret-at-least-32-bytes-long'
+CONFIG = {'JWT_SECRET_KEY': SECRET, 'JWT_ALGORITHM': 'HS256'}
+
+
+def signing_key(kid):
+    """(private key, public JWK) for an EdDSA key."""
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    jwk = OKPAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update(kid=kid, alg='EdDSA', use='sig')
+    return private_key, jwk
+
+
+def make_token(key, algorithm, kid=None):
+    payload = {
+        'sub': 'test_user',
+        'exp': datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    }
+    return jwt.encode(payload, key, algorithm=algorithm, headers={'kid': kid} if kid else None)
+
+
+class FakeJWKSEndpoint:
+    """fetch() stand-in serving `keys` and counting requests."""
+    
+    def __init__(self, *jwks):
+        self.keys = list(jwks)
+        self.fetches = 0
+    
+    def __call__(self, url, timeout):
+        self.fetches += 1
+        return {'keys': list(self.keys)}
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def key():
+    return signing_key('key-1')
+
+
+@pytest.fixture
+def endpoint(key):
+    return FakeJWKSEndpoint(key[1])
+
+
+@pytest.fixture
+def jwks(endpoint):
+    client = JWKSClient('https://auth.test/jwks', refresh_interval=60, min_refresh_interval=0.2, fetch=endpoint)
+    client.start()
+    yield client
+    client.stop()
+
+
+def test_token_signed_with_a_published_key_verifies(key, jwks):
+    token = make_token(key[0], 'EdDSA', kid='key-1')
+    
+    assert JWTService.verify_token(token, CONFIG, jwks=jwks)['sub'] == 'test_user'
+
+
+def test_unknown_kid_is_rejected_and_refreshes_early_once(endpoint, jwks):
+    rotated = signing_key('key-2')
+    token = make_token(rotated[0], 'EdDSA', kid='key-2')
+    endpoint.keys.append(rotated[1])
+    
+    # Refreshed less than min_refresh_interval ago: no early refresh
+    assert JWTService.verify_token(token, CONFIG, jwks=jwks) is None
+    time.sleep(0.1)
+    assert endpoint.fetches == 1
+    
+    time.sleep(0.15)
+    for _ in range(5):
+        assert JWTService.verify_token(token, CONFIG, jwks=jwks) is None
+    assert wait_until(lambda: endpoint.fetches == 2)
+    
+    time.sleep(0.1)
+    assert endpoint.fetches == 2
+    assert JWTService.verify_token(token, CONFIG, jwks=jwks)['sub'] == 'test_user'
+
+
+def test_forked_worker_restarts_the_refresh_thread(jwks):
+    parent_thread = jwks._thread
+    jwks._pid = -1  # as inherited by a forked worker
+    
+    jwks.get_key('key-1')
+    assert jwks._pid == os.getpid()
+    assert jwks._thread is not parent_thread
+    assert jwks._thread.is_alive()
+
+
+def test_stopped_or_unstarted_client_starts_no_thread(endpoint):
+    client = JWKSClient('https://auth.test/jwks', fetch=endpoint)
+    client.refresh()
+    assert client.get_key('key-1') is not None
+    assert client._thread is None
+    
+    client.start()
+    client.stop()
+    client._pid = -1
+    client.get_key('key-1')
+    assert client._pid == -1
+
+
+def test_shared_secret_tokens(key, jwks):
+    token = make_token(SECRET, 'HS256')
+    assert JWTService.verify_token(token, CONFIG, jwks=jwks)['sub'] == 'test_user'
+    
+    # Disabled when no secret is configured
+    assert JWTService.verify_token(token, dict(CONFIG, JWT_SECRET_KEY=''), jwks=jwks) is None
+    
+    # The kid's published algorithm wins over the token's header
+    forged = make_token(SECRET, 'HS256', kid='key-1')
+    assert JWTService.verify_token(forged, CONFIG, jwks=jwks) is None
+    assert JWTService.verify_token(make_token(key[0], 'EdDSA', kid='key-1'), CONFIG) is None
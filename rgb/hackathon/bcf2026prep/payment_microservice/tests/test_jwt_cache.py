@@ -0,0 +1,36 @@
+"""Verified-token cache and its size gauge."""
+import time
+from prometheus_client import REGISTRY
+from app.services.jwt_service import TokenCache
+
+
+def cache_size_metric():
+    return REGISTRY.get_sample_value('payment_service_jwt_cache_size')
+
+
+def test_size_gauge_follows_every_change(monkeypatch):
+    cache = TokenCache(max_size=2, max_ttl=60)
+    now = time.time()
+    
+    cache.set('a', {'exp': now + 10})
+    cache.set('b', {'exp': now + 10})
+    assert cache_size_metric() == 2
+    
+    cache.set('c', {'exp': now + 10})  # evicts 'a'
+    assert cache_size_metric() == 2
+    assert cache.get('c') == {'exp': now + 10}
+    assert cache_size_metric() == 2
+    
+    monkeypatch.setattr(time, 'time', lambda: now + 20)
+    assert cache.get('b') is None  # expired and dropped
+    assert cache_size_metric() == 1
+    
+    cache.clear()
+    assert cache_size_metric() == 0
+
+
+def test_expired_tokens_are_not_cached():
+    cache = TokenCache()
+    cache.set('a', {'exp': time.time() - 1})
+    assert cache.get('a') is None
+    assert len(cache) == 0
@@ -0,0 +1,119 @@
+"""Prometheus multiprocess mode as set up by gunicorn.conf.py."""
+import os
+import re
+import runpy
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from prometheus_client import CollectorRegistry, Counter
+from app.services.metrics_service import MetricsExporter
+
+SERVICE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One gunicorn worker: serve two creates, exit without a scrape
+WORKER = """
+import jwt
+from app import create_app, db
+from config import TestingConfig
+app = create_app(TestingConfig)
+with app.app_context():
+    db.create_all()
+    token = jwt.encode({'sub': 'u'}, app.config['JWT_SECRET_KEY'], algorithm=app.config['JWT_ALGORITHM'])
+    client = app.test_client()
+    for _ in range(2):
+        client.post('/api/payments', json={'booking_id': 'B1', 'amount': 10}, headers={'Authorization': f'Bearer {token}'})
+"""
+
+# A worker answering the scrape after the others exited
+SCRAPE = """
+from app import create_app
+from config import TestingConfig
+print(create_app(TestingConfig).test_client().get('/metrics').get_data(as_text=True))
+"""
+
+
+def run_worker(code, metrics_dir):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(metrics_dir))
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=SERVICE_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout
+
+
+def load_gunicorn_conf():
+    return runpy.run_path(os.path.join(SERVICE_ROOT, 'gunicorn.conf.py'))
+
+
+def test_scrape_sums_every_worker(tmp_path):
+    run_worker(WORKER, tmp_path)
+    run_worker(WORKER, tmp_path)
+    
+    metrics = run_worker(SCRAPE, tmp_path)
+    created = re.search(
+        r'^payment_service_requests_total\{endpoint="payments.create_payment",method="POST",status_code="201"\} (\S+)$',
+        metrics,
+        re.M
+    )
+    assert float(created.group(1)) == 4
+
+
+def unset_multiproc_dir(monkeypatch):
+    # setenv first so monkeypatch restores the variable gunicorn.conf.py sets
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', '')
+    monkeypatch.delenv('PROMETHEUS_MULTIPROC_DIR')
+
+
+def test_gunicorn_conf_creates_and_removes_its_own_directory(monkeypatch):
+    unset_multiproc_dir(monkeypatch)
+    monkeypatch.delenv('METRICS_MULTIPROCESS', raising=False)
+    conf = load_gunicorn_conf()
+    
+    metrics_dir = Path(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+    assert str(metrics_dir) == conf['_metrics_dir']
+    (metrics_dir / 'counter_1.db').touch()
+    
+    conf['on_starting'](None)
+    assert os.listdir(metrics_dir) == ['counter_1.db']  # fresh, so not wiped
+    conf['on_exit'](None)
+    assert not metrics_dir.exists()
+
+
+def test_gunicorn_conf_empties_a_configured_directory(monkeypatch, tmp_path):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    (tmp_path / 'counter_1.db').touch()
+    (tmp_path / 'gauge_livesum_2.db').touch()
+    conf = load_gunicorn_conf()
+    
+    conf['on_starting'](None)
+    assert os.listdir(tmp_path) == []
+    
+    # mark_process_dead drops a dead worker's livesum gauge file
+    (tmp_path / 'gauge_livesum_2.db').touch()
+    conf['child_exit'](None, SimpleNamespace(pid=2))
+    assert os.listdir(tmp_path) == []
+    
+    conf['on_exit'](None)
+    assert tmp_path.exists()
+
+
+def test_gunicorn_conf_respects_opt_out(monkeypatch):
+    unset_multiproc_dir(monkeypatch)
+    monkeypatch.setenv('METRICS_MULTIPROCESS', 'false')
+    conf = load_gunicorn_conf()
+    
+    assert conf['_metrics_dir'] is None
+    assert 'PROMETHEUS_MULTIPROC_DIR' not in os.environ
+
+
+def test_exporter_caches_the_payload_for_its_ttl():
+    registry = CollectorRegistry()
+    counter = Counter('exporter_test_total', 'Test counter', registry=registry)
+    cached = MetricsExporter(ttl=60, registry=registry)
+    uncached = MetricsExporter(ttl=0, registry=registry)
+    
+    first = cached.render()
+    counter.inc()
+    assert cached.render() is first
+    assert b'exporter_test_total 1.0' in uncached.render()
@@ -0,0 +1,65 @@
+"""migrate_amounts.py against a SQLite database with the float amount column."""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from migrate_amounts import migrate
+
+LEGACY_SCHEMA = """
+CREATE TABLE payments (
+    id INTEGER NOT NULL,
+    payment_id VARCHAR(36) NOT NULL,
+    user_id INTEGER NOT NULL,
+    booking_id VARCHAR(100) NOT NULL,
+    amount FLOAT NOT NULL,
+    currency VARCHAR(3),
+    status VARCHAR(20),
+    PRIMARY KEY (id)
+)
+"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "payments.db"}')
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_SCHEMA))
+        conn.execute(text('CREATE UNIQUE INDEX ix_payments_payment_id ON payments (payment_id)'))
+        conn.execute(text(
+            "INSERT INTO payments (payment_id, user_id, booking_id, amount, currency, status) VALUES "
+            "('P1', 1, 'B1', 19.99, 'USD', 'pending'), ('P2', 1, 'B2', 1500, 'JPY', 'completed')"
+        ))
+    yield engine
+    engine.dispose()
+
+
+def insert_new_payment(conn):
+    # What the migrated model writes: no amount
+    conn.execute(text(
+        "INSERT INTO payments (payment_id, user_id, booking_id, amount_minor, currency, status) "
+        "VALUES ('P3', 1, 'B3', 500, 'USD', 'pending')"
+    ))
+
+
+def test_first_phase_backfills_and_accepts_new_rows(engine):
+    migrate(engine)
+    
+    with engine.begin() as conn:
+        insert_new_payment(conn)
+        rows = conn.execute(text('SELECT payment_id, amount_minor FROM payments ORDER BY id')).all()
+        indexes = {index['name'] for index in inspect(conn).get_indexes('payments')}
+    
+    assert rows == [('P1', 1999), ('P2', 1500), ('P3', 500)]
+    assert 'ix_payments_payment_id' in indexes
+
+
+def test_drop_phase_removes_amount(engine):
+    migrate(engine)
+    with engine.begin() as conn:
+        insert_new_payment(conn)
+    migrate(engine, drop=True)
+    
+    with engine.begin() as conn:
+        columns = {column['name'] for column in inspect(conn).get_columns('payments')}
+    assert 'amount' not in columns
+    assert 'amount_minor' in columns
+    
+    migrate(engine)  # already migrated: no-op
@@ -0,0 +1,39 @@
+"""migrate_indexes.py against a payments table created before the indexes."""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from migrate_indexes import PAYMENT_INDEXES, migrate
+
+LEGACY_SCHEMA = """
+CREATE TABLE payments (
+    id INTEGER NOT NULL,
+    payment_id VARCHAR(36) NOT NULL,
+    user_id INTEGER NOT NULL,
+    booking_id VARCHAR(100) NOT NULL,
+    amount_minor BIGINT,
+    created_at DATETIME,
+    PRIMARY KEY (id)
+)
+"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "payments.db"}')
+    with engine.begin() as conn:
+        conn.execute(text(LEGACY_SCHEMA))
+    yield engine
+    engine.dispose()
+
+
+def indexes(engine):
+    with engine.connect() as conn:
+        return {index['name']: index['column_names'] for index in inspect(conn).get_indexes('payments')}
+
+
+def test_adds_missing_indexes_once(engine):
+    migrate(engine)
+    migrate(engine)  # already there: no-op
+    
+    assert set(PAYMENT_INDEXES) <= set(indexes(engine))
+    assert indexes(engine)['ix_payments_user_created_id'] == ['user_id', 'created_at', 'id']
+    assert indexes(engine)['ix_payments_booking_user'] == ['booking_id', 'user_id']
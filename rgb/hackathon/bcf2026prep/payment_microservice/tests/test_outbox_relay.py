@@ -0,0 +1,125 @@
+"""Outbox relay delivery and parking of undeliverable rows."""
+import json
+import pytest
+from app import create_app, create_outbox_relay, db
+from app.models import OutboxEvent, FailedOutboxEvent
+from config import TestingConfig
+
+
+class RelayTestConfig(TestingConfig):
+    RABBITMQ_ENABLED = True
+    RABBITMQ_BROKER = 'memory'
+    RABBITMQ_ASYNC_PUBLISH = False
+    OUTBOX_MAX_ATTEMPTS = 3
+
+
+@pytest.fixture
+def app():
+    app = create_app(RelayTestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def relay(app):
+    return app.outbox_relay
+
+
+@pytest.fixture
+def broker(app):
+    return app.rabbitmq.broker
+
+
+def add_events(*ids):
+    OutboxEvent.add_many('payment.created', [{'id': i} for i in ids])
+    db.session.commit()
+
+
+def published_ids(broker):
+    return [json.loads(body)['data']['id'] for _, body in broker.messages]
+
+
+def test_relay_publishes_and_deletes(relay, broker):
+    add_events(1, 2, 3)
+    
+    assert relay.relay_once() == 3
+    assert published_ids(broker) == [1, 2, 3]
+    assert OutboxEvent.query.count() == 0
+
+
+def test_undecodable_row_is_parked(relay, broker):
+    add_events(1)
+    db.session.add(OutboxEvent(event_type='payment.created', payload='{not json'))
+    db.session.commit()
+    add_events(3)
+    
+    assert relay.relay_once() == 2
+    assert published_ids(broker) == [1, 3]
+    parked = FailedOutboxEvent.query.one()
+    assert parked.payload == '{not json'
+    assert parked.attempts == 1
+    assert OutboxEvent.query.count() == 0
+
+
+def test_rejected_row_is_parked_after_max_attempts(relay, broker):
+    add_events(1, 2)
+    broker.fail_next = 3
+    
+    for _ in range(2):
+        assert relay.relay_once() == 0
+        assert OutboxEvent.query.count() == 2
+    assert relay.relay_once() == 0
+    
+    parked = FailedOutboxEvent.query.one()
+    assert parked.attempts == 3
+    assert json.loads(parked.payload) == {'id': 1}
+    assert relay.relay_once() == 1
+    assert published_ids(broker) == [2]
+
+
+def test_partial_failure_finishes_confirmed_rows(relay, broker):
+    add_events(1, 2, 3)
+    broker.fail_after = 1
+    
+    assert relay.relay_once() == 1
+    assert OutboxEvent.query.count() == 2
+    assert relay.relay_once() == 2
+    assert published_ids(broker) == [1, 2, 3]
+    assert FailedOutboxEvent.query.count() == 0
+
+
+def test_outage_does_not_count_attempts(relay, broker, monkeypatch):
+    add_events(1)
+    broker.fail_next = 5
+    monkeypatch.setattr(broker, 'is_connected', lambda: False)
+    
+    for _ in range(5):
+        assert relay.relay_once() == 0
+    
+    assert FailedOutboxEvent.query.count() == 0
+    assert relay.relay_once() == 1
+
+
+class OutOfProcessConfig(RelayTestConfig):
+    OUTBOX_RELAY_IN_PROCESS = False
+
+
+def test_web_app_skips_publisher_when_relay_is_out_of_process():
+    app = create_app(OutOfProcessConfig)
+    assert not hasattr(app, 'rabbitmq')
+    assert not hasattr(app, 'outbox_relay')
+    
+    with app.app_context():
+        db.create_all()
+        assert app.test_client().get('/health/ready').status_code == 200
+        
+        # relay.py builds its own publisher
+        relay = create_outbox_relay(app)
+        add_events(1, 2)
+        assert relay.relay_once() == 2
+        assert published_ids(relay.rabbitmq.broker) == [1, 2]
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,59 @@
+"""ETags on GET /api/payments/<payment_id>, with and without the payment cache."""
+import pytest
+from config import TestingConfig
+from conftest import make_token
+
+
+class UncachedConfig(TestingConfig):
+    PAYMENT_CACHE_ENABLED = False
+
+
+@pytest.fixture(params=[TestingConfig, UncachedConfig], ids=['cached', 'uncached'])
+def config_class(request):
+    return request.param
+
+
+def create_payment(client, auth_headers):
+    response = client.post('/api/payments', json={'booking_id': 'B1', 'amount': 10}, headers=auth_headers)
+    return response.json['payment']['payment_id']
+
+
+def get_payment(client, auth_headers, payment_id, etag=None):
+    headers = dict(auth_headers, **({'If-None-Match': etag} if etag else {}))
+    return client.get(f'/api/payments/{payment_id}', headers=headers)
+
+
+def test_matching_etag_gets_304(client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    
+    response = get_payment(client, auth_headers, payment_id)
+    assert response.status_code == 200
+    assert response.json['payment']['status'] == 'pending'
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    
+    not_modified = get_payment(client, auth_headers, payment_id, response.headers['ETag'])
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert not_modified.headers['ETag'] == response.headers['ETag']
+
+
+def test_transition_changes_the_etag(client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    etag = get_payment(client, auth_headers, payment_id).headers['ETag']
+    
+    client.post(f'/api/payments/{payment_id}/process', headers=auth_headers)
+    
+    response = get_payment(client, auth_headers, payment_id, etag)
+    assert response.status_code == 200
+    assert response.json['payment']['status'] == 'completed'
+    assert response.headers['ETag'] != etag
+    assert get_payment(client, auth_headers, payment_id, response.headers['ETag']).status_code == 304
+
+
+def test_owner_is_checked_before_serving(app, client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    etag = get_payment(client, auth_headers, payment_id).headers['ETag']
+    other_headers = {'Authorization': f'Bearer {make_token(app, "other_user")}'}
+    
+    assert get_payment(client, other_headers, payment_id, etag).status_code == 403
+    assert get_payment(client, auth_headers, 'missing').status_code == 404
@@ -0,0 +1,85 @@
+"""Streaming payment export as NDJSON and CSV."""
+import csv
+import io
+import json
+from datetime import datetime
+import pytest
+from app import db
+from app.models import Payment
+from config import TestingConfig
+from conftest import make_token
+
+
+class ExportConfig(TestingConfig):
+    # Several fetches per export
+    PAYMENT_EXPORT_CHUNK_SIZE = 2
+
+
+@pytest.fixture
+def config_class():
+    return ExportConfig
+
+
+def create_payments(client, headers, count):
+    response = client.post('/api/payments/batch', json={'payments': [
+        {'booking_id': f'B{n}', 'amount': n + 1} for n in range(count)
+    ]}, headers=headers)
+    return [result['payment'] for result in response.json['results']]
+
+
+def test_ndjson_export_streams_payments_oldest_first(client, auth_headers):
+    payments = create_payments(client, auth_headers, 5)
+    
+    response = client.get('/api/payments/export', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="payments.ndjson"'
+    
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == payments
+
+
+def test_csv_export_has_a_header_row(client, auth_headers):
+    payments = create_payments(client, auth_headers, 3)
+    
+    response = client.get('/api/payments/export?format=csv', headers=auth_headers)
+    assert response.mimetype == 'text/csv'
+    
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['payment_id'] for row in rows] == [payment['payment_id'] for payment in payments]
+    assert [row['amount'] for row in rows] == ['1.0', '2.0', '3.0']
+
+
+def test_export_date_range(client, auth_headers):
+    payments = create_payments(client, auth_headers, 3)
+    Payment.query.filter_by(payment_id=payments[1]['payment_id']).update({'created_at': datetime(2026, 1, 31, 23, 59)})
+    db.session.commit()
+    
+    response = client.get('/api/payments/export?from=2026-01-01&to=2026-01-31', headers=auth_headers)
+    assert [json.loads(line)['payment_id'] for line in response.get_data(as_text=True).splitlines()] == [
+        payments[1]['payment_id']
+    ]
+    
+    response = client.get('/api/payments/export?from=2026-02-01&to=2026-01-01', headers=auth_headers)
+    assert response.status_code == 400
+
+
+def test_export_scope(app, client, auth_headers):
+    create_payments(client, auth_headers, 2)
+    other_headers = {'Authorization': f'Bearer {make_token(app, "other_user")}'}
+    create_payments(client, other_headers, 1)
+    
+    response = client.get('/api/payments/export', headers=other_headers)
+    assert len(response.get_data(as_text=True).splitlines()) == 1
+    
+    assert client.get('/api/payments/export?scope=all', headers=auth_headers).status_code == 403
+    app.config['PAYMENT_EXPORT_ALL_USERS'] = ['test_user']
+    response = client.get('/api/payments/export?scope=all', headers=auth_headers)
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+
+
+def test_invalid_export_format(client, auth_headers):
+    response = client.get('/api/payments/export?format=xml', headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json == {'error': 'format must be one of: ndjson, csv'}
@@ -0,0 +1,53 @@
+"""Keyset pagination of GET /api/payments."""
+from datetime import datetime
+from app import db
+from app.models import Payment
+from conftest import make_token
+
+
+def create_payments(client, headers, count):
+    response = client.post('/api/payments/batch', json={'payments': [
+        {'booking_id': f'B{n}', 'amount': 10} for n in range(count)
+    ]}, headers=headers)
+    return [result['payment']['payment_id'] for result in response.json['results']]
+
+
+def walk_pages(client, headers, limit):
+    pages, cursor = [], ''
+    while cursor is not None:
+        response = client.get(f'/api/payments?cursor={cursor}&limit={limit}', headers=headers)
+        assert response.status_code == 200
+        pages.append([payment['payment_id'] for payment in response.json['payments']])
+        cursor = response.json['pagination']['next_cursor']
+    return pages
+
+
+def test_cursor_pages_cover_every_payment_once(app, client, auth_headers):
+    payment_ids = create_payments(client, auth_headers, 5)
+    other_headers = {'Authorization': f'Bearer {make_token(app, "other_user")}'}
+    create_payments(client, other_headers, 2)
+    # Equal timestamps, so the cursor's id breaks the ties
+    Payment.query.update({'created_at': datetime(2026, 1, 1)})
+    db.session.commit()
+    
+    pages = walk_pages(client, auth_headers, limit=2)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == payment_ids[::-1]
+
+
+def test_cursor_first_page_with_total(client, auth_headers):
+    create_payments(client, auth_headers, 3)
+    
+    response = client.get('/api/payments?cursor=&limit=3&include_total=true', headers=auth_headers)
+    assert response.json['pagination'] == {
+        'has_next': False,
+        'limit': 3,
+        'next_cursor': None,
+        'total': 3
+    }
+
+
+def test_invalid_cursor_is_rejected(client, auth_headers):
+    response = client.get('/api/payments?cursor=not-a-cursor', headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json == {'error': 'Invalid cursor'}
@@ -0,0 +1,82 @@
+"""Request validation of the payment routes."""
+import time
+
+
+def test_batch_rejects_non_object_body(client, auth_headers):
+    response = client.post('/api/payments/batch', json=[{'booking_id': 'B1', 'amount': 10}], headers=auth_headers)
+    
+    assert response.status_code == 400
+    assert response.json == {'error': 'payments must be a non-empty list'}
+
+
+def test_batch_creates_valid_items(client, auth_headers):
+    response = client.post('/api/payments/batch', json={'payments': [
+        {'booking_id': 'B1', 'amount': 10},
+        {'amount': 5}
+    ]}, headers=auth_headers)
+    
+    assert response.status_code == 207
+    assert [result['status'] for result in response.json['results']] == ['created', 'error']
+
+
+def create_payment(client, auth_headers):
+    response = client.post('/api/payments', json={'booking_id': 'B1', 'amount': 10}, headers=auth_headers)
+    return response.json['payment']['payment_id']
+
+
+def test_long_poll_degrades_when_threads_are_taken(app, client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    etag = client.get(f'/api/payments/{payment_id}', headers=auth_headers).headers['ETag']
+    
+    assert app.payment_notifier.acquire_thread()
+    started = time.monotonic()
+    response = client.get(f'/api/payments/{payment_id}?wait=5', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert time.monotonic() - started < 1
+    
+    client.post(f'/api/payments/{payment_id}/process', headers=auth_headers)
+    response = client.get(f'/api/payments/{payment_id}?wait=5', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['payment']['status'] == 'completed'
+    etag = response.headers['ETag']
+    
+    app.payment_notifier.release_thread()
+    response = client.get(f'/api/payments/{payment_id}?wait=0.01', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_event_stream_holds_a_thread_until_closed(app, client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    
+    stream = client.get(f'/api/payments/{payment_id}/events', headers=auth_headers)
+    assert stream.status_code == 200
+    assert client.get(f'/api/payments/{payment_id}/events', headers=auth_headers).status_code == 503
+    
+    stream.close()
+    assert app.payment_notifier.acquire_thread()
+
+
+def test_stats_denied_unless_listed(app, client, auth_headers):
+    assert client.get('/api/payments/stats', headers=auth_headers).status_code == 403
+    
+    app.config['PAYMENT_STATS_USERS'] = ['test_user']
+    assert client.get('/api/payments/stats', headers=auth_headers).status_code == 200
+
+
+def test_amount_past_decimal_range_is_too_large(client, auth_headers):
+    for amount in ('1e308', '1e999999999'):
+        response = client.post('/api/payments', json={'booking_id': 'B1', 'amount': amount}, headers=auth_headers)
+        assert response.status_code == 400
+        assert response.json == {'error': 'Amount is too large'}
+    
+    response = client.post('/api/payments/batch', json={'payments': [
+        {'booking_id': 'B1', 'amount': '1e999999999'},
+        {'booking_id': 'B2', 'amount': '1e-999999999'},
+        {'booking_id': 'B3', 'amount': 10}
+    ]}, headers=auth_headers)
+    assert response.status_code == 207
+    assert [result.get('error') for result in response.json['results']] == [
+        'Amount is too large',
+        'Amount has more than 2 decimal places for USD',
+        None
+    ]
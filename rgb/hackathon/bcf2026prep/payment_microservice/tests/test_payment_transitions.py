@@ -0,0 +1,87 @@
+"""Payment status transitions through one conditional UPDATE."""
+from app import db
+from app.models import Payment, PaymentRollup
+from app.services.payment_service import PaymentService, TransitionOutcome
+from conftest import make_token
+
+
+def create_payment(client, auth_headers):
+    response = client.post('/api/payments', json={'booking_id': 'B1', 'amount': 10}, headers=auth_headers)
+    return response.json['payment']['payment_id']
+
+
+def rollup_counts():
+    return {row.status: row.count for row in PaymentRollup.query.all() if row.count}
+
+
+def test_process_then_refund(client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    
+    response = client.post(f'/api/payments/{payment_id}/process', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['payment']['status'] == 'completed'
+    assert response.json['payment']['transaction_ref'].startswith('TXN-')
+    assert rollup_counts() == {'completed': 1}
+    
+    response = client.post(f'/api/payments/{payment_id}/refund', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['payment']['status'] == 'refunded'
+    assert rollup_counts() == {'refunded': 1}
+
+
+def test_transition_from_wrong_status_is_rejected(client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    
+    response = client.post(f'/api/payments/{payment_id}/refund', headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json == {'error': 'Only completed payments can be refunded'}
+    
+    client.post(f'/api/payments/{payment_id}/process', headers=auth_headers)
+    response = client.post(f'/api/payments/{payment_id}/process', headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json == {'error': 'Payment already completed'}
+    assert rollup_counts() == {'completed': 1}
+
+
+def test_transition_checks_owner_and_existence(app, client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    other_headers = {'Authorization': f'Bearer {make_token(app, "other_user")}'}
+    
+    response = client.post(f'/api/payments/{payment_id}/process', headers=other_headers)
+    assert response.status_code == 403
+    assert db.session.get(Payment, Payment.query.one().id).status == 'pending'
+    
+    response = client.post('/api/payments/missing/process', headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_stale_expected_status_matches_no_row(client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    # A concurrent writer already moved the payment on
+    PaymentService.update_payment_status(payment_id, 'processing')
+    
+    payment, outcome, error = PaymentService.transition(payment_id, 'completed', from_status='pending')
+    assert payment is None
+    assert outcome == TransitionOutcome.INVALID_STATE
+    assert error == 'Payment already processing'
+    assert Payment.query.one().status == 'processing'
+    assert rollup_counts() == {'processing': 1}
+
+
+def test_status_update(client, auth_headers):
+    payment_id = create_payment(client, auth_headers)
+    
+    response = client.patch(f'/api/payments/{payment_id}/status', json={'status': 'bogus'}, headers=auth_headers)
+    assert response.status_code == 400
+    
+    response = client.patch('/api/payments/missing/status', json={'status': 'failed'}, headers=auth_headers)
+    assert response.status_code == 404
+    
+    response = client.patch(f'/api/payments/{payment_id}/status', json={
+        'status': 'failed',
+        'transaction_ref': 'GW-1'
+    }, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json['payment']['status'] == 'failed'
+    assert response.json['payment']['transaction_ref'] == 'GW-1'
+    assert rollup_counts() == {'failed': 1}
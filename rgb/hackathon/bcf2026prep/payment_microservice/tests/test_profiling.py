@@ -0,0 +1,27 @@
+"""X-Profile token handling of the request profiler."""
+import pytest
+from config import TestingConfig
+
+
+@pytest.fixture
+def config_class(tmp_path):
+    class ProfilingTestConfig(TestingConfig):
+        PROFILING_ENABLED = True
+        PROFILING_TOKEN = 'profile-token'
+        PROFILING_DIR = str(tmp_path)
+    return ProfilingTestConfig
+
+
+def test_matching_token_profiles_the_request(client):
+    response = client.get('/health/live', headers={'X-Profile': 'profile-token'})
+    
+    assert response.status_code == 200
+    assert 'Server-Timing' in response.headers
+
+
+@pytest.mark.parametrize('header', ['wrong-token', 'pröfile-token'])
+def test_other_tokens_are_ignored(client, header):
+    response = client.get('/health/live', headers={'X-Profile': header})
+    
+    assert response.status_code == 200
+    assert 'Server-Timing' not in response.headers
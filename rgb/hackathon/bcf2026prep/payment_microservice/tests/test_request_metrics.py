@@ -0,0 +1,88 @@
+"""Request count and latency recorded from the app's request hooks."""
+import pytest
+from prometheus_client import REGISTRY
+from app.services.metrics_service import RequestMetrics
+
+
+def request_count(method, endpoint, status_code):
+    value = REGISTRY.get_sample_value('payment_service_requests_total', {
+        'method': method,
+        'endpoint': endpoint,
+        'status_code': str(status_code)
+    })
+    return value or 0
+
+
+def latency_count(method, endpoint):
+    value = REGISTRY.get_sample_value('payment_service_request_latency_seconds_count', {
+        'method': method,
+        'endpoint': endpoint
+    })
+    return value or 0
+
+
+def active_requests():
+    return REGISTRY.get_sample_value('payment_service_active_requests')
+
+
+class MetricsDelta:
+    """Differences in request_count() since construction."""
+    
+    def __init__(self, *series):
+        self.start = {labels: request_count(*labels) for labels in series}
+    
+    def __getitem__(self, labels):
+        return request_count(*labels) - self.start[labels]
+
+
+def test_status_comes_from_the_final_response(client, auth_headers):
+    created = ('POST', 'payments.create_payment', 201)
+    not_modified = ('GET', 'payments.get_payment', 304)
+    unmatched = ('GET', 'unmatched', 404)
+    delta = MetricsDelta(created, not_modified, unmatched)
+    latencies = latency_count('GET', 'payments.get_payment')
+    active = active_requests()
+    
+    response = client.post('/api/payments', json={'booking_id': 'B1', 'amount': 10}, headers=auth_headers)
+    payment_id = response.json['payment']['payment_id']
+    etag = client.get(f'/api/payments/{payment_id}', headers=auth_headers).headers['ETag']
+    client.get(f'/api/payments/{payment_id}', headers={**auth_headers, 'If-None-Match': etag})
+    client.get('/no/such/route')
+    
+    assert delta[created] == 1
+    assert delta[not_modified] == 1
+    assert delta[unmatched] == 1
+    assert latency_count('GET', 'payments.get_payment') - latencies == 2
+    assert active_requests() == active
+
+
+def test_escaping_error_counts_as_500(app, client):
+    def fail():
+        raise RuntimeError('boom')
+    app.add_url_rule('/fail', 'fail', fail)
+    failed = ('GET', 'fail', 500)
+    delta = MetricsDelta(failed)
+    active = active_requests()
+    
+    # TESTING propagates the error past Flask's error handling
+    with pytest.raises(RuntimeError):
+        client.get('/fail')
+    
+    assert delta[failed] == 1
+    assert active_requests() == active
+
+
+def test_series_are_bounded():
+    folded = ('GET', 'other', 200)
+    unknown_method = ('OTHER', 'other', 200)
+    delta = MetricsDelta(folded, unknown_method)
+    
+    metrics = RequestMetrics(max_endpoints=1)
+    metrics.observe('GET', 'bounded.first', 200, 1000)
+    metrics.observe('GET', 'bounded.second', 200, 1000)
+    metrics.observe('BREW', 'bounded.first', 200, 1000)
+    
+    assert request_count('GET', 'bounded.first', 200) == 1
+    assert request_count('GET', 'bounded.second', 200) == 0
+    assert delta[folded] == 1
+    assert delta[unknown_method] == 1
@@ -0,0 +1,53 @@
+"""RowEncoder output against Payment.to_dict() formatting."""
+import json
+from datetime import datetime
+import pytest
+from app.services.serialization_service import (
+    PAYMENT_DATETIME_FIELDS,
+    PAYMENT_FIELDS,
+    PAYMENT_MINOR_UNIT_FIELDS,
+    RowEncoder,
+    orjson
+)
+
+CREATED = datetime(2026, 1, 2, 3, 4, 5, 678)
+ROW = (1999, 'B1', CREATED, 'USD', 1, 'P1', None, 'completed', 'TXN-1', None, 7)
+BACKENDS = ['json'] + (['orjson'] if orjson is not None else [])
+
+
+def payment_encoder(backend):
+    return RowEncoder(PAYMENT_FIELDS, PAYMENT_DATETIME_FIELDS, backend, PAYMENT_MINOR_UNIT_FIELDS)
+
+
+def test_row_to_dict_formats_like_to_dict():
+    assert payment_encoder('json').row_to_dict(ROW) == {
+        'amount': 19.99,
+        'booking_id': 'B1',
+        'created_at': '2026-01-02T03:04:05.000678',
+        'currency': 'USD',
+        'id': 1,
+        'payment_id': 'P1',
+        'payment_method': None,
+        'status': 'completed',
+        'transaction_ref': 'TXN-1',
+        'updated_at': None,
+        'user_id': 7
+    }
+
+
+def test_amount_uses_the_row_currency_scale():
+    row = (1999, 'B1', CREATED, 'JPY', 1, 'P1', None, 'pending', None, None, 7)
+    assert payment_encoder('json').row_to_dict(row)['amount'] == 1999
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backends_encode_the_same_json(backend):
+    encoder = payment_encoder(backend)
+    
+    assert json.loads(encoder.dumps([ROW])) == [payment_encoder('json').row_to_dict(ROW)]
+    assert encoder.lines([ROW, ROW]).count('\n') == 2
+
+
+def test_plain_fields_are_copied_by_position():
+    encoder = RowEncoder(('a', 'b'), backend='json')
+    assert encoder.dumps([(1, 'x'), (2, None)]) == '[{"a":1,"b":"x"},{"a":2,"b":null}]'